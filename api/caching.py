@@ -0,0 +1,126 @@
+"""
+控制面读接口缓存 - 进程内短TTL响应缓存与条件请求（ETag / Last-Modified，未变化时返回 304）
+
+缓存的是已编码的JSON响应体，ETag 为响应体摘要，Last-Modified 为该摘要最近一次变化的时间（本进程观测到的，
+删除行等不会推进表中更新时间的修改同样生效）。TTL 内的请求不访问数据库，过期后重新计算；写接口修改数据后调用
+invalidate() 立即失效对应缓存，多实例部署时其他实例最多延迟一个TTL。
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from config.settings import API_CACHE_MAX_ENTRIES
+
+class _Entry:
+    __slots__ = ('body', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, body, expires, previous=None):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        # 响应体未变化时沿用上一次的修改时间（UTC，精确到秒）
+        if previous is not None and previous.etag == self.etag:
+            self.last_modified = previous.last_modified
+        else:
+            self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.expires = expires
+
+class ResponseCache:
+    def __init__(self, max_entries: int = API_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # 每个命名空间的失效代数，计算期间发生失效时不写入缓存（避免写入失效前读取的旧数据）
+        self._generations = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, generation):
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def invalidate(self, *namespaces):
+        """失效命名空间下的全部缓存（写接口修改数据后调用）"""
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key in self._entries if key[0] in namespaces]:
+                del self._entries[key]
+
+    def lock(self, namespace):
+        """同一命名空间的缓存未命中串行计算，避免缓存过期瞬间并发请求同时查询"""
+        if namespace not in self._locks:
+            self._locks[namespace] = asyncio.Lock()
+        return self._locks[namespace]
+
+response_cache = ResponseCache()
+
+def _not_modified(request: Request, entry: _Entry) -> bool:
+    """If-None-Match 优先；没有 If-None-Match 时按 If-Modified-Since 判断（精确到秒）"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == entry.etag for tag in tags)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return entry.last_modified <= since
+    return False
+
+def _respond(request: Request, entry: _Entry) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache",
+               "Last-Modified": format_datetime(entry.last_modified, usegmt=True)}
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+async def cached_response(request: Request, namespace: str, compute, ttl: float) -> Response:
+    """返回带 ETag/Last-Modified 的JSON响应，请求带有匹配的 If-None-Match/If-Modified-Since 时返回 304
+
+    compute() 返回响应数据，为同步函数，在线程池中执行；不同查询参数分别缓存，ttl<=0 时不缓存，只支持条件请求。
+    """
+    key = (namespace, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key)
+    if entry is not None and entry.expires > time.monotonic():
+        return _respond(request, entry)
+
+    async with response_cache.lock(namespace):
+        # 等待锁期间其他请求可能已刷新缓存
+        entry = response_cache.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            return _respond(request, entry)
+
+        generation = response_cache.generation(namespace)
+        data = await run_in_threadpool(compute)
+        body = JSONResponse(content=jsonable_encoder(data)).body
+        entry = _Entry(body, time.monotonic() + ttl, previous=entry)
+        if ttl > 0:
+            response_cache.put(key, entry, generation)
+        return _respond(request, entry)
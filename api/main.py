@@ -1,10 +1,31 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from api.routers import config, monitor
+from api.routers import alerts, config, monitor
+from database.connection import db
+from config.settings import MONITOR_MODE, MONITOR_DRAIN_TIMEOUT, DB_READY_TIMEOUT
 
-app = FastAPI(title="审计告警配置管理控制系统", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MONITOR_MODE == 'embedded':
+        from config.logging_config import setup_logging
+        setup_logging()
+    # 进程内等待数据库就绪（指数退避），超时则启动失败
+    if not await asyncio.get_running_loop().run_in_executor(None, db.wait_until_ready, DB_READY_TIMEOUT):
+        raise RuntimeError(f"数据库在{DB_READY_TIMEOUT:g}秒内未就绪")
+    # 内嵌模式：监控作为API进程内的后台任务随应用启动和停止
+    if MONITOR_MODE == 'embedded':
+        monitor.get_monitor_service().start_process()
+    yield
+    alerts.ingest_service.stop(MONITOR_DRAIN_TIMEOUT)
+    if MONITOR_MODE == 'embedded':
+        monitor.get_monitor_service().stop_process()
+
+app = FastAPI(title="审计告警配置管理控制系统", version="1.0.0", lifespan=lifespan)
 
 app.include_router(config.router, prefix="/api")
 app.include_router(monitor.router, prefix="/api")
+app.include_router(alerts.router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -17,4 +38,4 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
     from config.settings import API_HOST, API_PORT
-    uvicorn.run(app, host=API_HOST, port=API_PORT)
\ No newline at end of file
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
@@ -0,0 +1,188 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from database.connection import db
+from api.streaming import iter_keyset_pages, export_response
+from services.ingest import IngestService, IngestQueueFull
+from config.settings import INGEST_QUEUE_SIZE
+
+router = APIRouter(prefix="/alerts", tags=["告警记录"])
+
+# 推送接入服务（首次推送时启动后台投递线程）
+ingest_service = IngestService()
+
+class IngestRecord(BaseModel):
+    table_name: str
+    record_id: int
+    verdict: str
+    created_at: Optional[datetime] = None
+    data: Dict[str, Any] = {}
+
+SENT_LOG_FIELDS = ["id", "table_name", "record_id", "verdict", "sent_at", "recipients"]
+
+# 导出时每次读取的条数
+EXPORT_PAGE_SIZE = 1000
+
+# 统计接口未指定开始时间时的默认查询范围
+STATS_DEFAULT_RANGE = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+def build_sent_log_filters(table_name: Optional[str], verdict: Optional[str], start: Optional[datetime],
+                           end: Optional[datetime], recipient: Optional[str]):
+    """构建 email_sent_log 查询条件，recipient 按收件人数组精确匹配（走GIN索引）"""
+    conditions = []
+    values = []
+    if table_name:
+        conditions.append("table_name = %s")
+        values.append(table_name)
+    if verdict:
+        conditions.append("verdict = %s")
+        values.append(verdict)
+    if start:
+        conditions.append("sent_at >= %s")
+        values.append(start)
+    if end:
+        conditions.append("sent_at < %s")
+        values.append(end)
+    if recipient:
+        conditions.append("string_to_array(recipients, ', ') @> ARRAY[%s]::text[]")
+        values.append(recipient)
+    return conditions, values
+
+def fetch_sent_log_page(conditions, values, after: Optional[int], limit: int):
+    """按 id 倒序键集分页读取一页发送记录"""
+    conditions = list(conditions)
+    values = list(values)
+    if after is not None:
+        conditions.append("id < %s")
+        values.append(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT {', '.join(SENT_LOG_FIELDS)} FROM email_sent_log {where} ORDER BY id DESC LIMIT %s"
+    values.append(limit)
+    return db.execute_query(query, values) or []
+
+@router.get("/sent")
+async def get_sent_alerts(
+    table_name: Optional[str] = Query(None, description="源表名"),
+    verdict: Optional[str] = Query(None, description="审计结果"),
+    start: Optional[datetime] = Query(None, description="发送时间起（包含）"),
+    end: Optional[datetime] = Query(None, description="发送时间止（不包含）"),
+    recipient: Optional[str] = Query(None, description="收件人邮箱"),
+    limit: int = Query(100, description="每页条数", ge=1, le=1000),
+    after: Optional[int] = Query(None, description="上一页返回的 next_after")
+):
+    """查询已发送告警记录（按 id 倒序键集分页）"""
+    conditions, values = build_sent_log_filters(table_name, verdict, start, end, recipient)
+    rows = fetch_sent_log_page(conditions, values, after, limit)
+    return {
+        "data": rows,
+        "next_after": rows[-1]["id"] if len(rows) == limit else None
+    }
+
+@router.get("/sent/export")
+async def export_sent_alerts(
+    format: str = Query("ndjson", description="导出格式", pattern="^(ndjson|csv)$"),
+    table_name: Optional[str] = Query(None, description="源表名"),
+    verdict: Optional[str] = Query(None, description="审计结果"),
+    start: Optional[datetime] = Query(None, description="发送时间起（包含）"),
+    end: Optional[datetime] = Query(None, description="发送时间止（不包含）"),
+    recipient: Optional[str] = Query(None, description="收件人邮箱")
+):
+    """流式导出已发送告警记录（NDJSON或CSV），逐页读取，不在内存中缓存完整结果"""
+    conditions, values = build_sent_log_filters(table_name, verdict, start, end, recipient)
+    rows = iter_keyset_pages(
+        lambda after, limit: fetch_sent_log_page(conditions, values, after, limit), EXPORT_PAGE_SIZE
+    )
+    return export_response(rows, format, SENT_LOG_FIELDS, "email_sent_log")
+
+@router.get("/stats")
+async def get_alert_stats(
+    granularity: str = Query("hour", description="统计粒度", pattern="^(hour|day)$"),
+    start: Optional[datetime] = Query(None, description="时间桶起（包含），默认最近24小时/30天"),
+    end: Optional[datetime] = Query(None, description="时间桶止（不包含）"),
+    table_name: Optional[str] = Query(None, description="源表名"),
+    verdict: Optional[str] = Query(None, description="审计结果")
+):
+    """按小时/天读取告警统计汇总（直接读取 alert_stats_rollup，不扫描发送记录）
+    
+    failed_count 为发送失败的尝试次数（同一条记录多轮失败计多次），success_rate 为发送尝试的成功率。
+    """
+    conditions = ["granularity = %s"]
+    values = [granularity]
+    if start is not None:
+        conditions.append("bucket_start >= %s")
+        values.append(start)
+    else:
+        # 默认范围按数据库时间计算，与汇总时间桶使用同一时钟
+        conditions.append("bucket_start >= COALESCE(%s::timestamp, CURRENT_TIMESTAMP::timestamp) - %s")
+        values.extend((end, STATS_DEFAULT_RANGE[granularity]))
+    if end:
+        conditions.append("bucket_start < %s")
+        values.append(end)
+    if table_name:
+        conditions.append("table_name = %s")
+        values.append(table_name)
+    if verdict:
+        conditions.append("verdict = %s")
+        values.append(verdict)
+    
+    query = f"""
+    SELECT bucket_start, table_name, verdict, sent_count, summarized_count, failed_count
+    FROM alert_stats_rollup
+    WHERE {' AND '.join(conditions)}
+    ORDER BY bucket_start, table_name, verdict
+    """
+    rows = db.execute_query(query, values) or []
+    
+    totals = {"sent_count": 0, "summarized_count": 0, "failed_count": 0}
+    for row in rows:
+        delivered = row["sent_count"] + row["summarized_count"]
+        attempted = delivered + row["failed_count"]
+        row["success_rate"] = round(delivered / attempted, 4) if attempted else None
+        for key in totals:
+            totals[key] += row[key]
+    delivered = totals["sent_count"] + totals["summarized_count"]
+    attempted = delivered + totals["failed_count"]
+    totals["success_rate"] = round(delivered / attempted, 4) if attempted else None
+    
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "data": rows,
+        "totals": totals
+    }
+
+def submit_ingest(records: List[IngestRecord]):
+    try:
+        items = [
+            (record.table_name, IngestService.build_record(
+                record.table_name, record.record_id, record.verdict, record.created_at, record.data))
+            for record in records
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        accepted, duplicates = ingest_service.submit(items)
+    except IngestQueueFull:
+        raise HTTPException(status_code=429, detail="推送队列已满，请稍后重试", headers={"Retry-After": "1"})
+    return {"message": "已接收", "accepted": accepted, "duplicates": duplicates}
+
+@router.post("/ingest", status_code=202)
+async def ingest_alert(record: IngestRecord):
+    """推送单条新记录，立即进入投递队列（队列满时返回429）"""
+    return submit_ingest([record])
+
+@router.post("/ingest/batch", status_code=202)
+async def ingest_alerts(records: List[IngestRecord]):
+    """批量推送新记录，整批入队或整批拒绝（队列满时返回429）"""
+    if not records:
+        raise HTTPException(status_code=400, detail="推送内容为空")
+    if len(records) > INGEST_QUEUE_SIZE:
+        raise HTTPException(status_code=400, detail=f"单次最多推送 {INGEST_QUEUE_SIZE} 条")
+    return submit_ingest(records)
+
+@router.get("/ingest/status")
+async def get_ingest_status():
+    """获取推送接入队列状态"""
+    return ingest_service.get_stats()
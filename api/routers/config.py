@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, EmailStr
+import csv
+import io
+import json
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import List, Optional
 from database.connection import db
-from datetime import datetime
+from api.streaming import iter_keyset_pages, export_response
+from api.caching import cached_response, response_cache
+from config.settings import API_CACHE_TTL
 
 router = APIRouter(prefix="/config", tags=["配置管理"])
 
@@ -26,6 +31,12 @@ class RecipientCreate(BaseModel):
     email: EmailStr
     name: Optional[str] = None
 
+class RecipientImport(BaseModel):
+    table_name: str
+    email: EmailStr
+    name: Optional[str] = None
+    is_active: bool = True
+
 class RecipientUpdate(BaseModel):
     table_name: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -36,6 +47,59 @@ class SystemConfigUpdate(BaseModel):
     config_value: str
     description: Optional[str] = None
 
+# 列表接口允许返回的字段（SMTP配置不返回密码）
+SMTP_LIST_FIELDS = ["id", "name", "server", "port", "username", "is_active", "created_at", "updated_at"]
+RECIPIENT_LIST_FIELDS = ["id", "table_name", "email", "name", "is_active", "created_at", "updated_at"]
+
+# 批量导入单次最多行数，导出时每次读取的条数
+MAX_IMPORT_ROWS = 10000
+EXPORT_PAGE_SIZE = 1000
+# 列表接口只提供 after 时的每页条数
+DEFAULT_PAGE_SIZE = 100
+
+def list_with_keyset(table: str, allowed_fields: List[str], default_fields: List[str],
+                     fields: Optional[str], filters: dict, after: Optional[int], limit: Optional[int]):
+    """按 id 倒序键集分页查询，after 为上一页最后一条记录的 id，fields 为逗号分隔的返回字段
+
+    limit 和 after 都未提供时不分页，按 created_at 倒序返回全部记录（与分页前的接口行为一致）；
+    只提供 after 时每页 DEFAULT_PAGE_SIZE 条。
+    """
+    if fields:
+        selected = [field.strip() for field in fields.split(',') if field.strip()]
+        invalid = [field for field in selected if field not in allowed_fields]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(invalid)}")
+        # 分页游标依赖 id
+        if "id" not in selected:
+            selected.insert(0, "id")
+    else:
+        selected = default_fields
+    
+    conditions = []
+    values = []
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append(f"{column} = %s")
+            values.append(value)
+    if after is not None:
+        conditions.append("id < %s")
+        values.append(after)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if limit is None and after is None:
+        query = f"SELECT {', '.join(selected)} FROM {table} {where} ORDER BY created_at DESC"
+        return {"data": db.execute_query(query, values) or [], "next_after": None}
+    
+    limit = limit or DEFAULT_PAGE_SIZE
+    query = f"SELECT {', '.join(selected)} FROM {table} {where} ORDER BY id DESC LIMIT %s"
+    values.append(limit)
+    rows = db.execute_query(query, values) or []
+    
+    return {
+        "data": rows,
+        "next_after": rows[-1]["id"] if len(rows) == limit else None
+    }
+
 # ===================================
 # SMTP配置管理接口
 # ===================================
@@ -49,16 +113,29 @@ async def create_smtp_config(config: SMTPConfigCreate):
     """
     result = db.execute_query(query, (config.name, config.server, config.port, 
                                      config.username, config.password))
+    response_cache.invalidate("smtp", "monitor_status")
     if result:
         return {"message": "SMTP配置创建成功", "id": result}
     raise HTTPException(status_code=500, detail="创建失败")
 
 @router.get("/smtp")
-async def get_smtp_configs():
-    """获取SMTP配置列表"""
-    query = "SELECT id, name, server, port, username, is_active, created_at FROM smtp_config ORDER BY created_at DESC"
-    configs = db.execute_query(query)
-    return {"data": configs or []}
+async def get_smtp_configs(
+    request: Request,
+    limit: Optional[int] = Query(None, description="每页条数，与 after 都不提供时返回全部", ge=1, le=1000),
+    after: Optional[int] = Query(None, description="上一页返回的 next_after"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔，如 id,name,server"),
+    is_active: Optional[bool] = Query(None, description="按是否启用过滤")
+):
+    """获取SMTP配置列表（提供 limit/after 时按 id 倒序键集分页，否则按创建时间倒序返回全部），支持 ETag/Last-Modified 条件请求"""
+    return await cached_response(
+        request, "smtp",
+        lambda: list_with_keyset(
+            "smtp_config", SMTP_LIST_FIELDS,
+            ["id", "name", "server", "port", "username", "is_active", "created_at"],
+            fields, {"is_active": is_active}, after, limit
+        ),
+        API_CACHE_TTL
+    )
 
 @router.put("/smtp/{config_id}")
 async def update_smtp_config(config_id: int, config: SMTPConfigUpdate):
@@ -74,9 +151,8 @@ async def update_smtp_config(config_id: int, config: SMTPConfigUpdate):
     if not update_fields:
         raise HTTPException(status_code=400, detail="没有提供更新字段")
     
-    # 添加更新时间
-    update_fields.append("updated_at = %s")
-    update_values.append(datetime.now())
+    # 添加更新时间（与插入时的默认值一致使用数据库时间）
+    update_fields.append("updated_at = CURRENT_TIMESTAMP")
     update_values.append(config_id)
     
     # 执行更新
@@ -85,6 +161,7 @@ async def update_smtp_config(config_id: int, config: SMTPConfigUpdate):
         WHERE id = %s
     """
     result = db.execute_query(update_query, update_values)
+    response_cache.invalidate("smtp", "monitor_status")
     
     if result is None or result == 0:
         raise HTTPException(status_code=404, detail="SMTP配置不存在")
@@ -106,6 +183,7 @@ async def delete_smtp_config(config_id: int):
     """删除SMTP配置"""
     query = "DELETE FROM smtp_config WHERE id = %s"
     result = db.execute_query(query, (config_id,))
+    response_cache.invalidate("smtp", "monitor_status")
     if result and result > 0:
         return {"message": "SMTP配置删除成功"}
     raise HTTPException(status_code=404, detail="配置不存在")
@@ -116,26 +194,155 @@ async def delete_smtp_config(config_id: int):
 
 @router.post("/recipients")
 async def create_recipient(recipient: RecipientCreate):
-    """添加收件人"""
+    """添加收件人（同一表内邮箱不区分大小写唯一）"""
     query = """
     INSERT INTO recipients_config (table_name, email, name)
-    VALUES (%s, %s, %s) RETURNING id
+    VALUES (%s, %s, %s)
+    ON CONFLICT (table_name, lower(email)) DO NOTHING
+    RETURNING id
     """
-    result = db.execute_query(query, (recipient.table_name, recipient.email, recipient.name))
-    if result:
-        return {"message": "收件人添加成功", "id": result}
-    raise HTTPException(status_code=500, detail="添加失败")
+    result = db.execute_returning(query, (recipient.table_name, recipient.email, recipient.name))
+    response_cache.invalidate("recipients", "monitor_status")
+    if result is None:
+        raise HTTPException(status_code=500, detail="添加失败")
+    if not result:
+        raise HTTPException(status_code=409, detail=f"收件人已存在: {recipient.table_name} {recipient.email}")
+    return {"message": "收件人添加成功", "id": result[0]["id"]}
 
 @router.get("/recipients")
-async def get_recipients(table_name: Optional[str] = None):
-    """获取收件人列表"""
-    if table_name:
-        query = "SELECT * FROM recipients_config WHERE table_name = %s ORDER BY created_at DESC"
-        recipients = db.execute_query(query, (table_name,))
+async def get_recipients(
+    request: Request,
+    table_name: Optional[str] = None,
+    is_active: Optional[bool] = Query(None, description="按是否启用过滤"),
+    limit: Optional[int] = Query(None, description="每页条数，与 after 都不提供时返回全部", ge=1, le=1000),
+    after: Optional[int] = Query(None, description="上一页返回的 next_after"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔，如 id,email")
+):
+    """获取收件人列表（提供 limit/after 时按 id 倒序键集分页，否则按创建时间倒序返回全部），支持 ETag/Last-Modified 条件请求"""
+    return await cached_response(
+        request, "recipients",
+        lambda: list_with_keyset(
+            "recipients_config", RECIPIENT_LIST_FIELDS, RECIPIENT_LIST_FIELDS,
+            fields, {"table_name": table_name, "is_active": is_active}, after, limit
+        ),
+        API_CACHE_TTL
+    )
+
+def parse_import_rows(body: bytes, content_type: str):
+    """解析导入内容：JSON数组或带表头的CSV（table_name,email,name,is_active）"""
+    try:
+        text = body.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="导入内容必须为UTF-8编码")
+    
+    if 'csv' in content_type:
+        rows = list(csv.DictReader(io.StringIO(text)))
     else:
-        query = "SELECT * FROM recipients_config ORDER BY created_at DESC"
-        recipients = db.execute_query(query)
-    return {"data": recipients or []}
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"JSON格式错误: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="JSON导入内容必须为数组")
+    
+    if not rows:
+        raise HTTPException(status_code=400, detail="导入内容为空")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=400, detail=f"单次最多导入 {MAX_IMPORT_ROWS} 条")
+    return rows
+
+def validate_import_rows(rows, default_table_name: Optional[str]):
+    """逐行校验导入数据，返回 (有效行, 错误列表)，行号从1开始，同一表内重复的邮箱只保留第一条"""
+    valid = []
+    errors = []
+    seen = set()
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": index, "error": "每行必须为对象"})
+            continue
+        # CSV 空单元格按未提供处理，使用默认值
+        data = {key: value for key, value in row.items() if key and value not in (None, '')}
+        if default_table_name and 'table_name' not in data:
+            data['table_name'] = default_table_name
+        try:
+            recipient = RecipientImport(**data)
+        except ValidationError as e:
+            detail = '; '.join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+            errors.append({"row": index, "error": detail})
+            continue
+        key = (recipient.table_name, recipient.email.lower())
+        if key in seen:
+            errors.append({"row": index, "error": f"与前面的行重复: {recipient.table_name} {recipient.email}"})
+            continue
+        seen.add(key)
+        valid.append(recipient)
+    return valid, errors
+
+def upsert_recipients(recipients: List[RecipientImport]):
+    """单条语句（单个事务）批量写入收件人：已存在的 (table_name, lower(email)) 更新，其余插入
+
+    依赖唯一索引 uq_recipients_table_email，并发导入同一收件人时由 ON CONFLICT 合并，不会产生重复行；
+    xmax = 0 的返回行为本次新插入的记录。
+    """
+    values = ', '.join(['(%s::varchar, %s::varchar, %s::varchar, %s::boolean)'] * len(recipients))
+    query = f"""
+    WITH upserted AS (
+        INSERT INTO recipients_config AS rc (table_name, email, name, is_active)
+        VALUES {values}
+        ON CONFLICT (table_name, lower(email)) DO UPDATE
+        SET name = COALESCE(EXCLUDED.name, rc.name), is_active = EXCLUDED.is_active, updated_at = CURRENT_TIMESTAMP
+        RETURNING (rc.xmax = 0) AS inserted
+    )
+    SELECT COUNT(*) FILTER (WHERE inserted) AS inserted, COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM upserted
+    """
+    params = []
+    for recipient in recipients:
+        params.extend((recipient.table_name, recipient.email, recipient.name, recipient.is_active))
+    result = db.execute_returning(query, params)
+    return result[0] if result else None
+
+@router.post("/recipients/import")
+async def import_recipients(
+    request: Request,
+    table_name: Optional[str] = Query(None, description="行内未指定 table_name 时使用的默认表名"),
+    strict: bool = Query(True, description="为 true 时任一行校验失败则整体不导入")
+):
+    """批量导入收件人（JSON数组或CSV，Content-Type: text/csv），在一个事务内写入并返回逐行错误"""
+    rows = parse_import_rows(await request.body(), request.headers.get('content-type', ''))
+    valid, errors = validate_import_rows(rows, table_name)
+    
+    if errors and (strict or not valid):
+        raise HTTPException(status_code=400, detail={"message": "导入数据校验失败，未写入任何记录", "errors": errors})
+    
+    result = upsert_recipients(valid)
+    response_cache.invalidate("recipients", "monitor_status")
+    if result is None:
+        raise HTTPException(status_code=500, detail="导入失败，未写入任何记录")
+    return {
+        "message": "收件人导入完成",
+        "total": len(rows),
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "failed": len(errors),
+        "errors": errors
+    }
+
+@router.get("/recipients/export")
+async def export_recipients(
+    format: str = Query("csv", description="导出格式", pattern="^(ndjson|csv)$"),
+    table_name: Optional[str] = None,
+    is_active: Optional[bool] = Query(None, description="按是否启用过滤")
+):
+    """流式导出收件人（CSV或NDJSON），导出的CSV可直接用于批量导入"""
+    filters = {"table_name": table_name, "is_active": is_active}
+    rows = iter_keyset_pages(
+        lambda after, limit: list_with_keyset(
+            "recipients_config", RECIPIENT_LIST_FIELDS, RECIPIENT_LIST_FIELDS, None, filters, after, limit
+        )["data"],
+        EXPORT_PAGE_SIZE
+    )
+    return export_response(rows, format, RECIPIENT_LIST_FIELDS, "recipients")
 
 @router.put("/recipients/{recipient_id}")
 async def update_recipient(recipient_id: int, recipient: RecipientUpdate):
@@ -151,9 +358,8 @@ async def update_recipient(recipient_id: int, recipient: RecipientUpdate):
     if not update_fields:
         raise HTTPException(status_code=400, detail="没有提供更新字段")
     
-    # 添加更新时间
-    update_fields.append("updated_at = %s")
-    update_values.append(datetime.now())
+    # 添加更新时间（与插入时的默认值一致使用数据库时间）
+    update_fields.append("updated_at = CURRENT_TIMESTAMP")
     update_values.append(recipient_id)
     
     # 执行更新
@@ -162,6 +368,7 @@ async def update_recipient(recipient_id: int, recipient: RecipientUpdate):
         WHERE id = %s
     """
     result = db.execute_query(update_query, update_values)
+    response_cache.invalidate("recipients", "monitor_status")
     
     if result is None or result == 0:
         raise HTTPException(status_code=404, detail="收件人不存在")
@@ -183,6 +390,7 @@ async def delete_recipient(recipient_id: int):
     """删除收件人"""
     query = "DELETE FROM recipients_config WHERE id = %s"
     result = db.execute_query(query, (recipient_id,))
+    response_cache.invalidate("recipients", "monitor_status")
     if result and result > 0:
         return {"message": "收件人删除成功"}
     raise HTTPException(status_code=404, detail="收件人不存在")
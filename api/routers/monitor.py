@@ -1,22 +1,38 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import Optional
-from services.unified_monitor_service import UnifiedMonitorService
+from typing import Optional, List
+from datetime import datetime
+from functools import lru_cache
+from fastapi.concurrency import run_in_threadpool
+from config.settings import MIN_CHECK_INTERVAL_SECONDS, MAX_CHECK_INTERVAL_SECONDS, PROFILE_MAX_CYCLES, STATUS_CACHE_TTL
+from api.caching import cached_response, response_cache
 
 router = APIRouter(prefix="/monitor", tags=["监控控制"])
 
-# 创建统一监控服务实例
-monitor_service = UnifiedMonitorService()
+@lru_cache(maxsize=None)
+def get_monitor_service():
+    """统一监控服务实例，首次请求时才创建（进程管理、内嵌监控等模块随之导入），缩短API启动时间"""
+    from services.unified_monitor_service import UnifiedMonitorService
+    return UnifiedMonitorService()
 
 class MonitorResponse(BaseModel):
     success: bool
     message: str
     data: Optional[dict] = None
 
+class PriorityRule(BaseModel):
+    priority: str
+    table_name: Optional[str] = None
+    verdict: Optional[str] = None
+    field: Optional[str] = None
+    contains: Optional[str] = None
+
 @router.post("/start")
 async def start_monitor():
     """启动监控（配置+进程）"""
-    result = monitor_service.start_monitor()
+    result = await run_in_threadpool(get_monitor_service().start_monitor)
+    response_cache.invalidate("monitor_status")
     
     if result["success"]:
         return MonitorResponse(
@@ -26,14 +42,15 @@ async def start_monitor():
         )
     else:
         raise HTTPException(
-            status_code=400 if result.get("status") == "already_running" else 500,
+            status_code={"already_running": 400, "stopping": 409}.get(result.get("status"), 500),
             detail=result["message"]
         )
 
 @router.post("/stop")
 async def stop_monitor():
-    """停止监控（配置+进程）"""
-    result = monitor_service.stop_monitor()
+    """停止监控（配置+进程），等待当前检查完成期间不阻塞事件循环"""
+    result = await run_in_threadpool(get_monitor_service().stop_monitor)
+    response_cache.invalidate("monitor_status")
     
     if result["success"]:
         return MonitorResponse(
@@ -43,14 +60,15 @@ async def stop_monitor():
         )
     else:
         raise HTTPException(
-            status_code=400 if result.get("status") == "not_running" else 500,
+            status_code={"not_running": 400, "stopping": 409}.get(result.get("status"), 500),
             detail=result["message"]
         )
 
 @router.post("/restart")
 async def restart_monitor():
-    """重启监控（配置+进程）"""
-    result = monitor_service.restart_process()
+    """重启监控（配置+进程），等待当前检查完成期间不阻塞事件循环"""
+    result = await run_in_threadpool(get_monitor_service().restart_process)
+    response_cache.invalidate("monitor_status")
     
     if result["success"]:
         return MonitorResponse(
@@ -65,34 +83,136 @@ async def restart_monitor():
         )
 
 @router.get("/status")
-async def get_monitor_status():
-    """获取完整监控状态"""
-    status = monitor_service.get_monitor_status()
+async def get_monitor_status(request: Request):
+    """获取完整监控状态（短时缓存，支持 ETag 条件请求；启停、修改配置后立即失效）"""
+    return await cached_response(
+        request, "monitor_status",
+        lambda: MonitorResponse(
+            success=True,
+            message="获取状态成功",
+            data=get_monitor_service().get_monitor_status()
+        ),
+        STATUS_CACHE_TTL
+    )
+
+@router.get("/status/history")
+async def get_monitor_status_history(
+    points: int = Query(120, description="最多返回的点数，采样点多于该值时按时间均分合并", ge=1, le=5000),
+    since: Optional[datetime] = Query(None, description="只返回该时间之后的采样，如 2024-01-01T10:00:00（不带时区为本地时间）")
+):
+    """获取监控进程资源使用历史（CPU、RSS、线程数、文件描述符、各表检查轮次与耗时）"""
     return MonitorResponse(
         success=True,
-        message="获取状态成功",
-        data=status
+        message="获取资源使用历史成功",
+        data=get_monitor_service().get_status_history(points, since)
     )
 
 @router.put("/interval/{minutes}")
-async def update_check_interval(minutes: int):
-    """更新检查间隔"""
-    if minutes < 1 or minutes > 60:
-        raise HTTPException(status_code=400, detail="检查间隔必须在1-60分钟之间")
+async def update_check_interval(minutes: float):
+    """更新检查间隔（分钟，支持小数，如0.5表示30秒），监控进程热加载生效"""
+    if not get_monitor_service().is_valid_check_interval(minutes):
+        raise HTTPException(
+            status_code=400,
+            detail=f"检查间隔必须在{MIN_CHECK_INTERVAL_SECONDS}-{MAX_CHECK_INTERVAL_SECONDS}秒之间"
+        )
     
-    if monitor_service.set_check_interval(minutes):
+    if get_monitor_service().set_check_interval(minutes):
+        response_cache.invalidate("monitor_status")
         return MonitorResponse(
             success=True,
-            message=f"检查间隔已更新为{minutes}分钟",
-            data={"check_interval": minutes}
+            message=f"检查间隔已更新为{minutes:g}分钟",
+            data={"check_interval": minutes, "check_interval_seconds": minutes * 60}
         )
     else:
         raise HTTPException(status_code=500, detail="更新检查间隔失败")
 
+@router.get("/priority-rules")
+async def get_priority_rules():
+    """获取告警优先级规则"""
+    get_monitor_service().load_config()
+    return MonitorResponse(
+        success=True,
+        message="获取优先级规则成功",
+        data={"rules": get_monitor_service().get_priority_rules()}
+    )
+
+@router.put("/priority-rules")
+async def update_priority_rules(rules: List[PriorityRule]):
+    """更新告警优先级规则，按顺序匹配，第一条命中的规则生效"""
+    rules_data = [rule.model_dump(exclude_none=True) for rule in rules]
+    try:
+        updated = get_monitor_service().set_priority_rules(rules_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if updated:
+        return MonitorResponse(
+            success=True,
+            message="优先级规则已更新",
+            data={"rules": rules_data}
+        )
+    else:
+        raise HTTPException(status_code=500, detail="更新优先级规则失败")
+
+@router.post("/profile")
+async def request_profile(cycles: int = Query(3, description="分析的检查轮数", ge=1, le=PROFILE_MAX_CYCLES)):
+    """对接下来N轮检查做性能分析（cProfile、tracemalloc、分阶段耗时），监控进程在下一次配置热加载时开始"""
+    request_id = get_monitor_service().request_profile(cycles)
+    if request_id is None:
+        raise HTTPException(status_code=500, detail="提交性能分析请求失败")
+    return MonitorResponse(
+        success=True,
+        message=f"已请求分析接下来{cycles}轮检查",
+        data={"request_id": request_id, "cycles": cycles}
+    )
+
+@router.get("/profiles")
+async def list_profiles():
+    """列出性能分析结果文件（<请求ID>-<进程号>.json 为报告，.prof 为可用 pstats/snakeviz 打开的 cProfile 数据）"""
+    return MonitorResponse(
+        success=True,
+        message="获取性能分析结果成功",
+        data={"files": get_monitor_service().list_profiles()}
+    )
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """下载性能分析结果文件"""
+    path = get_monitor_service().get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="性能分析结果不存在")
+    media_type = "application/json" if name.endswith('.json') else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@router.get("/spool/dead-letters")
+async def list_dead_letters(limit: int = Query(100, description="返回的死信条数", ge=1, le=1000)):
+    """查看本地暂存中多次补发被拒的死信（按序号排列，不含邮件正文）"""
+    result = get_monitor_service().list_dead_letters(limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="未启用本地暂存")
+    return MonitorResponse(success=True, message="获取死信成功", data=result)
+
+@router.post("/spool/dead-letters/{action}")
+async def handle_dead_letters(
+    action: str,
+    up_to: Optional[int] = Query(None, description="处理序号不大于该值的死信，不传时处理全部")
+):
+    """重新入队（requeue，按原邮件重新补发）或丢弃（drop，这些记录不再告警）死信，监控进程在下一次配置热加载时处理"""
+    if action not in ("requeue", "drop"):
+        raise HTTPException(status_code=400, detail="action 只能为 requeue 或 drop")
+    request_id = get_monitor_service().request_spool_action(action, up_to)
+    if request_id is None:
+        raise HTTPException(status_code=500, detail="提交死信处理请求失败")
+    return MonitorResponse(
+        success=True,
+        message="已提交死信处理请求",
+        data={"request_id": request_id, "action": action, "up_to": up_to}
+    )
+
 @router.get("/logs")
 async def get_monitor_logs(lines: int = Query(50, description="获取的日志行数", ge=1, le=1000)):
     """获取监控服务日志"""
-    result = monitor_service.get_logs(lines)
+    result = get_monitor_service().get_logs(lines)
     
     if result["success"]:
         return MonitorResponse(
@@ -106,10 +226,33 @@ async def get_monitor_logs(lines: int = Query(50, description="获取的日志
             detail=result["message"]
         )
 
+@router.get("/logs/search")
+async def search_monitor_logs(
+    start: Optional[datetime] = Query(None, description="开始时间，如 2024-01-01T10:00:00"),
+    end: Optional[datetime] = Query(None, description="结束时间"),
+    level: Optional[str] = Query(None, description="日志级别，如 ERROR"),
+    q: Optional[str] = Query(None, description="包含的关键字"),
+    limit: int = Query(500, description="最多返回的日志条数", ge=1, le=5000)
+):
+    """按时间范围、级别、关键字检索监控日志（含已轮转的压缩归档）"""
+    result = get_monitor_service().search_logs(start, end, level, q, limit)
+    
+    if result["success"]:
+        return MonitorResponse(
+            success=True,
+            message=result["message"],
+            data=result
+        )
+    else:
+        raise HTTPException(
+            status_code=500,
+            detail=result["message"]
+        )
+
 @router.get("/health")
 async def monitor_health_check():
     """监控服务健康检查"""
-    status = monitor_service.get_monitor_status()
+    status = get_monitor_service().get_monitor_status()
     
     # 判断服务是否健康
     is_healthy = (status["config"]["monitor_enabled"] and 
@@ -126,7 +269,7 @@ async def monitor_health_check():
 #@router.post("/enable")
 #async def enable_monitor():
 #    """启用监控功能（仅配置，不启动进程）"""
-#    if monitor_service.set_monitor_enabled(True):
+#    if get_monitor_service().set_monitor_enabled(True):
 #        return {"message": "监控功能已启用"}
 #    else:
 #        raise HTTPException(status_code=500, detail="启用监控功能失败")
@@ -134,7 +277,7 @@ async def monitor_health_check():
 #@router.post("/disable") 
 #async def disable_monitor():
 #    """禁用监控功能（仅配置，不停止进程）"""
-#    if monitor_service.set_monitor_enabled(False):
+#    if get_monitor_service().set_monitor_enabled(False):
 #        return {"message": "监控功能已禁用"}
 #    else:
 #        raise HTTPException(status_code=500, detail="禁用监控功能失败")
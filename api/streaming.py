@@ -0,0 +1,50 @@
+"""
+流式导出工具 - 按键集分页逐页读取并边读边输出，导出大量数据时内存中只保留一页
+"""
+
+import csv
+import io
+import json
+from fastapi.responses import StreamingResponse
+
+def iter_keyset_pages(fetch_page, page_size):
+    """逐页读取全部记录，fetch_page(after, limit) 返回按 id 倒序的一页记录"""
+    after = None
+    while True:
+        rows = fetch_page(after, page_size)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["id"]
+
+def iter_ndjson(rows):
+    """每条记录输出为一行JSON"""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+def iter_csv(rows, fieldnames):
+    """输出带表头的CSV，每条记录单独输出"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+def export_response(rows, format, fieldnames, filename):
+    """按格式（ndjson 或 csv）构建流式下载响应，filename 不含扩展名"""
+    if format == "csv":
+        return StreamingResponse(
+            iter_csv(rows, fieldnames),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
+        )
+    return StreamingResponse(
+        iter_ndjson(rows),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}.ndjson"}
+    )
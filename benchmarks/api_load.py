@@ -0,0 +1,284 @@
+"""
+API控制面压测 - 在后台线程中以 uvicorn 启动 api.main:app（监听本机随机端口），使用内存假数据库和桩进程层，
+由客户端经TCP以并发混合流量压测，按接口输出 RPS、p50/p99 延迟，以及服务端事件循环被阻塞的时间
+（单个回调执行超过 --block-threshold-ms 的耗时之和）
+
+用法（在项目根目录执行，需先 pip install -r requirements-dev.txt 安装 httpx）:
+    python -m benchmarks.api_load --concurrency 20 --duration 10
+    python -m benchmarks.api_load --db-latency-ms 2 --process-scan-ms 30 --max-p99-ms 200 --output load.json
+    python -m benchmarks.api_load --real-db    # 使用 .env 中配置的本地数据库
+
+先对每个接口单独压测（事件循环阻塞可以明确归因到该接口），再按权重混合压测。
+指定 --max-p99-ms / --max-blocked-pct 时任一接口超出阈值则以退出码1结束，可用于部署前检查。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+# 压测的接口：名称 -> (方法, 路径, 混合流量中的权重)
+ENDPOINTS = {
+    "health": ("GET", "/health", 4),
+    "monitor_status": ("GET", "/api/monitor/status", 3),
+    "monitor_health": ("GET", "/api/monitor/health", 2),
+    "priority_rules": ("GET", "/api/monitor/priority-rules", 1),
+    "smtp_list": ("GET", "/api/config/smtp", 1),
+    "recipients_list": ("GET", "/api/config/recipients?limit=100", 2),
+    "sent_list": ("GET", "/api/alerts/sent?limit=50", 1)
+}
+
+class LoopBlockingMonitor:
+    """统计服务端事件循环（thread_id 所在线程）中每个回调的执行时间，超过 threshold 秒的回调计为阻塞
+
+    高负载下事件循环始终繁忙，定时探测的延迟无法区分排队与阻塞；因此直接计时 asyncio 的每个回调（Handle._run），
+    接口中的同步数据库查询、进程遍历等会体现为单个长回调。
+    """
+
+    def __init__(self, threshold, thread_id):
+        self.threshold = threshold
+        self.thread_id = thread_id
+        self.blocked = 0.0
+        self.max_stall = 0.0
+        self.slow_callbacks = 0
+        self._original = None
+
+    def __enter__(self):
+        original = self._original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            if threading.get_ident() != monitor.thread_id:
+                return original(handle)
+            start = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed = time.perf_counter() - start
+                if elapsed > monitor.threshold:
+                    monitor.blocked += elapsed
+                    monitor.slow_callbacks += 1
+                    monitor.max_stall = max(monitor.max_stall, elapsed)
+
+        asyncio.events.Handle._run = _run
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.events.Handle._run = self._original
+
+class FakeDatabase:
+    """内存假数据库：按查询中的表名返回固定数据，每次查询同步休眠 latency 秒模拟数据库往返"""
+
+    def __init__(self, latency=0.0, recipients=200):
+        now = datetime.now()
+        self.latency = latency
+        self.tables = {
+            "smtp_config": [{"id": 1, "name": "default", "server": "smtp.example.com", "port": 465,
+                             "username": "alert@example.com", "password": "secret", "is_active": True,
+                             "created_at": now, "updated_at": now}],
+            "recipients_config": [{"id": i, "table_name": ("audit_results", "image_audit_results")[i % 2],
+                                   "email": f"user{i}@example.com", "name": f"user{i}", "is_active": True,
+                                   "created_at": now, "updated_at": now} for i in range(recipients, 0, -1)],
+            "system_config": [{"config_key": key, "config_value": value} for key, value in
+                              (("monitor_enabled", "true"), ("email_enabled", "true"), ("check_interval", "5"))],
+            "email_sent_log": [{"id": i, "table_name": "audit_results", "record_id": i, "verdict": "不合规",
+                                "sent_at": now, "recipients": "user1@example.com"} for i in range(500, 0, -1)]
+        }
+
+    def _select(self, query, params):
+        if self.latency:
+            time.sleep(self.latency)
+        table = re.search(r"FROM\s+(\w+)", query, re.IGNORECASE)
+        rows = self.tables.get(table.group(1), []) if table else []
+        if "COUNT(*)" in query.upper():
+            # 表版本查询（接口缓存过期后判断数据是否变化）
+            modified = [row.get('updated_at') or row.get('created_at') for row in rows]
+            return [{"count": len(rows), "max_id": max((row.get('id', 0) for row in rows), default=None),
+                     "modified": max((value for value in modified if value), default=None)}]
+        if re.search(r"LIMIT\s+%s", query, re.IGNORECASE) and params:
+            rows = rows[:int(list(params)[-1])]
+        elif re.search(r"LIMIT\s+(\d+)", query, re.IGNORECASE):
+            rows = rows[:int(re.search(r"LIMIT\s+(\d+)", query, re.IGNORECASE).group(1))]
+        columns = re.search(r"SELECT\s+(.*?)\s+FROM", query, re.IGNORECASE | re.DOTALL)
+        if columns and columns.group(1).strip() != '*':
+            names = [name.strip().split()[-1].split('.')[-1] for name in columns.group(1).split(',')]
+            if all(name in rows[0] for name in names) if rows else False:
+                rows = [{name: row[name] for name in names} for row in rows]
+        return [dict(row) for row in rows]
+
+    def execute_query(self, query, params=None):
+        if query.strip().upper().startswith('SELECT'):
+            return self._select(query, params)
+        if self.latency:
+            time.sleep(self.latency)
+        return 1
+
+    def execute_returning(self, query, params=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return []
+
+    def execute_prepared(self, query, params=None, row_factory=None):
+        return self.execute_query(query, params)
+
+    def execute_pipeline(self, statements):
+        return [self.execute_query(query, params) for query, params in statements]
+
+    def wait_until_ready(self, timeout, max_delay=2.0):
+        return True
+
+def install_fakes(db_latency, process_scan, real_db):
+    """替换数据库与进程层（在导入 api.main 之前调用）"""
+    from database import connection
+    if not real_db:
+        fake = FakeDatabase(db_latency)
+        for name in ("execute_query", "execute_returning", "execute_prepared", "execute_pipeline", "wait_until_ready"):
+            setattr(connection.db, name, getattr(fake, name))
+
+    from services.unified_monitor_service import UnifiedMonitorService
+
+    def get_all_monitor_pids(self):
+        # 模拟遍历系统进程的耗时，返回当前进程作为"监控进程"
+        if process_scan:
+            time.sleep(process_scan)
+        return [os.getpid()]
+
+    UnifiedMonitorService._get_all_monitor_pids = get_all_monitor_pids
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))]
+
+async def run_phase(client, names, concurrency, duration, block_threshold, server_thread_id):
+    """以 concurrency 个并发客户端按权重请求 names 中的接口，持续 duration 秒"""
+    weights = [ENDPOINTS[name][2] for name in names]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            method, path, _ = ENDPOINTS[name]
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies[name].append(time.perf_counter() - start)
+            if not ok:
+                errors[name] += 1
+
+    with LoopBlockingMonitor(block_threshold, server_thread_id) as monitor:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for name in names:
+        values = latencies[name]
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+            "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+            "max_ms": round(max(values) * 1000, 2) if values else None
+        }
+    return {
+        "duration_seconds": round(elapsed, 2),
+        "rps": round(sum(len(values) for values in latencies.values()) / elapsed, 1),
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "loop_blocked_pct": round(monitor.blocked / elapsed * 100, 1),
+        "loop_max_stall_ms": round(monitor.max_stall * 1000, 2),
+        "slow_callbacks": monitor.slow_callbacks,
+        "endpoints": endpoints
+    }
+
+def start_server():
+    """在后台线程中启动 uvicorn（不执行 lifespan，避免等待数据库），返回 (server, 线程, 端口)"""
+    import uvicorn
+    from api.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off",
+                                           log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, name="load-test-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("API服务启动失败")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, port
+
+async def run_load_test(concurrency, duration, names, block_threshold):
+    import httpx
+
+    server, thread, port = start_server()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            # 预热：触发各接口的首次初始化（统一监控服务实例等）
+            for name in names:
+                method, path, _ = ENDPOINTS[name]
+                await client.request(method, path)
+
+            report = {"concurrency": concurrency, "block_threshold_ms": block_threshold * 1000, "isolated": {}}
+            for name in names:
+                report["isolated"][name] = await run_phase(client, [name], concurrency, duration,
+                                                           block_threshold, thread.ident)
+            report["mixed"] = await run_phase(client, names, concurrency, duration, block_threshold, thread.ident)
+    finally:
+        server.should_exit = True
+        thread.join(5)
+    return report
+
+def check_thresholds(report, max_p99_ms, max_blocked_pct):
+    """返回超出阈值的接口说明列表"""
+    failures = []
+    for name, phase in report["isolated"].items():
+        endpoint = phase["endpoints"][name]
+        if max_p99_ms is not None and endpoint["p99_ms"] is not None and endpoint["p99_ms"] > max_p99_ms:
+            failures.append(f"{name}: p99 {endpoint['p99_ms']}ms > {max_p99_ms}ms")
+        if max_blocked_pct is not None and phase["loop_blocked_pct"] > max_blocked_pct:
+            failures.append(f"{name}: 事件循环阻塞 {phase['loop_blocked_pct']}% > {max_blocked_pct}%")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="API控制面压测")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发客户端数（默认20）")
+    parser.add_argument("--duration", type=float, default=5, help="每个阶段的持续时间（秒，默认5）")
+    parser.add_argument("--endpoint", action="append", choices=list(ENDPOINTS), help="只压测指定接口，可重复指定")
+    parser.add_argument("--db-latency-ms", type=float, default=1, help="假数据库每次查询的延迟（毫秒，默认1）")
+    parser.add_argument("--process-scan-ms", type=float, default=20, help="桩进程层遍历进程的耗时（毫秒，默认20）")
+    parser.add_argument("--block-threshold-ms", type=float, default=2, help="单个回调超过该时长计为阻塞事件循环（毫秒，默认2）")
+    parser.add_argument("--real-db", action="store_true", help="使用 .env 中配置的数据库，不替换数据库层")
+    parser.add_argument("--max-p99-ms", type=float, help="单接口 p99 延迟阈值（毫秒）")
+    parser.add_argument("--max-blocked-pct", type=float, help="单接口压测时事件循环阻塞时间占比阈值（%%）")
+    parser.add_argument("--output", help="报告输出文件（JSON）")
+    args = parser.parse_args()
+
+    install_fakes(args.db_latency_ms / 1000, args.process_scan_ms / 1000, args.real_db)
+    report = asyncio.run(run_load_test(args.concurrency, args.duration, args.endpoint or list(ENDPOINTS),
+                                       args.block_threshold_ms / 1000))
+    failures = check_thresholds(report, args.max_p99_ms, args.max_blocked_pct)
+    report["failures"] = failures
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
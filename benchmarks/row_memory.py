@@ -0,0 +1,113 @@
+"""
+扫描记录内存基准 - 比较待发送记录以字典（dict_row）和流水线行类型（typed_row）保存时的单行内存占用与构造耗时
+
+用法（在项目根目录执行）:
+    python -m benchmarks.row_memory --rows 100000
+    python -m benchmarks.row_memory --table image_audit_results --output rows.json
+
+不连接数据库：按 psycopg 行工厂的构造方式（dict_row 为 dict(zip(列名, 值))，typed_row 为 行类型._make(值)）
+在内存中构造 --rows 条记录，用 tracemalloc 统计常驻内存。字段值对两种表示相同，
+container_bytes_per_row 为扣除字段值后每行容器本身的占用。
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from services.monitor_service import TABLE_PIPELINES
+
+# 各表字段值的样例（每行重新构造，与数据库驱动返回的对象一样互不共享）
+SAMPLE_VALUES = {
+    "id": lambda i: 10_000_000 + i,
+    "verdict": lambda i: "不合规",
+    "audit_result": lambda i: "不合规",
+    "created_at": lambda i: datetime(2024, 1, 1) + timedelta(seconds=i),
+    "url": lambda i: f"https://example.com/articles/{i}/index.html",
+    "reason": lambda i: f"检测到违规内容（规则 {i % 97}）",
+    "ip_address": lambda i: f"10.{i % 256}.{i // 256 % 256}.{i % 199}",
+    "mac_address": lambda i: f"00:1a:2b:{i % 256:02x}:{i // 256 % 256:02x}:{i % 199:02x}",
+    "reasons": lambda i: f"屏幕内容包含敏感信息（规则 {i % 89}）"
+}
+
+def iter_values(fields, rows):
+    """逐行生成字段值元组（相当于驱动解码后交给行工厂的值）"""
+    makers = [SAMPLE_VALUES[field] for field in fields]
+    for i in range(rows):
+        yield tuple(make(i) for make in makers)
+
+def measure(build, fields, rows):
+    """构造 rows 条记录并保留在列表中，返回 (常驻内存字节数, 构造耗时秒, 首条记录)
+
+    构造耗时只计行工厂本身（字段值预先生成，不开启 tracemalloc）。
+    """
+    values = list(iter_values(fields, rows))
+    start = time.perf_counter()
+    records = [build(row) for row in values]
+    duration = time.perf_counter() - start
+    del records, values
+
+    gc.collect()
+    tracemalloc.start()
+    records = [build(row) for row in iter_values(fields, rows)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, duration, records[0]
+
+def run_benchmark(table_name, rows):
+    pipeline = TABLE_PIPELINES[table_name]
+    fields = pipeline['fields']
+    row_type = pipeline['row']
+    names = list(fields)
+
+    representations = {
+        "values": lambda values: values,
+        "dict_row": lambda values: dict(zip(names, values)),
+        "typed_row": row_type._make
+    }
+    results = {}
+    for name, build in representations.items():
+        total, duration, first = measure(build, fields, rows)
+        results[name] = {
+            "bytes_per_row": round(total / rows, 1),
+            "total_mb": round(total / 1024 / 1024, 1),
+            "build_seconds": round(duration, 3),
+            "container_bytes": sys.getsizeof(first)
+        }
+
+    # 字段值本身的占用（"values" 中的元组与行类型大小相同，按单个元组扣除）
+    value_bytes = results["values"]["bytes_per_row"] - results["values"]["container_bytes"]
+    for name in ("dict_row", "typed_row"):
+        results[name]["container_bytes_per_row"] = round(results[name]["bytes_per_row"] - value_bytes, 1)
+    del results["values"]
+
+    saved = results["dict_row"]["bytes_per_row"] - results["typed_row"]["bytes_per_row"]
+    return {
+        "table": table_name,
+        "rows": rows,
+        "fields": names,
+        "python": sys.version.split()[0],
+        "results": results,
+        "saved_bytes_per_row": round(saved, 1),
+        "saved_mb": round(saved * rows / 1024 / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描记录内存基准")
+    parser.add_argument("--rows", type=int, default=100000, help="构造的记录数（默认100000）")
+    parser.add_argument("--table", choices=list(TABLE_PIPELINES), default="audit_results", help="被监控表（默认audit_results）")
+    parser.add_argument("--output", help="报告输出文件（JSON）")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.table, args.rows)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+if __name__ == "__main__":
+    main()
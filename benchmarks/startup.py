@@ -0,0 +1,114 @@
+"""
+启动耗时基准 - 在全新解释器中多次测量 API 与监控进程的导入耗时，以及（可选）数据库就绪、配置加载和首轮扫描耗时
+
+用法（在项目根目录执行）:
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --first-cycle --output startup.json
+
+首轮扫描只读取每张表的第一页待发送记录，不发送邮件、不写入 email_sent_log。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各入口在启动时导入的模块
+ENTRYPOINTS = {
+    "api": "import api.main",
+    "monitor": "import database.connection, services.monitor_runner, config.logging_config"
+}
+
+FIRST_CYCLE_CODE = """
+import json, time
+start = time.perf_counter()
+from database.connection import db
+from services.monitor_service import MonitorService, TABLE_PIPELINES
+from config.settings import DB_READY_TIMEOUT
+result = {"imports": time.perf_counter() - start}
+if not db.wait_until_ready(DB_READY_TIMEOUT):
+    raise SystemExit("数据库未就绪")
+result["db_ready"] = time.perf_counter() - start
+service = MonitorService()
+if not service.load_config():
+    raise SystemExit("配置加载失败")
+result["config_loaded"] = time.perf_counter() - start
+for table_name, pipeline in TABLE_PIPELINES.items():
+    pages = service._iter_pending_pages(pipeline['query'], pipeline['alias'], 1, table_name)
+    next(pages, None)
+    pages.close()
+result["first_scan"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+def run_python(code, *options):
+    """在全新解释器中执行代码，返回 (墙钟耗时, 标准输出, 标准错误)"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *options, "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=False)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"退出码 {proc.returncode}")
+    return elapsed, proc.stdout, proc.stderr
+
+def summarize(values):
+    """耗时分布（毫秒）"""
+    return {
+        "min": round(min(values) * 1000, 1),
+        "median": round(statistics.median(values) * 1000, 1),
+        "max": round(max(values) * 1000, 1)
+    }
+
+def top_imports(code, limit=10):
+    """-X importtime 中累计耗时最长的顶层导入（毫秒）"""
+    _, _, stderr = run_python(code, "-X", "importtime")
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 只统计直接由入口导入的模块（缩进最浅的一层）
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) <= 3:
+            modules.append((int(cumulative), name.strip()))
+    return [{"module": name, "ms": round(us / 1000, 1)} for us, name in sorted(modules, reverse=True)[:limit]]
+
+def run_benchmark(runs=5, first_cycle=False):
+    baseline = [run_python("pass")[0] for _ in range(runs)]
+    report = {"python": sys.version.split()[0], "runs": runs, "interpreter_ms": summarize(baseline), "entrypoints": {}}
+
+    for name, code in ENTRYPOINTS.items():
+        timings = []
+        for _ in range(runs):
+            _, stdout, _ = run_python(f"import time\nstart = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)")
+            timings.append(float(stdout.strip().splitlines()[-1]))
+        report["entrypoints"][name] = {"import_ms": summarize(timings), "top_imports": top_imports(code)}
+
+    if first_cycle:
+        phases = {}
+        for _ in range(runs):
+            _, stdout, _ = run_python(FIRST_CYCLE_CODE)
+            for phase, seconds in json.loads(stdout.strip().splitlines()[-1]).items():
+                phases.setdefault(phase, []).append(seconds)
+        report["first_cycle_ms"] = {phase: summarize(values) for phase, values in phases.items()}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的次数（默认5）")
+    parser.add_argument("--first-cycle", action="store_true", help="同时测量数据库就绪、配置加载与首轮扫描耗时（需要数据库）")
+    parser.add_argument("--output", help="报告输出文件（JSON）")
+    args = parser.parse_args()
+
+    output = json.dumps(run_benchmark(args.runs, args.first_cycle), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from services.log_index import IndexedRotatingFileHandler
+from config.settings import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_CONSOLE,
+    LOG_MAX_BYTES, LOG_ROTATE_HOURS, LOG_BACKUP_COUNT, LOG_INDEX_INTERVAL
+)
+
+_listener = None
+_sample_rate = LOG_SAMPLE_RATE
+
+class JsonFormatter(logging.Formatter):
+    """JSON格式日志，每行一条记录"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """对标记了 extra={'sampled': True} 的逐条明细日志按比例采样"""
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and _sample_rate < 1:
+            return random.random() < _sample_rate
+        return True
+
+def set_log_sample_rate(rate):
+    """运行时调整明细日志采样比例（0-1）"""
+    global _sample_rate
+    try:
+        _sample_rate = min(max(float(rate), 0.0), 1.0)
+    except (TypeError, ValueError):
+        pass
+
+def set_log_level(level):
+    """运行时调整日志级别"""
+    level = getattr(logging, str(level).upper(), None)
+    if isinstance(level, int):
+        logging.getLogger().setLevel(level)
+
+def setup_logging(log_file=LOG_FILE):
+    """配置日志（监控进程与API内嵌监控共用）
+
+    业务线程只把日志记录放入队列，格式化和文件/控制台输出由后台 QueueListener 线程完成。
+    """
+    global _listener
+    if _listener:
+        return
+
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # 日志文件按大小/时间轮转并压缩归档，同时维护时间索引供日志检索接口使用
+    handlers = [IndexedRotatingFileHandler(
+        log_file,
+        max_bytes=LOG_MAX_BYTES,
+        rotate_seconds=LOG_ROTATE_HOURS * 3600,
+        backup_count=LOG_BACKUP_COUNT,
+        index_interval=LOG_INDEX_INTERVAL
+    )]
+    if LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL))
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """停止后台日志线程并输出队列中剩余的日志"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+    logging.shutdown()
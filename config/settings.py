@@ -10,6 +10,130 @@ API_PORT = int(os.getenv('API_PORT', 8000))
 # 日志配置
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE = os.getenv('LOG_FILE', 'audit_alert.log')
+# 历史回放（monitor.py replay）单独写入的日志文件，不与监控进程轮转同一个文件
+REPLAY_LOG_FILE = os.getenv('REPLAY_LOG_FILE', os.path.splitext(LOG_FILE)[0] + '.replay.log')
+# 日志格式：text 或 json
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# 逐条明细日志（DEBUG）的采样比例，0-1，可通过系统配置 log_sample_rate 运行时调整
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1))
+# 是否同时输出到控制台
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'true').lower() == 'true'
+# 日志轮转：单个文件最大字节数、最长时间（小时），0 表示不按该条件轮转
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_ROTATE_HOURS = float(os.getenv('LOG_ROTATE_HOURS', 24))
+# 保留的压缩归档数量
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 30))
+# 日志时间索引的写入间隔（秒）
+LOG_INDEX_INTERVAL = int(os.getenv('LOG_INDEX_INTERVAL', 60))
 
 # 配置缓存时间（秒）
-CONFIG_CACHE_TIME = 300  # 5分钟
\ No newline at end of file
+CONFIG_CACHE_TIME = 300  # 5分钟
+
+# 检查间隔配置（秒）
+MIN_CHECK_INTERVAL_SECONDS = int(os.getenv('MIN_CHECK_INTERVAL_SECONDS', 10))
+MAX_CHECK_INTERVAL_SECONDS = int(os.getenv('MAX_CHECK_INTERVAL_SECONDS', 3600))
+
+# 监控进程重新读取系统配置的间隔（秒），用于热更新检查间隔
+CONFIG_RELOAD_INTERVAL = int(os.getenv('CONFIG_RELOAD_INTERVAL', 10))
+
+# 调度配置
+# 每轮检查的随机抖动上限（秒），避免多个实例同时访问数据库
+CHECK_JITTER_SECONDS = float(os.getenv('CHECK_JITTER_SECONDS', 0))
+# 单轮检查时长上限（秒），0 表示以当前检查间隔为上限
+MAX_CYCLE_SECONDS = float(os.getenv('MAX_CYCLE_SECONDS', 0))
+
+# 启动时等待数据库就绪的最长时间（秒），进程内按指数退避重试
+DB_READY_TIMEOUT = float(os.getenv('DB_READY_TIMEOUT', 60))
+
+# SMTP连接超时（秒），避免发送阻塞导致进程无法及时退出
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+# 单次投递（一个SMTP事务）的最大收件人数，超出时按该数量分批 RCPT，需不大于服务商限制
+SMTP_MAX_RECIPIENTS = int(os.getenv('SMTP_MAX_RECIPIENTS', 50))
+# 收件人被临时拒收（4xx）时只对这些地址重试的次数
+SMTP_RCPT_RETRIES = int(os.getenv('SMTP_RCPT_RETRIES', 1))
+
+# 停止配置（秒），需满足 SMTP_TIMEOUT < MONITOR_DRAIN_TIMEOUT < MONITOR_STOP_TIMEOUT：
+# 正在进行的一次发送最长阻塞 SMTP_TIMEOUT，排空等待需覆盖它，API等待监控进程退出又需覆盖排空等待；
+# 配置值小于下限（前者加 STOP_TIMEOUT_MARGIN）时按下限生效
+STOP_TIMEOUT_MARGIN = 5
+# 监控进程收到SIGTERM/SIGINT后（或内嵌模式停止时）等待当前检查完成的时间
+MONITOR_DRAIN_TIMEOUT = max(float(os.getenv('MONITOR_DRAIN_TIMEOUT', 0)), SMTP_TIMEOUT + STOP_TIMEOUT_MARGIN)
+# API停止监控进程时等待其优雅退出的时间，超时后强制终止
+MONITOR_STOP_TIMEOUT = max(float(os.getenv('MONITOR_STOP_TIMEOUT', 0)), MONITOR_DRAIN_TIMEOUT + STOP_TIMEOUT_MARGIN)
+
+# 监控运行模式：process=独立进程运行monitor.py（默认），embedded=在API进程内以后台任务运行
+MONITOR_MODE = os.getenv('MONITOR_MODE', 'process').lower()
+
+# 扫描配置
+# 每次分页读取的待发送记录数
+SCAN_PAGE_SIZE = int(os.getenv('SCAN_PAGE_SIZE', 500))
+# 每张表每轮最多处理的记录数，0 表示不限制
+MAX_RECORDS_PER_CYCLE = int(os.getenv('MAX_RECORDS_PER_CYCLE', 5000))
+# 监控进程内存上限（MB），超过后本轮停止读取新记录，0 表示不限制
+MONITOR_MEMORY_LIMIT_MB = int(os.getenv('MONITOR_MEMORY_LIMIT_MB', 512))
+
+# 优先级与降载配置
+# 未命中优先级规则时的默认优先级（high/normal/low）
+DEFAULT_ALERT_PRIORITY = os.getenv('DEFAULT_ALERT_PRIORITY', 'normal')
+# 单轮积压记录数达到该阈值后，低优先级记录改为汇总发送，0 表示不降载
+SHED_BACKLOG_THRESHOLD = int(os.getenv('SHED_BACKLOG_THRESHOLD', 200))
+# 每封汇总邮件最多包含的记录数
+SUMMARY_BATCH_SIZE = int(os.getenv('SUMMARY_BATCH_SIZE', 100))
+
+# 推送接入配置
+# 推送接入队列容量，队列满时接口返回429
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 1000))
+# 后台投递线程每次从队列取出的记录数
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 100))
+# 发送认领超时（秒）：认领后超过该时长仍未写入发送记录（如实例崩溃）的记录可被重新认领发送
+SEND_CLAIM_TIMEOUT = float(os.getenv('SEND_CLAIM_TIMEOUT', 600))
+
+# 本地暂存配置（数据库或SMTP不可用时暂存待补发邮件和待补写发送记录）
+# 暂存目录，为空表示不启用
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+# 单个分段文件大小上限
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024))
+# 批量刷盘间隔（秒）
+SPOOL_FSYNC_INTERVAL = float(os.getenv('SPOOL_FSYNC_INTERVAL', 0.5))
+# 补发/补写间隔（秒）
+SPOOL_REPLAY_INTERVAL = float(os.getenv('SPOOL_REPLAY_INTERVAL', 15))
+# 单封邮件补发被拒（非SMTP不可用）时的最大尝试次数，达到后移入死信目录不再自动补发
+SPOOL_MAX_ATTEMPTS = int(os.getenv('SPOOL_MAX_ATTEMPTS', 5))
+# 补发被拒后的重试退避（秒），每次失败翻倍，不超过 SPOOL_RETRY_BACKOFF_MAX
+SPOOL_RETRY_BACKOFF = float(os.getenv('SPOOL_RETRY_BACKOFF', 60))
+SPOOL_RETRY_BACKOFF_MAX = float(os.getenv('SPOOL_RETRY_BACKOFF_MAX', 3600))
+
+# 多实例协调配置（多节点部署时开启，基于PostgreSQL咨询锁分配分片）
+COORDINATION_ENABLED = os.getenv('COORDINATION_ENABLED', 'false').lower() == 'true'
+# 每张表按记录 id 哈希划分的分片数
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 1))
+# 实例心跳租约时长（秒），超过该时长未续约的实例视为已下线
+INSTANCE_LEASE_SECONDS = float(os.getenv('INSTANCE_LEASE_SECONDS', 30))
+# 续约与分片再平衡间隔（秒）
+COORDINATION_INTERVAL = float(os.getenv('COORDINATION_INTERVAL', 10))
+# 实例标识，默认为 主机名-进程号
+MONITOR_INSTANCE_ID = os.getenv('MONITOR_INSTANCE_ID', '')
+
+# 按需性能分析配置
+# 分析结果目录（API与监控进程需能访问同一目录）
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# 单次请求最多分析的检查轮数
+PROFILE_MAX_CYCLES = int(os.getenv('PROFILE_MAX_CYCLES', 20))
+# 报告中保留的函数/内存分配位置条数
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 30))
+
+# 资源使用历史配置
+# 监控进程资源采样间隔（秒）
+RESOURCE_SAMPLE_INTERVAL = float(os.getenv('RESOURCE_SAMPLE_INTERVAL', 5))
+# 环形缓冲区保留的采样点数（默认720个，按5秒间隔约1小时）
+RESOURCE_HISTORY_SIZE = int(os.getenv('RESOURCE_HISTORY_SIZE', 720))
+# 独立进程模式下资源使用历史的写入文件（每行一个采样点，API进程读取）
+RESOURCE_HISTORY_FILE = os.getenv('RESOURCE_HISTORY_FILE', 'monitor.history.json')
+
+# 控制面读接口缓存配置
+# SMTP配置、收件人列表的缓存时间（秒），过期后先比较表版本，数据未变化时不重新查询；0 表示不缓存
+API_CACHE_TTL = float(os.getenv('API_CACHE_TTL', 5))
+# 监控状态的缓存时间（秒），0 表示不缓存
+STATUS_CACHE_TTL = float(os.getenv('STATUS_CACHE_TTL', 2))
+# 最多缓存的响应数（不同查询参数分别缓存）
+API_CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', 256))
@@ -1,13 +1,25 @@
 import os
+import queue
+import time
 import psycopg
 from psycopg.rows import dict_row
 import logging
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+def typed_row(cls):
+    """行工厂：每行直接构造为 cls（namedtuple 类型，字段需与查询列顺序一致），不为每行创建字典"""
+    def factory(cursor):
+        names = tuple(column.name for column in cursor.description or ())
+        if names and names != cls._fields:
+            raise ValueError(f"查询列 {names} 与 {cls.__name__} 的字段 {cls._fields} 不一致")
+        return cls._make
+    return factory
+
 class Database:
     def __init__(self):
         self.connection_string = (
@@ -17,6 +29,37 @@ class Database:
             f"user={os.getenv('DB_USER')} "
             f"password={os.getenv('DB_PASSWORD')}"
         )
+        # 监控热点查询使用的长连接池，预编译语句按连接缓存
+        self._pool = queue.LifoQueue(maxsize=int(os.getenv('DB_POOL_SIZE', 5)))
+    
+    def wait_until_ready(self, timeout, max_delay=2.0):
+        """等待数据库可连接（指数退避重试，间隔从0.1秒增长到 max_delay 秒），返回是否在 timeout 秒内就绪
+        
+        成功建立的连接放入连接池，启动后的首轮检查直接复用，无需再次建立连接。
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                conn = psycopg.connect(self.connection_string, row_factory=dict_row, connect_timeout=5)
+                break
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.error(f"数据库在{timeout:g}秒内未就绪（已尝试{attempt}次）: {e}")
+                    return False
+                logger.info(f"数据库未就绪（第{attempt}次尝试），{min(delay, remaining):.1f}秒后重试: {e}")
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, max_delay)
+        
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        logger.info(f"数据库已就绪（第{attempt}次尝试）")
+        return True
     
     def get_connection(self):
         """获取数据库连接"""
@@ -48,5 +91,85 @@ class Database:
         finally:
             conn.close()
 
+    def execute_returning(self, query, params=None):
+        """执行写入语句并返回结果行（用于 RETURNING 或带写入CTE的语句），单个事务内提交"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                conn.commit()
+                return rows
+        except Exception as e:
+            logger.error(f"查询执行失败: {e}")
+            conn.rollback()
+            return None
+        finally:
+            conn.close()
+
+    @contextmanager
+    def pooled_connection(self):
+        """从连接池借用长连接，正常结束时提交，异常时回滚；断开的连接不再放回连接池"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is None or conn.closed or conn.broken:
+            conn = psycopg.connect(self.connection_string, row_factory=dict_row)
+        
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.broken:
+                conn.rollback()
+            raise
+        finally:
+            if conn.closed or conn.broken:
+                conn.close()
+            else:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+    
+    def execute_prepared(self, query, params=None, row_factory=None):
+        """在连接池的长连接上以预编译语句执行（每个连接首次执行时准备，之后复用执行计划）
+        
+        row_factory 为空时结果行为字典，可传入 typed_row(cls) 等行工厂。
+        """
+        try:
+            with self.pooled_connection() as conn:
+                with conn.cursor(row_factory=row_factory or dict_row) as cursor:
+                    cursor.execute(query, params, prepare=True)
+                    return cursor.fetchall() if cursor.description else cursor.rowcount
+        except Exception as e:
+            logger.error(f"查询执行失败: {e}")
+            return None
+    
+    def execute_pipeline(self, statements):
+        """以管道模式批量执行 [(query, params), ...]：一次往返发送全部语句，在同一事务内提交
+        
+        返回与 statements 对应的结果列表（查询为结果行，写入为影响行数），任一语句失败时全部回滚并返回 None。
+        """
+        try:
+            with self.pooled_connection() as conn:
+                cursors = []
+                with conn.pipeline():
+                    for query, params in statements:
+                        cursor = conn.cursor()
+                        cursor.execute(query, params, prepare=True)
+                        cursors.append(cursor)
+                results = [cursor.fetchall() if cursor.description else cursor.rowcount for cursor in cursors]
+                for cursor in cursors:
+                    cursor.close()
+                return results
+        except Exception as e:
+            logger.error(f"管道执行失败: {e}")
+            return None
+
 # 全局数据库实例
 db = Database()
\ No newline at end of file
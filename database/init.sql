@@ -67,6 +67,72 @@ CREATE TABLE IF NOT EXISTS email_sent_log (
     recipients TEXT                                  -- 邮件收件人列表，用逗号分隔，便于追踪
 );
 
+-- ===================================
+-- 5. 告警统计汇总表
+-- ===================================
+-- 用途：按小时/天汇总各表各审计结果的告警发送结果，供统计看板直接读取
+-- 说明：由监控程序每轮检查后增量合并，granularity 为 hour 或 day
+CREATE TABLE IF NOT EXISTS alert_stats_rollup (
+    granularity VARCHAR(10) NOT NULL,                -- 汇总粒度（hour 或 day）
+    bucket_start TIMESTAMP NOT NULL,                 -- 时间桶起始时间
+    table_name VARCHAR(50) NOT NULL,                 -- 源表名
+    verdict VARCHAR(20) NOT NULL,                    -- 审计结果
+    sent_count INTEGER DEFAULT 0,                    -- 逐条发送成功的告警数
+    summarized_count INTEGER DEFAULT 0,              -- 以汇总邮件发送成功的告警数
+    failed_count INTEGER DEFAULT 0,                  -- 发送失败的次数（同一条记录多轮失败计多次）
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- 最后合并时间
+    PRIMARY KEY (granularity, bucket_start, table_name, verdict)
+);
+
+-- 首次创建时按已有发送记录回填（已有记录无法区分逐条/汇总，均计入 sent_count）
+-- 汇总表已有数据时不再回填，重复执行初始化脚本不会扫描整个发送记录表
+INSERT INTO alert_stats_rollup (granularity, bucket_start, table_name, verdict, sent_count)
+SELECT g.granularity, date_trunc(g.granularity, esl.sent_at), esl.table_name, esl.verdict, COUNT(*)
+FROM email_sent_log esl CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+WHERE esl.table_name IS NOT NULL AND esl.verdict IS NOT NULL AND esl.sent_at IS NOT NULL
+AND NOT EXISTS (SELECT 1 FROM alert_stats_rollup)
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
+
+-- ===================================
+-- 6. 监控实例表
+-- ===================================
+-- 用途：多实例部署时记录存活的监控实例及其持有的分片
+-- 说明：实例定期续约心跳，超过租约时长未续约视为下线；分片独占由PostgreSQL咨询锁保证
+CREATE TABLE IF NOT EXISTS monitor_instances (
+    instance_id VARCHAR(100) PRIMARY KEY,            -- 实例标识（默认 主机名-进程号）
+    hostname VARCHAR(255),                           -- 主机名
+    pid INTEGER,                                     -- 进程号
+    shards TEXT,                                     -- 当前持有的分片，如 audit_results#0
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- 实例注册时间
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- 最近一次心跳时间
+);
+
+-- ===================================
+-- 7. 告警发送认领表
+-- ===================================
+-- 用途：发送前原子认领记录，轮询扫描、推送接入和多个实例之间同一条记录只会有一方发送
+-- 说明：写入发送记录时同一事务内删除认领，发送失败且未暂存时释放（删除）认领；
+--       超过 SEND_CLAIM_TIMEOUT 未写入发送记录的认领视为失效，可被重新认领；
+--       spooled=true 表示邮件已进入认领实例的本地暂存，由该实例补发，其他实例不再认领
+--       dead=true 表示邮件已移入死信，记录不再告警，可通过死信接口重新入队
+CREATE TABLE IF NOT EXISTS email_send_claims (
+    table_name VARCHAR(50) NOT NULL,                 -- 源表名
+    record_id INTEGER NOT NULL,                      -- 源记录ID
+    verdict VARCHAR(20) NOT NULL,                    -- 审计结果
+    instance_id VARCHAR(100),                        -- 认领的实例标识
+    claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- 认领时间
+    spooled BOOLEAN DEFAULT FALSE,                   -- 是否已进入本地暂存等待补发
+    dead BOOLEAN DEFAULT FALSE,                      -- 是否已移入死信（多次补发被拒或被丢弃），不再被认领
+    PRIMARY KEY (table_name, record_id, verdict)
+);
+ALTER TABLE email_send_claims ADD COLUMN IF NOT EXISTS dead BOOLEAN DEFAULT FALSE;
+
+-- 清理旧版本遗留的认领：已写入发送记录的认领不再需要
+DELETE FROM email_send_claims esc
+USING email_sent_log esl
+WHERE esl.table_name = esc.table_name AND esl.record_id = esc.record_id AND esl.verdict = esc.verdict;
+
 -- ===================================
 -- 插入系统默认配置
 -- ===================================
@@ -90,6 +156,12 @@ BEGIN
         INSERT INTO system_config (config_key, config_value, description) 
         VALUES ('email_enabled', 'true', '邮件发送开关，true=发送邮件，false=只记录不发送邮件');
     END IF;
+    
+    -- 插入 alert_priority_rules 配置
+    IF NOT EXISTS (SELECT 1 FROM system_config WHERE config_key = 'alert_priority_rules') THEN
+        INSERT INTO system_config (config_key, config_value, description) 
+        VALUES ('alert_priority_rules', '[]', '告警优先级规则（JSON数组），积压时低优先级记录改为汇总发送');
+    END IF;
 END $$;
 
 -- ===================================
@@ -98,6 +170,22 @@ END $$;
 -- 收件人表按表名查询的索引
 CREATE INDEX IF NOT EXISTS idx_recipients_table_name ON recipients_config(table_name);
 
+-- 收件人列表接口按表名/启用状态过滤并按 id 键集分页的索引
+CREATE INDEX IF NOT EXISTS idx_recipients_table_active_id ON recipients_config(table_name, is_active, id DESC);
+CREATE INDEX IF NOT EXISTS idx_recipients_active_id ON recipients_config(is_active, id DESC);
+
+-- 同一表内收件人邮箱（不区分大小写）唯一，供导入和添加接口 ON CONFLICT 使用；
+-- 建索引前先清理历史重复记录，每组保留 id 最小的一条
+DELETE FROM recipients_config dup
+USING recipients_config keep
+WHERE dup.table_name = keep.table_name
+  AND lower(dup.email) = lower(keep.email)
+  AND dup.id > keep.id;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_recipients_table_email ON recipients_config(table_name, lower(email));
+
+-- SMTP配置列表接口按启用状态过滤并按 id 键集分页的索引
+CREATE INDEX IF NOT EXISTS idx_smtp_config_active_id ON smtp_config(is_active, id DESC);
+
 -- 系统配置表按配置键查询的索引
 CREATE INDEX IF NOT EXISTS idx_system_config_key ON system_config(config_key);
 
@@ -107,6 +195,12 @@ CREATE INDEX IF NOT EXISTS idx_email_log_table_record ON email_sent_log(table_na
 -- 邮件日志表按发送时间查询的索引，便于日志清理
 CREATE INDEX IF NOT EXISTS idx_email_log_sent_at ON email_sent_log(sent_at);
 
+-- 告警记录查询接口按表名/审计结果过滤并按 id 倒序分页的索引
+CREATE INDEX IF NOT EXISTS idx_email_log_table_verdict_id ON email_sent_log(table_name, verdict, id DESC);
+
+-- 告警记录查询接口按收件人过滤的索引（收件人列表拆分为数组后建GIN索引）
+CREATE INDEX IF NOT EXISTS idx_email_log_recipients ON email_sent_log USING GIN (string_to_array(recipients, ', '));
+
 /*
 ===========================================
 表关系说明：
@@ -126,6 +220,16 @@ CREATE INDEX IF NOT EXISTS idx_email_log_sent_at ON email_sent_log(sent_at);
    - 与 audit_results.id 和 image_audit_results.id 关联
    - 防止重复发送邮件
 
+5. alert_stats_rollup: 告警统计汇总
+   - 监控程序每轮检查后按小时/天增量合并发送结果
+
+6. monitor_instances: 监控实例注册表
+   - 多实例部署时记录存活实例的心跳和持有的分片
+
+7. email_send_claims: 告警发送认领
+   - 与 email_sent_log 使用相同的 table_name+record_id+verdict 组合
+   - 发送前认领，避免扫描、推送接入和多实例重复发送
+
 数据流向：
 监控程序 -> 查询audit_results/image_audit_results -> 
 检查email_sent_log -> 获取recipients_config -> 
@@ -1,48 +1,133 @@
+import argparse
+import json
 import logging
-import schedule
-import time
-from services.monitor_service import MonitorService
-from config.settings import LOG_LEVEL, LOG_FILE
-
-# 配置日志
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import signal
+import sys
+from datetime import datetime
+from database.connection import db
+from services.monitor_runner import MonitorRunner
+from config.logging_config import setup_logging, stop_logging
+from config.settings import MONITOR_DRAIN_TIMEOUT, DB_READY_TIMEOUT, RESOURCE_HISTORY_FILE, REPLAY_LOG_FILE
 
 logger = logging.getLogger(__name__)
 
 def main():
     """主函数"""
-    monitor_service = MonitorService()
-    
-    # 初始化配置
-    if not monitor_service.load_config():
+    runner = MonitorRunner(history_file=RESOURCE_HISTORY_FILE)
+    runner.mark_startup('imports')
+
+    # 进程内等待数据库就绪（指数退避），建立的连接直接用于首轮检查
+    if not db.wait_until_ready(DB_READY_TIMEOUT):
+        logger.error("数据库未就绪，程序退出")
+        return
+    runner.mark_startup('db_ready')
+
+    # 初始化配置与定时任务
+    if not runner.setup():
         logger.error("初始化配置加载失败，程序退出")
         return
-    
-    # 获取检查间隔
+
+    def handle_shutdown(signum, frame):
+        """收到SIGTERM/SIGINT：不再开始新的检查与发送，当前邮件发送并记录后退出"""
+        logger.info(f"收到信号 {signal.Signals(signum).name}，准备停止监控服务")
+        runner.request_stop()
+
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    signal.signal(signal.SIGINT, handle_shutdown)
+
+    # 持续运行，直到收到停止信号
+    runner.run()
+
+    # 等待当前检查完成（当前邮件发送及其email_sent_log记录）
+    if runner.stop(MONITOR_DRAIN_TIMEOUT):
+        logger.info("监控服务已停止")
+    else:
+        logger.warning(f"当前检查在{MONITOR_DRAIN_TIMEOUT}秒内未完成，强制退出")
+    stop_logging()
+
+def replay(args):
+    """历史回放：把历史记录发往本地SMTP接收端并输出报告，不读写 email_sent_log"""
+    from services.replay import (iter_db_records, iter_file_records, iter_with_recording,
+                                 load_recipients, run_replay)
+    from services.monitor_service import TABLE_PIPELINES
+    from services.smtp_sink import SMTPSink
+
+    tables = args.table or list(TABLE_PIPELINES)
+    if args.file:
+        records = iter_file_records(args.file)
+    elif args.start and args.end:
+        records = iter_db_records(tables, datetime.fromisoformat(args.start), datetime.fromisoformat(args.end))
+    else:
+        logger.error("请指定 --file 或 --start/--end")
+        return 1
+    if args.save:
+        records = iter_with_recording(records, args.save)
+
+    if args.recipients:
+        emails = [email.strip() for email in args.recipients.split(',') if email.strip()]
+        recipients = {table_name: emails for table_name in TABLE_PIPELINES}
+    elif not args.file:
+        recipients = load_recipients(tables)
+    else:
+        recipients = {table_name: ['replay@localhost'] for table_name in TABLE_PIPELINES}
+
+    # 未指定 --sink 时在进程内启动本地接收端
+    sink = None
+    if args.sink:
+        host, port = args.sink.rsplit(':', 1)
+        address = (host, int(port))
+    else:
+        sink = SMTPSink(delay=args.sink_delay_ms / 1000, max_recipients=args.sink_max_recipients).start()
+        address = sink.address
+    smtp_config = {'server': address[0], 'port': address[1], 'username': 'replay@localhost',
+                   'password': '', 'starttls': False}
+
     try:
-        check_interval = int(monitor_service.system_config.get('check_interval', '5'))
-    except ValueError:
-        check_interval = 5
-    
-    # 设置定时任务
-    schedule.every(check_interval).minutes.do(monitor_service.run_check)
-    
-    logger.info(f"审计告警监控服务启动，检查间隔: {check_interval}分钟")
-    
-    # 立即执行一次检查
-    monitor_service.run_check()
-    
-    # 持续运行
-    while True:
-        schedule.run_pending()
-        time.sleep(30)
+        report = run_replay(records, smtp_config, recipients, speed=args.speed,
+                            workers=args.workers, limit=args.limit)
+        if sink:
+            report["sink"] = sink.get_stats()
+    finally:
+        if sink:
+            sink.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="邮件告警监控服务")
+    subparsers = parser.add_subparsers(dest="command")
+
+    replay_parser = subparsers.add_parser("replay", help="历史回放/演练，发往本地SMTP接收端，不写 email_sent_log")
+    replay_parser.add_argument("--start", help="开始时间（ISO格式，含）")
+    replay_parser.add_argument("--end", help="结束时间（ISO格式，不含）")
+    replay_parser.add_argument("--table", action="append", help="只回放指定表，可重复指定（默认全部）")
+    replay_parser.add_argument("--file", help="从录制文件（NDJSON）回放，代替数据库查询")
+    replay_parser.add_argument("--save", help="把本次回放的记录录制到文件")
+    replay_parser.add_argument("--speed", type=float, default=0, help="回放倍速，0表示尽快发送（默认0）")
+    replay_parser.add_argument("--workers", type=int, default=1, help="并发发送线程数（默认1）")
+    replay_parser.add_argument("--sink", help="外部SMTP接收端 HOST:PORT（默认在进程内启动）")
+    replay_parser.add_argument("--sink-delay-ms", type=float, default=0, help="进程内接收端每封邮件的模拟延迟（毫秒）")
+    replay_parser.add_argument("--sink-max-recipients", type=int, default=0,
+                               help="进程内接收端单封邮件最多接受的收件人数，模拟服务商限制（默认不限制）")
+    replay_parser.add_argument("--recipients", help="收件人，逗号分隔（默认读取收件人配置）")
+    replay_parser.add_argument("--limit", type=int, default=0, help="最多回放的记录数（默认不限制）")
+    replay_parser.add_argument("--output", help="报告输出文件（JSON）")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.command == "replay":
+        # 回放写入单独的日志文件，不与同时运行的监控进程轮转同一个 LOG_FILE
+        setup_logging(REPLAY_LOG_FILE)
+        try:
+            code = replay(args)
+        finally:
+            stop_logging()
+        sys.exit(code)
+    setup_logging()
+    main()
@@ -0,0 +1,65 @@
+"""
+告警统计汇总 - 监控发送时在内存中累加计数，每轮检查结束后批量合并到 alert_stats_rollup 表，
+看板按小时/天直接读取汇总行，无需对 email_sent_log 做 GROUP BY
+
+时间桶按合并时的数据库时间截断（与 email_sent_log.sent_at 的默认值同一时钟），不使用监控主机的本地时间。
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+# 汇总粒度（date_trunc 的截断单位）
+GRANULARITIES = ('hour', 'day')
+
+OUTCOMES = ('sent', 'summarized', 'failed')
+
+class AlertStatsRollup:
+    """按 (表名, 审计结果) 累加发送结果计数，flush 时一条语句合并到当前数据库时间所在的各粒度时间桶"""
+
+    def __init__(self):
+        self._pending = defaultdict(lambda: dict.fromkeys(OUTCOMES, 0))
+        self._lock = threading.Lock()
+
+    def record(self, table_name, verdict, outcome, count=1):
+        """累加一次发送结果，outcome 为 sent / summarized / failed"""
+        with self._lock:
+            self._pending[(table_name, verdict)][outcome] += count
+
+    def flush(self):
+        """把累加的计数合并到 alert_stats_rollup，写入失败时计数保留到下次合并（计入下次合并时的时间桶）"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: dict.fromkeys(OUTCOMES, 0))
+        if not pending:
+            return True
+
+        values = ', '.join(['(%s::varchar, %s::varchar, %s::integer, %s::integer, %s::integer)'] * len(pending))
+        granularities = ', '.join(f"('{granularity}')" for granularity in GRANULARITIES)
+        query = f"""
+        INSERT INTO alert_stats_rollup
+            (granularity, bucket_start, table_name, verdict, sent_count, summarized_count, failed_count)
+        SELECT g.granularity, date_trunc(g.granularity, CURRENT_TIMESTAMP::timestamp),
+               c.table_name, c.verdict, c.sent_count, c.summarized_count, c.failed_count
+        FROM (VALUES {values}) AS c(table_name, verdict, sent_count, summarized_count, failed_count)
+        CROSS JOIN (VALUES {granularities}) AS g(granularity)
+        ON CONFLICT (granularity, bucket_start, table_name, verdict) DO UPDATE SET
+            sent_count = alert_stats_rollup.sent_count + EXCLUDED.sent_count,
+            summarized_count = alert_stats_rollup.summarized_count + EXCLUDED.summarized_count,
+            failed_count = alert_stats_rollup.failed_count + EXCLUDED.failed_count,
+            updated_at = CURRENT_TIMESTAMP
+        """
+        params = []
+        for key, counts in pending.items():
+            params.extend((*key, counts['sent'], counts['summarized'], counts['failed']))
+
+        if db.execute_query(query, params) is None:
+            logger.error(f"告警统计写入失败，{len(pending)} 个汇总桶留待下次合并")
+            with self._lock:
+                for key, counts in pending.items():
+                    for outcome, count in counts.items():
+                        self._pending[key][outcome] += count
+            return False
+        return True
@@ -0,0 +1,195 @@
+"""
+多实例协调 - 多个监控实例通过 PostgreSQL 会话级咨询锁分配扫描分片
+
+每张表按记录 id 哈希划分为 SHARD_COUNT 个分片，每个分片对应一把咨询锁，持锁的实例独占扫描该分片。
+锁由协调器的专用长连接持有：实例崩溃或断网时连接断开，数据库自动释放其全部分片，由其他实例接管。
+实例在 monitor_instances 表中定期续约心跳租约，各实例按存活实例数均分分片（再平衡）。
+"""
+
+import math
+import os
+import socket
+import threading
+import logging
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, List
+import psycopg
+from psycopg.rows import dict_row
+from database.connection import db
+from config.settings import SHARD_COUNT, INSTANCE_LEASE_SECONDS, MONITOR_INSTANCE_ID
+
+logger = logging.getLogger(__name__)
+
+class ShardCoordinator:
+    def __init__(self, tables, shard_count=SHARD_COUNT, instance_id=None):
+        self.instance_id = instance_id or MONITOR_INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.shard_count = max(1, shard_count)
+        self.shards = [(table_name, shard) for table_name in tables for shard in range(self.shard_count)]
+        self.owned = set()
+        self.live_instances = []
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        # 表正在扫描时持有对应的锁，再平衡不会释放正在扫描的分片
+        self._table_locks = {table_name: threading.Lock() for table_name in tables}
+        self._closed = False
+
+    @staticmethod
+    def _lock_key(table_name, shard):
+        return zlib.crc32(table_name.encode('utf-8')) & 0x7fffffff, shard
+
+    def _execute(self, query, params=None):
+        """在协调专用连接上执行语句，连接断开时已持有的分片视为全部丢失"""
+        with self._conn_lock:
+            try:
+                if self._conn is None or self._conn.closed or self._conn.broken:
+                    if self._conn is not None:
+                        logger.warning("协调连接已断开，放弃当前持有的全部分片")
+                        self.owned.clear()
+                    self._conn = psycopg.connect(
+                        db.connection_string, autocommit=True, row_factory=dict_row,
+                        keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3
+                    )
+                with self._conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    return cursor.fetchall() if cursor.description else []
+            except Exception as e:
+                logger.error(f"协调查询执行失败: {e}")
+                self.owned.clear()
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                return None
+
+    def rebalance(self):
+        """续约心跳并按存活实例数调整持有的分片"""
+        if self._closed:
+            return
+
+        heartbeat = self._execute("""
+        INSERT INTO monitor_instances (instance_id, hostname, pid, shards)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (instance_id) DO UPDATE SET heartbeat_at = CURRENT_TIMESTAMP, shards = EXCLUDED.shards
+        """, (self.instance_id, socket.gethostname(), os.getpid(), self._format_shards()))
+        if heartbeat is None:
+            return
+
+        rows = self._execute("""
+        SELECT instance_id FROM monitor_instances
+        WHERE heartbeat_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+        ORDER BY instance_id
+        """, (INSTANCE_LEASE_SECONDS,))
+        if rows is None:
+            return
+        self.live_instances = [row['instance_id'] for row in rows]
+        if self.instance_id not in self.live_instances:
+            self.live_instances.append(self.instance_id)
+            self.live_instances.sort()
+
+        # 以数据库中实际持有的锁为准
+        held = self._execute("""
+        SELECT classid::bigint AS key1, objid::bigint AS key2 FROM pg_locks
+        WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND objsubid = 2 AND granted
+        """)
+        if held is None:
+            return
+        held = {(row['key1'], row['key2']) for row in held}
+        self.owned.intersection_update([shard for shard in self.owned if self._lock_key(*shard) in held])
+
+        target = math.ceil(len(self.shards) / len(self.live_instances))
+        released = self._release_extra(target)
+        acquired = self._acquire_free(target)
+        if released or acquired:
+            logger.info(f"分片再平衡: 存活实例 {len(self.live_instances)} 个，"
+                        f"释放 {released} 个，获取 {acquired} 个，当前持有 {self._format_shards()}")
+            self._execute("UPDATE monitor_instances SET shards = %s WHERE instance_id = %s",
+                          (self._format_shards(), self.instance_id))
+
+        # 清理长时间未续约的实例记录
+        self._execute("""
+        DELETE FROM monitor_instances
+        WHERE heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (INSTANCE_LEASE_SECONDS * 10,))
+
+    def _release_extra(self, target):
+        released = 0
+        for shard in sorted(self.owned, reverse=True):
+            if len(self.owned) <= target:
+                break
+            table_lock = self._table_locks[shard[0]]
+            if not table_lock.acquire(blocking=False):
+                continue
+            try:
+                if self._execute("SELECT pg_advisory_unlock(%s::int, %s::int)", self._lock_key(*shard)) is not None:
+                    self.owned.discard(shard)
+                    released += 1
+            finally:
+                table_lock.release()
+        return released
+
+    def _acquire_free(self, target):
+        # 各实例从不同位置开始尝试，减少争抢
+        start = self.live_instances.index(self.instance_id) * len(self.shards) // len(self.live_instances)
+        acquired = 0
+        for i in range(len(self.shards)):
+            if len(self.owned) >= target:
+                break
+            shard = self.shards[(start + i) % len(self.shards)]
+            if shard in self.owned:
+                continue
+            rows = self._execute("SELECT pg_try_advisory_lock(%s::int, %s::int) AS locked", self._lock_key(*shard))
+            if rows and rows[0]['locked']:
+                self.owned.add(shard)
+                acquired += 1
+        return acquired
+
+    def owned_shards(self, table_name) -> List[int]:
+        """当前实例持有的指定表的分片号"""
+        return sorted(shard for owned_table, shard in list(self.owned) if owned_table == table_name)
+
+    def owns(self, table_name, shard) -> bool:
+        """向数据库确认分片锁仍由本实例持有（每页发送前调用，连接断开后立即停止发送）"""
+        if (table_name, shard) not in self.owned:
+            return False
+        rows = self._execute("""
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'advisory' AND pid = pg_backend_pid()
+        AND classid::bigint = %s AND objid::bigint = %s AND objsubid = 2 AND granted
+        """, self._lock_key(table_name, shard))
+        return bool(rows)
+
+    @contextmanager
+    def hold(self, table_name):
+        """扫描期间持有表锁，防止再平衡释放正在扫描的分片"""
+        with self._table_locks[table_name]:
+            yield
+
+    def close(self):
+        """等待进行中的扫描结束后释放全部分片并注销实例"""
+        self._closed = True
+        for table_lock in self._table_locks.values():
+            table_lock.acquire()
+        try:
+            if self._conn is None:
+                return
+            self._execute("SELECT pg_advisory_unlock_all()")
+            self._execute("DELETE FROM monitor_instances WHERE instance_id = %s", (self.instance_id,))
+            with self._conn_lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                self.owned.clear()
+        finally:
+            for table_lock in self._table_locks.values():
+                table_lock.release()
+
+    def _format_shards(self):
+        return ', '.join(f"{table_name}#{shard}" for table_name, shard in sorted(self.owned))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "instance_id": self.instance_id,
+            "shard_count": self.shard_count,
+            "live_instances": self.live_instances,
+            "owned_shards": sorted(f"{table_name}#{shard}" for table_name, shard in list(self.owned))
+        }
@@ -0,0 +1,99 @@
+"""
+告警投递优先级 - 按表、审计结果和可配置规则为记录分配优先级，并按优先级出队
+"""
+
+import heapq
+import itertools
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+PRIORITY_NAMES = {
+    'high': PRIORITY_HIGH,
+    'normal': PRIORITY_NORMAL,
+    'low': PRIORITY_LOW
+}
+
+class PriorityRules:
+    """优先级规则，按顺序匹配，第一条命中的规则生效
+
+    规则示例（存储在 system_config.alert_priority_rules，JSON数组）:
+    [
+        {"table_name": "audit_results", "verdict": "不合规", "priority": "high"},
+        {"field": "reason", "contains": "测试", "priority": "low"},
+        {"table_name": "image_audit_results", "priority": "low"}
+    ]
+    table_name/verdict/field+contains 均为可选条件，同一条规则内的条件需全部满足。
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, default: str = 'normal'):
+        self.rules = rules or []
+        self.default = PRIORITY_NAMES.get(default, PRIORITY_NORMAL)
+
+    @classmethod
+    def from_config(cls, value: Optional[str], default: str = 'normal') -> 'PriorityRules':
+        """从系统配置值（JSON字符串）解析规则，格式错误时忽略规则"""
+        if not value:
+            return cls(default=default)
+        try:
+            rules = json.loads(value)
+            cls.validate(rules)
+        except (ValueError, TypeError) as e:
+            logger.error(f"优先级规则格式错误，已忽略: {e}")
+            return cls(default=default)
+        return cls(rules, default)
+
+    @staticmethod
+    def validate(rules: Any):
+        """校验规则格式，不合法时抛出 ValueError"""
+        if not isinstance(rules, list):
+            raise ValueError("优先级规则必须是数组")
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise ValueError(f"优先级规则必须是对象: {rule}")
+            if rule.get('priority') not in PRIORITY_NAMES:
+                raise ValueError(f"优先级必须是 {list(PRIORITY_NAMES.keys())} 之一: {rule}")
+            if ('field' in rule) != ('contains' in rule):
+                raise ValueError(f"field 和 contains 必须同时配置: {rule}")
+
+    def classify(self, table_name: str, verdict: str, record: Any) -> int:
+        """计算记录的优先级（record 为流水线的行类型，按属性读取字段）"""
+        for rule in self.rules:
+            if 'table_name' in rule and rule['table_name'] != table_name:
+                continue
+            if 'verdict' in rule and rule['verdict'] != verdict:
+                continue
+            if 'field' in rule:
+                # 只读取记录的字段，避免匹配到 count、index 等元组方法
+                value = getattr(record, rule['field']) if rule['field'] in record._fields else None
+                if rule['contains'] not in str(value or ''):
+                    continue
+            return PRIORITY_NAMES[rule['priority']]
+        return self.default
+
+class DeliveryQueue:
+    """优先级投递队列，优先级相同时保持入队顺序（即最新记录优先）"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, priority: int, record: Any):
+        heapq.heappush(self._heap, (priority, next(self._counter), record))
+
+    def pop(self) -> Tuple[int, Any]:
+        priority, _, record = heapq.heappop(self._heap)
+        return priority, record
+
+    def peek_priority(self) -> int:
+        """队首记录的优先级（队列非空时调用）"""
+        return self._heap[0][0]
+
+    def __len__(self):
+        return len(self._heap)
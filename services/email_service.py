@@ -1,15 +1,39 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
 import logging
 from datetime import datetime
+from config.settings import SMTP_TIMEOUT, SMTP_MAX_RECIPIENTS, SMTP_RCPT_RETRIES
 
 logger = logging.getLogger(__name__)
 
+# 汇总邮件中各表对应的告警中心名称
+SUMMARY_CENTERS = {
+    'audit_results': 'CDS网站内容检测中心',
+    'image_audit_results': '屏幕终端内容防护中心'
+}
+
+# 汇总邮件表头
+SUMMARY_COLUMN_LABELS = {
+    'id': '记录ID',
+    'verdict': '审计结果',
+    'audit_result': '审计结果',
+    'created_at': '发现时间',
+    'url': 'URL',
+    'reason': '原因',
+    'reasons': '原因',
+    'ip_address': 'IP地址',
+    'mac_address': 'MAC地址'
+}
+
 class EmailService:
     def __init__(self, smtp_config):
         self.smtp_config = smtp_config
+        # 最近一次渲染的邮件 (主题, 正文)，发送失败时用于暂存，恢复后无需重新渲染
+        self.last_rendered = None
+        # 最近一次发送中已被服务器接受的收件人，以及最终被拒收的收件人 {地址: (状态码, 信息)}
+        self.last_accepted = set()
+        self.last_refused = {}
+        # 最近一次发送失败的原因：unavailable 为SMTP服务不可用（连接、认证失败或临时错误），
+        # rejected 为这封邮件本身被拒（收件人全部被拒或 5xx），成功时为 None
+        self.last_failure = None
     
     def send_audit_alert(self, record, recipients):
         """发送审计结果告警邮件"""
@@ -84,44 +108,192 @@ class EmailService:
         
         return self._send_email(subject, html_content, recipients)
     
+    def send_summary_alert(self, table_name, records, recipients):
+        """发送汇总告警邮件（积压降载时用于低优先级记录）"""
+        center = SUMMARY_CENTERS.get(table_name, table_name)
+        columns = list(records[0]._fields) if records else []
+        
+        subject = f"【{center}告警汇总】{len(records)}条低优先级告警记录 - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        
+        header_cells = ''.join(
+            f'<th style="border: 1px solid #ddd; padding: 6px; background-color: #f5f5f5;">{SUMMARY_COLUMN_LABELS.get(column, column)}</th>'
+            for column in columns
+        )
+        rows = ''.join(
+            '<tr>' + ''.join(
+                f'<td style="border: 1px solid #ddd; padding: 6px;">{getattr(record, column) or "无"}</td>'
+                for column in columns
+            ) + '</tr>'
+            for record in records
+        )
+        
+        html_content = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 900px; margin: 0 auto;">
+                <h2 style="color: #ff9800;">📋 {center}告警汇总</h2>
+                <p>告警积压较多，以下 {len(records)} 条低优先级记录合并为一封邮件发送。</p>
+                
+                <table style="border-collapse: collapse; width: 100%; font-size: 13px;">
+                    <tr>{header_cells}</tr>
+                    {rows}
+                </table>
+                
+                <div style="margin-top: 20px; font-size: 12px; color: #666;">
+                    <p>此邮件由{center}告警系统自动发送，请勿回复。</p>
+                    <p>发送时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+        
+        return self._send_email(subject, html_content, recipients)
+    
+    def send_rendered(self, subject, content, recipients):
+        """发送已渲染的邮件（暂存补发）"""
+        return self._send_email(subject, content, recipients)
+    
     def _send_email(self, subject, content, recipients):
         """发送邮件 - 增强错误处理"""
+        # smtplib 与 MIME 模块在首次发送时才导入，缩短进程启动时间
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        from email.header import Header
+        
+        self.last_rendered = (subject, content)
+        self.last_accepted = set()
+        self.last_refused = {}
+        self.last_failure = 'rejected'
         if not recipients:
             logger.warning("没有配置收件人")
             return False
         
         try:
-            logger.info(f"准备发送邮件: {subject}")
-            logger.info(f"SMTP服务器: {self.smtp_config['server']}:{self.smtp_config['port']}")
+            logger.debug("准备发送邮件: %s", subject, extra={'sampled': True})
+            logger.debug("SMTP服务器: %s:%s", self.smtp_config['server'], self.smtp_config['port'],
+                         extra={'sampled': True})
             
             msg = MIMEMultipart()
             msg['From'] = self.smtp_config['username']
-            msg['To'] = ', '.join(recipients)
+            # 分批投递时同一份内容发给所有批次，To 不列出收件人，避免各收件人看到其他地址
+            msg['To'] = 'undisclosed-recipients:;'
             msg['Subject'] = Header(subject, 'utf-8')
             msg.attach(MIMEText(content, 'html', 'utf-8'))
+            # 只编码一次，各批收件人共用同一份字节内容
+            payload = msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
             
-            # 根据端口选择连接方式
-            if self.smtp_config['port'] == 465:
-                # SSL 连接
-                server = smtplib.SMTP_SSL(self.smtp_config['server'], self.smtp_config['port'])
-            else:
-                # TLS 连接
-                server = smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port'])
-                server.starttls()
-            
-            server.login(self.smtp_config['username'], self.smtp_config['password'])
-            server.send_message(msg)
-            server.quit()
+            server = self._connect()
+            self._deliver(server, payload, recipients)
             
-            logger.info(f"邮件发送成功: {subject}")
+            if not self.last_accepted:
+                logger.error(f"邮件发送失败，所有收件人均被拒收: {self.last_refused}")
+                return False
+            if self.last_refused:
+                logger.warning(f"部分收件人被拒收: {self.last_refused}")
+            logger.info("邮件发送成功: %s", subject)
+            self.last_failure = None
             return True
             
         except smtplib.SMTPAuthenticationError as e:
             logger.error(f"SMTP认证失败: {e} - 请检查用户名和密码")
+            self.last_failure = 'unavailable'
             return False
         except smtplib.SMTPConnectError as e:
             logger.error(f"SMTP连接失败: {e} - 请检查服务器和端口")
+            self.last_failure = 'unavailable'
             return False
         except Exception as e:
             logger.error(f"邮件发送失败: {type(e).__name__}: {e}")
-            return False
\ No newline at end of file
+            self.last_failure = self._classify_failure(e)
+            return False
+    
+    @staticmethod
+    def _classify_failure(error):
+        """区分SMTP服务不可用（断连、超时、4xx）与邮件本身被拒（5xx、内容编码等错误）"""
+        import smtplib
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return 'unavailable'
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 'unavailable' if 400 <= error.smtp_code < 500 else 'rejected'
+        if isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException):
+            return 'unavailable'
+        return 'rejected'
+    
+    def _connect(self):
+        """建立SMTP连接并登录"""
+        import smtplib
+        # 根据端口选择连接方式
+        if self.smtp_config['port'] == 465:
+            # SSL 连接
+            server = smtplib.SMTP_SSL(self.smtp_config['server'], self.smtp_config['port'], timeout=SMTP_TIMEOUT)
+        else:
+            # TLS 连接（starttls=False 时为明文连接，仅用于本地SMTP接收端）
+            server = smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port'], timeout=SMTP_TIMEOUT)
+            if self.smtp_config.get('starttls', True):
+                server.starttls()
+        
+        if self.smtp_config.get('password'):
+            server.login(self.smtp_config['username'], self.smtp_config['password'])
+        return server
+    
+    def _deliver(self, server, payload, recipients):
+        """分批投递同一份已编码的邮件并关闭连接，结果记录在 last_accepted / last_refused 中
+        
+        每批最多 SMTP_MAX_RECIPIENTS 个收件人；服务器以 452（收件人过多）拒收部分地址时，说明服务商的单封限制更低，
+        批次缩小为该批实际接受的数量，被拒的地址重新分批投递。其他临时拒收（4xx）的地址在所有批次完成后
+        单独重试 SMTP_RCPT_RETRIES 次，已接受的收件人不会重复投递；永久拒收（5xx）的地址不重试。
+        """
+        import smtplib
+        refused = self.last_refused
+        batch_size = SMTP_MAX_RECIPIENTS
+        pending = list(recipients)
+        completed = False
+        try:
+            for attempt in range(SMTP_RCPT_RETRIES + 1):
+                retry = []
+                while pending:
+                    batch, pending = pending[:batch_size], pending[batch_size:]
+                    try:
+                        rejected = server.sendmail(self.smtp_config['username'], batch, payload)
+                    except smtplib.SMTPRecipientsRefused as e:
+                        rejected = e.recipients
+                    accepted = [address for address in batch if address not in rejected]
+                    self.last_accepted.update(accepted)
+                    too_many = [address for address in batch if address in rejected and rejected[address][0] == 452]
+                    if too_many and accepted:
+                        batch_size = len(accepted)
+                        pending = too_many + pending
+                        rejected = {address: reply for address, reply in rejected.items() if address not in too_many}
+                        logger.info(f"服务器单封最多接受 {batch_size} 个收件人，按该数量重新分批")
+                    for address, (code, message) in rejected.items():
+                        refused[address] = (code, message.decode(errors='replace') if isinstance(message, bytes) else message)
+                        if 400 <= code < 500:
+                            retry.append(address)
+                if not retry or attempt == SMTP_RCPT_RETRIES:
+                    break
+                logger.info(f"{len(retry)} 个收件人被临时拒收，仅对这些地址重试")
+                for address in retry:
+                    refused.pop(address)
+                pending = retry
+            completed = True
+        finally:
+            # 中途出错（如后续批次 SMTPDataError）时直接关闭连接，不泄漏
+            if completed:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+            else:
+                server.close()
+        return refused
+    
+    def delivered(self, recipients):
+        """最近一次发送中已被服务器接受的收件人"""
+        return [address for address in recipients if address in self.last_accepted]
+    
+    def undelivered(self, recipients):
+        """最近一次发送中未被服务器接受、且未被永久拒收（5xx）的收件人（暂存补发时只需发给这些地址）"""
+        return [address for address in recipients
+                if address not in self.last_accepted and self.last_refused.get(address, (400,))[0] < 500]
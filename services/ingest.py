@@ -0,0 +1,129 @@
+"""
+推送接入 - 生产方直接推送新记录，放入有界队列后由后台线程投递，无需等待下一轮轮询扫描
+
+投递与轮询扫描共用 MonitorService 的发送与 email_sent_log 记录逻辑；
+同一 (表名, 记录ID, 审计结果) 在队列中只保留一条，已发送过的记录在投递前过滤。
+"""
+
+import os
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from services.monitor_service import MonitorService, TABLE_PIPELINES
+from config.settings import INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, SPOOL_DIR, SPOOL_REPLAY_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class IngestQueueFull(Exception):
+    """推送接入队列已满"""
+
+class IngestService:
+    def __init__(self, maxsize: int = INGEST_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.monitor_service = None
+        self._queue = deque()
+        self._keys = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {"accepted": 0, "duplicates": 0, "rejected": 0, "processed": 0, "sent": 0}
+
+    @staticmethod
+    def build_record(table_name: str, record_id: int, verdict: str, created_at: Optional[datetime] = None,
+                     data: Optional[Dict[str, Any]] = None):
+        """把推送内容转换为与扫描结果相同的行类型，未提供的字段为 None"""
+        pipeline = TABLE_PIPELINES.get(table_name)
+        if not pipeline:
+            raise ValueError(f"不支持的表: {table_name}")
+        record = {field: (data or {}).get(field) for field in pipeline['fields']}
+        record['id'] = record_id
+        record[pipeline['verdict_field']] = verdict
+        record['created_at'] = created_at or datetime.now()
+        return pipeline['row'](**record)
+
+    def submit(self, items: List[Tuple[str, Any]]) -> Tuple[int, int]:
+        """把 [(表名, 记录), ...] 放入队列，返回 (入队数, 重复数)
+
+        整批作为一个单位：队列剩余容量不足时整批都不入队并抛出 IngestQueueFull。
+        """
+        with self._cond:
+            new = []
+            keys = set()
+            for table_name, record in items:
+                key = (table_name, record.id, getattr(record, TABLE_PIPELINES[table_name]['verdict_field']))
+                if key in self._keys or key in keys:
+                    continue
+                keys.add(key)
+                new.append((key, table_name, record))
+            duplicates = len(items) - len(new)
+
+            if len(self._queue) + len(new) > self.maxsize:
+                self.stats["rejected"] += len(items)
+                raise IngestQueueFull()
+
+            self._queue.extend(new)
+            self._keys.update(keys)
+            self.stats["accepted"] += len(new)
+            self.stats["duplicates"] += duplicates
+            self._start_worker()
+            self._cond.notify()
+        return len(new), duplicates
+
+    def _start_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if self.monitor_service is None:
+            # 使用独立的暂存目录，避免与同机的监控进程共用
+            self.monitor_service = MonitorService(spool_dir=os.path.join(SPOOL_DIR, 'ingest') if SPOOL_DIR else None)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    # 空闲时补发/补写本地暂存的内容
+                    if not self._cond.wait(SPOOL_REPLAY_INTERVAL) and self.monitor_service.spool:
+                        self._cond.release()
+                        try:
+                            self.monitor_service.replay_spool()
+                        finally:
+                            self._cond.acquire()
+                if not self._queue:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(INGEST_BATCH_SIZE, len(self._queue)))]
+
+            by_table = {}
+            for key, table_name, record in batch:
+                by_table.setdefault(table_name, []).append(record)
+            try:
+                for table_name, records in by_table.items():
+                    self.stats["sent"] += self.monitor_service.deliver_ingested(table_name, records)
+            except Exception as e:
+                logger.error(f"推送记录投递失败: {e}")
+            finally:
+                with self._cond:
+                    self._keys.difference_update(key for key, _, _ in batch)
+                    self.stats["processed"] += len(batch)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """停止投递线程：先投递完队列中的记录，超时后停止发送（未发送的记录由轮询扫描补发）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if not self._thread:
+            return True
+        self._thread.join(timeout)
+        if self.monitor_service.spool:
+            self.monitor_service.spool.sync()
+        if self._thread.is_alive():
+            self.monitor_service.request_stop()
+            return False
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self.stats, "queue_size": len(self._queue), "queue_capacity": self.maxsize}
@@ -0,0 +1,235 @@
+"""
+日志轮转与时间索引 - 按大小/时间轮转并压缩归档，旁路索引记录时间戳到字节偏移的映射，
+检索时直接定位到时间范围对应的位置，无需从头扫描
+"""
+
+import glob
+import gzip
+import logging
+import logging.handlers
+import os
+import re
+import time
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_SUFFIX = '.idx'
+ARCHIVE_SUFFIX = '.gz'
+# 归档索引首行标记：偏移为各 gzip 成员在压缩文件中的起始位置
+MEMBER_INDEX_HEADER = '# gzip-members'
+_COPY_CHUNK = 64 * 1024
+
+_TIME_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
+_LEVEL_PATTERN = re.compile(r'\b(DEBUG|INFO|WARNING|ERROR|CRITICAL)\b')
+
+class IndexedRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """按大小或时间轮转的日志文件，归档使用gzip压缩，并为每个文件维护时间索引
+
+    索引文件为 <日志文件>.idx，每行 "时间戳 字节偏移"，每隔 index_interval 秒写入一条。
+    归档文件名为 <日志文件>.<YYYYmmdd-HHMMSS-微秒>.gz，对应索引为 <归档文件>.idx。
+    归档时每个索引区间单独压缩为一个 gzip 成员，归档索引记录成员的压缩偏移，
+    检索时可直接定位到成员起点解压，无需从文件头开始解压。
+    """
+
+    def __init__(self, filename, max_bytes=0, rotate_seconds=0, backup_count=0,
+                 index_interval=60, encoding='utf-8'):
+        super().__init__(filename, 'a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.index_interval = index_interval
+        self.index_path = self.baseFilename + INDEX_SUFFIX
+        self.last_index_time = 0
+        index = read_index(self.index_path)
+        self.opened_at = index[0][0] if index else time.time()
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.max_bytes and self._current_offset() >= self.max_bytes:
+            return True
+        if self.rotate_seconds and record.created - self.opened_at >= self.rotate_seconds:
+            return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        archive = f"{self.baseFilename}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ARCHIVE_SUFFIX}"
+        if os.path.exists(self.baseFilename):
+            members = _compress_members(self.baseFilename, archive, read_index(self.index_path))
+            with open(archive + INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(MEMBER_INDEX_HEADER + '\n')
+                for created, offset in members:
+                    f.write(f"{created:.3f} {offset}\n")
+            os.remove(self.baseFilename)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        self._prune_archives()
+
+        self.stream = self._open()
+        self.opened_at = time.time()
+        self.last_index_time = 0
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if record.created - self.last_index_time >= self.index_interval:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(f"{record.created:.3f} {self._current_offset()}\n")
+                self.last_index_time = record.created
+            logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+    def _current_offset(self):
+        # 每条日志写入后都会 flush，文件大小即当前写入偏移
+        return os.fstat(self.stream.fileno()).st_size
+
+    def _prune_archives(self):
+        if not self.backup_count:
+            return
+        archives = [path for path in list_log_files(self.baseFilename) if path.endswith(ARCHIVE_SUFFIX)]
+        for archive in archives[:max(0, len(archives) - self.backup_count)]:
+            for path in (archive, archive + INDEX_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def _compress_members(src_path: str, archive: str, index: List[Tuple[float, int]]) -> List[Tuple[float, int]]:
+    """按索引区间把日志文件压缩为多个 gzip 成员，返回 (时间戳, 成员压缩偏移) 列表"""
+    size = os.path.getsize(src_path)
+    starts = sorted({offset for _, offset in index if 0 < offset < size} | {0})
+    member_offsets = {}
+    with open(src_path, 'rb') as src, open(archive, 'wb') as dst:
+        for position, start in enumerate(starts):
+            end = starts[position + 1] if position + 1 < len(starts) else size
+            member_offsets[start] = dst.tell()
+            src.seek(start)
+            with gzip.GzipFile(fileobj=dst, mode='wb') as member:
+                remaining = end - start
+                while remaining > 0:
+                    chunk = src.read(min(_COPY_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    remaining -= len(chunk)
+    return [(created, member_offsets[offset]) for created, offset in index if offset in member_offsets]
+
+def _is_member_index(index_path: str) -> bool:
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return f.readline().strip() == MEMBER_INDEX_HEADER
+
+def read_index(index_path: str) -> List[Tuple[float, int]]:
+    """读取索引文件，返回按时间排序的 (时间戳, 偏移) 列表"""
+    entries = []
+    if not os.path.exists(index_path):
+        return entries
+    with open(index_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                try:
+                    entries.append((float(parts[0]), int(parts[1])))
+                except ValueError:
+                    continue
+    return entries
+
+def list_log_files(base_path: str) -> List[str]:
+    """列出日志文件及其归档，按时间从旧到新排序（当前文件在最后）"""
+    archives = sorted(glob.glob(glob.escape(base_path) + '.*' + ARCHIVE_SUFFIX))
+    if os.path.exists(base_path):
+        archives.append(base_path)
+    return archives
+
+def _parse_line_time(line: str) -> Optional[float]:
+    match = _TIME_PATTERN.search(line[:64])
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp()
+    except ValueError:
+        return None
+
+def search_log_file(path: str, start: Optional[float], end: Optional[float], level: Optional[str],
+                    keyword: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """在单个日志文件（或归档）中按时间范围、级别、关键字检索"""
+    index = read_index(path + INDEX_SUFFIX)
+    archived = path.endswith(ARCHIVE_SUFFIX)
+
+    # 整个文件都在时间范围之外时直接跳过
+    if end is not None and index and index[0][0] > end:
+        return []
+    if start is not None and os.path.getmtime(path) < start:
+        return []
+
+    # 定位到不晚于 start 的最后一个索引点
+    # 旧格式归档整体压缩为单个成员，只能从头顺序解压
+    offset = 0
+    seekable = not archived or _is_member_index(path + INDEX_SUFFIX)
+    if start is not None and index and seekable:
+        position = bisect_right([entry[0] for entry in index], start) - 1
+        if position >= 0:
+            offset = index[position][1]
+
+    results = []
+    with open(path, 'rb') as stream:
+        stream.seek(offset)
+        f = gzip.GzipFile(fileobj=stream, mode='rb') if archived else stream
+        current = None
+        for raw in f:
+            line = raw.decode('utf-8', errors='replace').rstrip('\n')
+            line_time = _parse_line_time(line)
+            if line_time is None:
+                # 无时间戳的行（如异常堆栈）归入上一条日志
+                if current is not None:
+                    current['line'] += '\n' + line
+                continue
+
+            if current is not None:
+                results.append(current)
+                current = None
+                if len(results) >= limit:
+                    break
+
+            if end is not None and line_time > end:
+                break
+            if start is not None and line_time < start:
+                continue
+            line_level = _LEVEL_PATTERN.search(line)
+            if level and (not line_level or line_level.group(1) != level):
+                continue
+            if keyword and keyword not in line:
+                continue
+            current = {
+                "file": os.path.basename(path),
+                "time": datetime.fromtimestamp(line_time).isoformat(),
+                "level": line_level.group(1) if line_level else None,
+                "line": line
+            }
+        if current is not None and len(results) < limit:
+            results.append(current)
+    return results
+
+def search_logs(base_paths: List[str], start: Optional[datetime] = None, end: Optional[datetime] = None,
+                level: Optional[str] = None, keyword: Optional[str] = None,
+                limit: int = 500) -> List[Dict[str, Any]]:
+    """在多个日志文件及其归档中检索，结果按时间排序"""
+    start_ts = start.timestamp() if start else None
+    end_ts = end.timestamp() if end else None
+    level = level.upper() if level else None
+
+    results = []
+    for base_path in base_paths:
+        for path in list_log_files(base_path):
+            remaining = limit - len(results)
+            if remaining <= 0:
+                break
+            results.extend(search_log_file(path, start_ts, end_ts, level, keyword, remaining))
+    results.sort(key=lambda item: item["time"])
+    return results[:limit]
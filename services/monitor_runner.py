@@ -0,0 +1,210 @@
+"""
+监控运行器 - 组装监控服务与调度器，供独立进程（monitor.py）和API内嵌模式共用
+"""
+
+import threading
+import time
+import logging
+from functools import partial
+from datetime import datetime
+from typing import Optional, Dict, Any
+from services.monitor_service import MonitorService, TABLE_PIPELINES
+from services.scheduler import MonitorScheduler
+from services.coordinator import ShardCoordinator
+from services.resource_history import ResourceHistory
+from config.settings import (
+    CONFIG_RELOAD_INTERVAL, CHECK_JITTER_SECONDS, MAX_CYCLE_SECONDS,
+    COORDINATION_ENABLED, COORDINATION_INTERVAL, SPOOL_DIR, SPOOL_REPLAY_INTERVAL,
+    RESOURCE_SAMPLE_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+class MonitorRunner:
+    def __init__(self, history_file=None):
+        self.monitor_service = None
+        # 资源使用历史（跨重启保留），history_file 为独立进程模式下供API读取的文件
+        self.history = ResourceHistory(path=history_file)
+        self.scheduler = None
+        self.coordinator = None
+        self.check_intervals = {}
+        self.thread = None
+        self.started_at = None
+        # 启动各阶段完成时间（time.time()），首轮检查完成后换算为启动耗时
+        self._startup_marks = {}
+        self._first_cycle_pending = set()
+        self._startup_lock = threading.Lock()
+        self.startup = None
+
+    def mark_startup(self, phase):
+        """记录启动阶段完成时间（monitor.py 记录 imports、db_ready，setup 记录 config_loaded、first_cycle）"""
+        self._startup_marks.setdefault(phase, time.time())
+
+    def _report_startup(self):
+        """首轮检查全部完成后记录启动耗时：独立进程从进程启动算起，内嵌模式从 setup 算起"""
+        if 'imports' in self._startup_marks:
+            import psutil
+            base = psutil.Process().create_time()
+        else:
+            base = self._startup_marks['setup']
+        self.startup = {phase: round(mark - base, 3) for phase, mark in
+                        sorted(self._startup_marks.items(), key=lambda item: item[1])}
+        logger.info(f"启动耗时（秒）: {self.startup}")
+
+    def setup(self) -> bool:
+        """创建监控服务与调度器并加载配置，每次启动都重新创建"""
+        self._startup_marks = {phase: mark for phase, mark in self._startup_marks.items()
+                               if phase in ('imports', 'db_ready')}
+        self.mark_startup('setup')
+        self._first_cycle_pending = set(TABLE_PIPELINES)
+        self.startup = None
+        self.monitor_service = MonitorService(spool_dir=SPOOL_DIR or None)
+
+        # 初始化配置
+        if not self.monitor_service.load_config():
+            logger.error("初始化配置加载失败")
+            return False
+        self.mark_startup('config_loaded')
+
+        # 获取检查间隔
+        self.check_intervals = {
+            table_name: self.monitor_service.get_check_interval_seconds(table_name)
+            for table_name in TABLE_PIPELINES
+        }
+
+        # 多实例部署：先领取一次分片，之后定期续约并再平衡
+        if COORDINATION_ENABLED:
+            self.coordinator = ShardCoordinator(TABLE_PIPELINES, instance_id=self.monitor_service.instance_id)
+            self.monitor_service.coordinator = self.coordinator
+            self.coordinator.rebalance()
+
+        # 每张表作为独立任务调度（独立线程、独立间隔与时长上限），启动后立即执行一次检查
+        self.scheduler = MonitorScheduler()
+        for table_name in TABLE_PIPELINES:
+            self.scheduler.add_job(
+                f'check:{table_name}',
+                partial(self._check_table, table_name),
+                partial(self.monitor_service.get_check_interval_seconds, table_name),
+                jitter=CHECK_JITTER_SECONDS,
+                max_duration=partial(self._get_max_cycle_seconds, table_name),
+                run_immediately=True
+            )
+        self.scheduler.add_job('reload', self.reload_interval, lambda: CONFIG_RELOAD_INTERVAL)
+        if RESOURCE_SAMPLE_INTERVAL > 0:
+            self.scheduler.add_job('sample', self.sample_resources, lambda: RESOURCE_SAMPLE_INTERVAL,
+                                   run_immediately=True)
+        if self.coordinator:
+            self.scheduler.add_job('coordinate', self.coordinator.rebalance, lambda: COORDINATION_INTERVAL)
+        if self.monitor_service.spool:
+            self.scheduler.add_job('spool', self.monitor_service.replay_spool, lambda: SPOOL_REPLAY_INTERVAL,
+                                   run_immediately=True)
+        return True
+
+    def _check_table(self, table_name, deadline=None):
+        """执行单张表的检查；所有表的首轮检查完成时记录启动耗时"""
+        try:
+            self.monitor_service.check_table(table_name, deadline)
+        finally:
+            with self._startup_lock:
+                first_cycle_done = table_name in self._first_cycle_pending
+                self._first_cycle_pending.discard(table_name)
+                first_cycle_done = first_cycle_done and not self._first_cycle_pending
+            if first_cycle_done:
+                self.mark_startup('first_cycle')
+                self._report_startup()
+
+    def _get_max_cycle_seconds(self, table_name):
+        return MAX_CYCLE_SECONDS or self.monitor_service.get_check_interval_seconds(table_name)
+
+    def sample_resources(self):
+        """采样资源使用情况，附带各表已完成的检查轮数和最近一轮耗时"""
+        cycles = {
+            table_name: {"cycles": stats["cycles"], "last_duration": stats["last_duration"]}
+            for table_name, stats in self.monitor_service.get_table_stats().items()
+        }
+        self.history.sample(cycles)
+
+    def reload_interval(self):
+        """重新读取系统配置（检查间隔、优先级规则等），检查间隔变化时立即重新调度"""
+        if not self.monitor_service.load_system_config():
+            return
+        for table_name, check_interval in list(self.check_intervals.items()):
+            new_interval = self.monitor_service.get_check_interval_seconds(table_name)
+            if new_interval != check_interval:
+                logger.info(f"{table_name} 检查间隔已变更: {check_interval}秒 -> {new_interval}秒，重新调度")
+                self.check_intervals[table_name] = new_interval
+                self.scheduler.reschedule(f'check:{table_name}')
+
+    def run(self):
+        """在当前线程中运行调度循环，直到 request_stop()/stop() 被调用"""
+        self.started_at = datetime.now()
+        logger.info(f"审计告警监控服务启动，各表检查间隔(秒): {self.check_intervals}")
+        self.scheduler.run()
+
+    def start(self) -> bool:
+        """在后台线程中启动监控（API内嵌模式）
+
+        上一次停止时未排空的检查仍在执行时拒绝启动，避免新旧两个调度器同时扫描发送。
+        """
+        if self.is_running():
+            return False
+        if not self.setup():
+            return False
+        self.thread = threading.Thread(target=self.run, name="embedded-monitor", daemon=True)
+        self.thread.start()
+        return True
+
+    def request_stop(self):
+        """请求停止：不再开始新的检查与发送（可在信号处理函数中调用）"""
+        if self.monitor_service:
+            self.monitor_service.request_stop()
+        if self.scheduler:
+            self.scheduler.request_stop()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """停止监控并等待当前检查完成，返回是否在超时前完成
+
+        未在超时前完成时保留调度器与线程，is_running() 仍为 True（状态为 stopping），可再次调用 stop() 继续等待。
+        """
+        if not self.scheduler:
+            return True
+        self.request_stop()
+        drained = self.scheduler.stop(timeout)
+        if self.thread:
+            self.thread.join(timeout)
+            if drained and not self.thread.is_alive():
+                self.thread = None
+        # 释放分片，其他实例可立即接管；仍有检查未结束时在其结束后再释放，避免重复发送
+        if self.coordinator:
+            if drained:
+                self.coordinator.close()
+            else:
+                threading.Thread(target=self.coordinator.close, name="coordinator-close", daemon=True).start()
+        if self.monitor_service.spool:
+            self.monitor_service.spool.sync()
+        return drained
+
+    def is_running(self) -> bool:
+        """调度线程仍在运行，或已请求停止但仍有检查未结束"""
+        return (self.thread is not None and self.thread.is_alive()) or self.is_stopping()
+
+    def is_stopping(self) -> bool:
+        """已请求停止但仍有检查未结束"""
+        return self.scheduler is not None and self.scheduler.is_stopped() and self.scheduler.has_running_jobs()
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取内嵌监控的运行状态"""
+        running = self.is_running()
+        return {
+            "is_running": running,
+            "status": ("stopping" if self.is_stopping() else "running") if running else "stopped",
+            "start_time": self.started_at.isoformat() if running and self.started_at else None,
+            "check_interval_seconds": self.check_intervals,
+            "jobs": self.scheduler.get_stats() if self.scheduler else {},
+            "tables": self.monitor_service.get_table_stats() if self.monitor_service else {},
+            "coordination": self.coordinator.get_status() if self.coordinator else None,
+            "spool": self.monitor_service.spool.get_stats() if self.monitor_service and self.monitor_service.spool else None,
+            "profile": self.monitor_service.get_profile_status() if self.monitor_service else None,
+            "startup": self.startup,
+            "resources": self.history.samples[-1] if self.history.samples else None
+        }
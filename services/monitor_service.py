@@ -1,56 +1,333 @@
+import json
 import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from contextlib import nullcontext
 from datetime import datetime
-from database.connection import db
+from database.connection import db, typed_row
 from services.email_service import EmailService
+from services.alert_stats import AlertStatsRollup
+from services.spool import AlertSpool
+from services.delivery_queue import DeliveryQueue, PriorityRules, PRIORITY_HIGH, PRIORITY_LOW
+from config.logging_config import set_log_level, set_log_sample_rate
+from config.settings import (
+    MIN_CHECK_INTERVAL_SECONDS, MAX_CHECK_INTERVAL_SECONDS,
+    SCAN_PAGE_SIZE, MAX_RECORDS_PER_CYCLE, MONITOR_MEMORY_LIMIT_MB,
+    SHED_BACKLOG_THRESHOLD, SUMMARY_BATCH_SIZE, DEFAULT_ALERT_PRIORITY,
+    SEND_CLAIM_TIMEOUT, MONITOR_INSTANCE_ID
+)
 
 logger = logging.getLogger(__name__)
 
+# 配置加载语句（启动与定期刷新时以管道模式一次往返发送）
+SMTP_CONFIG_QUERY = "SELECT * FROM smtp_config WHERE is_active = true ORDER BY created_at DESC LIMIT 1"
+RECIPIENTS_QUERY = "SELECT table_name, email FROM recipients_config WHERE is_active = true"
+SYSTEM_CONFIG_QUERY = "SELECT config_key, config_value FROM system_config"
+
+# 写入发送记录的同时删除该记录的发送认领：已写入发送记录的记录不会再被认领，认领行不再需要保留
+SENT_LOG_INSERT = """
+WITH logged AS (
+    INSERT INTO email_sent_log (table_name, record_id, verdict, recipients)
+    VALUES (%s, %s, %s, %s)
+    RETURNING table_name, record_id, verdict
+)
+DELETE FROM email_send_claims esc
+USING logged l
+WHERE esc.table_name = l.table_name AND esc.record_id = l.record_id AND esc.verdict = l.verdict
+"""
+
+# 发送前认领记录：已写入发送记录的不认领；已有认领时只有超时、未进入本地暂存且不是死信的才能被重新认领
+# 同一 (table_name, record_id, verdict) 并发认领时只有一方返回该行
+SEND_CLAIM_INSERT = """
+INSERT INTO email_send_claims (table_name, record_id, verdict, instance_id)
+SELECT %s, k.record_id, k.verdict, %s
+FROM unnest(%s::integer[], %s::varchar[]) AS k(record_id, verdict)
+WHERE NOT EXISTS (
+    SELECT 1 FROM email_sent_log esl
+    WHERE esl.table_name = %s AND esl.record_id = k.record_id AND esl.verdict = k.verdict
+)
+ON CONFLICT (table_name, record_id, verdict) DO UPDATE
+SET instance_id = EXCLUDED.instance_id, claimed_at = CURRENT_TIMESTAMP, spooled = false
+WHERE NOT email_send_claims.spooled AND NOT email_send_claims.dead
+AND email_send_claims.claimed_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+RETURNING record_id, verdict
+"""
+SEND_CLAIM_RELEASE = """
+DELETE FROM email_send_claims
+WHERE table_name = %s AND instance_id = %s AND (record_id, verdict) IN (
+    SELECT * FROM unnest(%s::integer[], %s::varchar[])
+)
+"""
+SEND_CLAIM_SPOOLED = """
+UPDATE email_send_claims SET spooled = true
+WHERE table_name = %s AND instance_id = %s AND (record_id, verdict) IN (
+    SELECT * FROM unnest(%s::integer[], %s::varchar[])
+)
+"""
+# 暂存邮件移入死信 / 死信被丢弃：认领标记为死信，不再被认领（本实例接管，重启后实例标识可能已变化）
+SEND_CLAIM_DEAD = """
+UPDATE email_send_claims esc SET spooled = false, dead = true, instance_id = owner.instance_id
+FROM (SELECT %s::varchar AS table_name, %s::varchar AS instance_id) owner
+WHERE esc.table_name = owner.table_name AND (esc.record_id, esc.verdict) IN (
+    SELECT * FROM unnest(%s::integer[], %s::varchar[])
+)
+"""
+# 死信重新入队补发：认领恢复为已暂存
+SEND_CLAIM_REQUEUE = """
+UPDATE email_send_claims esc
+SET spooled = true, dead = false, instance_id = owner.instance_id, claimed_at = CURRENT_TIMESTAMP
+FROM (SELECT %s::varchar AS table_name, %s::varchar AS instance_id) owner
+WHERE esc.table_name = owner.table_name AND (esc.record_id, esc.verdict) IN (
+    SELECT * FROM unnest(%s::integer[], %s::varchar[])
+)
+"""
+
+# 待发送记录的行类型：扫描结果直接构造为该类型（不经过字典），原样传给 send 方法解包渲染
+AuditRecord = namedtuple('AuditRecord', ('id', 'verdict', 'created_at', 'url', 'reason'))
+ImageAuditRecord = namedtuple('ImageAuditRecord',
+                              ('id', 'audit_result', 'created_at', 'ip_address', 'mac_address', 'reasons'))
+
+# 被监控表的流水线配置：每张表独立扫描、独立调度，互不影响
+# query 需包含 {shard}、{keyset} 占位符和 LIMIT %s，查询列与 row 的字段一致；fields 为传给 send 方法的记录字段顺序
+# query 排除已写入 email_sent_log 和仍有效的发送认领（第一个参数为认领超时秒数）
+# alert_verdicts 为需要告警的审计结果（推送接入时使用，需与 query 中的过滤条件一致）
+TABLE_PIPELINES = {
+    'audit_results': {
+        'alias': 'ar',
+        'verdict_field': 'verdict',
+        'alert_verdicts': ('不合规',),
+        'row': AuditRecord,
+        'fields': AuditRecord._fields,
+        'send': 'send_audit_alert',
+        'query': """
+        SELECT ar.id, ar.verdict, ar.created_at, ar.url, ar.reason
+        FROM audit_results ar
+        LEFT JOIN email_sent_log esl ON (
+            esl.table_name = 'audit_results'
+            AND esl.record_id = ar.id
+            AND esl.verdict = ar.verdict
+        )
+        WHERE ar.verdict IN ('不合规')
+        AND esl.id IS NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM email_send_claims esc
+            WHERE esc.table_name = 'audit_results'
+            AND esc.record_id = ar.id
+            AND esc.verdict = ar.verdict
+            AND (esc.spooled OR esc.dead OR esc.claimed_at > CURRENT_TIMESTAMP - make_interval(secs => %s))
+        )
+        {shard}
+        {keyset}
+        ORDER BY ar.created_at DESC, ar.id DESC
+        LIMIT %s
+        """
+    },
+    'image_audit_results': {
+        'alias': 'iar',
+        'verdict_field': 'audit_result',
+        'alert_verdicts': ('不合规',),
+        'row': ImageAuditRecord,
+        'fields': ImageAuditRecord._fields,
+        'send': 'send_image_alert',
+        # or WHERE iar.audit_result IN ('不合规', '不确定')
+        'query': """
+        SELECT iar.id, iar.audit_result, iar.created_at, iar.ip_address, iar.mac_address, iar.reasons
+        FROM image_audit_results iar
+        LEFT JOIN email_sent_log esl ON (
+            esl.table_name = 'image_audit_results'
+            AND esl.record_id = iar.id
+            AND esl.verdict = iar.audit_result
+        )
+        WHERE iar.audit_result IN ('不合规')
+        AND esl.id IS NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM email_send_claims esc
+            WHERE esc.table_name = 'image_audit_results'
+            AND esc.record_id = iar.id
+            AND esc.verdict = iar.audit_result
+            AND (esc.spooled OR esc.dead OR esc.claimed_at > CURRENT_TIMESTAMP - make_interval(secs => %s))
+        )
+        {shard}
+        {keyset}
+        ORDER BY iar.created_at DESC, iar.id DESC
+        LIMIT %s
+        """
+    }
+}
+
 class MonitorService:
-    def __init__(self):
+    def __init__(self, spool_dir=None):
         self.smtp_config = None
         self.recipients = {}
         self.system_config = {}
+        self.priority_rules = PriorityRules(default=DEFAULT_ALERT_PRIORITY)
         self.last_config_update = None
+        self.table_stats = {table_name: self._new_table_stats() for table_name in TABLE_PIPELINES}
+        self.alert_stats = AlertStatsRollup()
+        # 多实例协调器（未开启时为 None，本实例扫描全部记录）
+        self.coordinator = None
+        # 发送认领使用的实例标识（与多实例协调器一致）
+        self.instance_id = MONITOR_INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        # 本地暂存（数据库或SMTP不可用时暂存，恢复后补发/补写），未指定目录时不启用
+        self.spool = AlertSpool(spool_dir) if spool_dir else None
+        # 按需性能分析（system_config 中的 profile_request 触发），未开启时为 None
+        self.profiler = None
+        self._profile_request_id = None
+        self._spool_request_id = None
+        self._stop_event = threading.Event()
+        self._config_lock = threading.Lock()
     
     def load_config(self):
-        """加载配置"""
+        """加载配置（SMTP、收件人、系统配置三条查询以管道模式一次往返发送）"""
         try:
+            results = db.execute_pipeline([
+                (SMTP_CONFIG_QUERY, None),
+                (RECIPIENTS_QUERY, None),
+                (SYSTEM_CONFIG_QUERY, None)
+            ])
+            if results is None:
+                return False
+            smtp_result, recipients_result, config_result = results
+            
             # 加载SMTP配置
-            smtp_query = "SELECT * FROM smtp_config WHERE is_active = true ORDER BY created_at DESC LIMIT 1"
-            smtp_result = db.execute_query(smtp_query)
             if smtp_result:
                 self.smtp_config = smtp_result[0]
             else:
                 logger.error("未找到激活的SMTP配置")
                 return False
             
-            # 加载收件人配置
-            recipients_query = "SELECT table_name, email FROM recipients_config WHERE is_active = true"
-            recipients_result = db.execute_query(recipients_query)
-            
-            self.recipients = {}
+            # 加载收件人配置（先构建完整结果再替换，避免其他表的流水线读到中间状态）
+            # 同一地址配置了多条记录时只保留一个（不区分大小写），避免同一封邮件重复投递
+            recipients = {}
+            seen = {}
             if recipients_result:
                 for recipient in recipients_result:
                     table_name = recipient['table_name']
-                    if table_name not in self.recipients:
-                        self.recipients[table_name] = []
-                    self.recipients[table_name].append(recipient['email'])
+                    email = recipient['email'].strip()
+                    if table_name not in recipients:
+                        recipients[table_name] = []
+                        seen[table_name] = set()
+                    if email.lower() not in seen[table_name]:
+                        seen[table_name].add(email.lower())
+                        recipients[table_name].append(email)
+            self.recipients = recipients
             
             # 加载系统配置
-            config_query = "SELECT config_key, config_value FROM system_config"
-            config_result = db.execute_query(config_query)
-            if config_result:
-                self.system_config = {config['config_key']: config['config_value'] 
-                                    for config in config_result}
+            self._apply_system_config(config_result)
             
             self.last_config_update = datetime.now()
             logger.info("配置加载成功")
             return True
-            
+        
         except Exception as e:
             logger.error(f"配置加载失败: {e}")
             return False
     
+    def refresh_config(self):
+        """配置超过5分钟未更新时重新加载，多条流水线并发调用时只加载一次"""
+        with self._config_lock:
+            if (not self.last_config_update or
+                (datetime.now() - self.last_config_update).total_seconds() > 300):
+                return self.load_config()
+            return True
+    
+    def load_system_config(self):
+        """仅加载系统配置（开销很小，用于热更新检查间隔等参数）"""
+        return self._apply_system_config(db.execute_prepared(SYSTEM_CONFIG_QUERY))
+    
+    def _apply_system_config(self, config_result):
+        if config_result:
+            self.system_config = {config['config_key']: config['config_value']
+                                for config in config_result}
+            self.priority_rules = PriorityRules.from_config(
+                self.system_config.get('alert_priority_rules'), DEFAULT_ALERT_PRIORITY)
+            
+            # 日志级别与明细日志采样比例支持运行时调整
+            if 'log_level' in self.system_config:
+                set_log_level(self.system_config['log_level'])
+            if 'log_sample_rate' in self.system_config:
+                set_log_sample_rate(self.system_config['log_sample_rate'])
+            if self.system_config.get('profile_request'):
+                self._apply_profile_request(self.system_config['profile_request'])
+            if self.system_config.get('spool_request'):
+                self._apply_spool_request(self.system_config['spool_request'])
+            return True
+        return False
+    
+    def _apply_profile_request(self, value):
+        """收到新的性能分析请求（JSON: {"id": ..., "cycles": N}）时开始分析接下来 N 轮检查，已完成的请求不再执行"""
+        try:
+            request = json.loads(value)
+            request_id, cycles = str(request['id']), int(request['cycles'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"性能分析请求格式错误: {value}")
+            return
+        if request_id == self._profile_request_id or cycles <= 0:
+            return
+        self._profile_request_id = request_id
+        from services.profiler import is_request_done
+        if not is_request_done(request_id):
+            self.start_profiling(request_id, cycles)
+    
+    def _apply_spool_request(self, value):
+        """收到新的死信处理请求（JSON: {"id": ..., "action": "requeue"|"drop", "up_to": 序号或null}）时处理死信
+
+        处理的是序号不大于 up_to 的死信，已处理过的死信不在待处理范围内，重复执行同一请求不会重复处理。
+        """
+        try:
+            request = json.loads(value)
+            request_id, action, up_to = str(request['id']), request['action'], request.get('up_to')
+            up_to = int(up_to) if up_to is not None else None
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"死信处理请求格式错误: {value}")
+            return
+        if request_id == self._spool_request_id or not self.spool:
+            return
+        self._spool_request_id = request_id
+        if action == 'requeue':
+            self._update_claims(SEND_CLAIM_REQUEUE, self.spool.requeue_dead_letters(up_to))
+        elif action == 'drop':
+            self._update_claims(SEND_CLAIM_DEAD, self.spool.drop_dead_letters(up_to))
+        else:
+            logger.warning(f"未知的死信处理操作: {action}")
+    
+    def start_profiling(self, request_id, cycles):
+        """分析接下来 cycles 轮表检查（正在进行的分析被替换）"""
+        # cProfile/tracemalloc 只在请求分析时才导入
+        from services.profiler import CycleProfiler
+        if self.profiler and not self.profiler.done:
+            logger.warning(f"性能分析 {self.profiler.request_id} 未完成即被新的请求替换")
+            # 先卸载旧分析的计时钩子，避免新钩子包裹旧钩子、旧分析结束时又卸载掉新钩子
+            self.profiler.close("被新的分析请求替换")
+        self.profiler = CycleProfiler(request_id, cycles, self)
+        logger.info(f"开始性能分析 {request_id}：接下来 {cycles} 轮检查")
+    
+    def get_profile_status(self):
+        """最近一次性能分析的进度与结果文件，未开启过时为 None"""
+        return self.profiler.get_status() if self.profiler else None
+    
+    def get_check_interval_seconds(self, table_name=None):
+        """获取检查间隔（秒），check_interval 以分钟存储，支持小数（如0.5表示30秒）
+        
+        可通过 check_interval.<表名> 为单张表单独配置，未配置时使用全局 check_interval。
+        """
+        value = self.system_config.get(f'check_interval.{table_name}') if table_name else None
+        try:
+            seconds = float(value or self.system_config.get('check_interval', '5')) * 60
+        except ValueError:
+            seconds = 300
+        return min(max(seconds, MIN_CHECK_INTERVAL_SECONDS), MAX_CHECK_INTERVAL_SECONDS)
+    
+    def get_max_records_per_cycle(self, table_name):
+        """获取单张表每轮最多处理的记录数，可通过 max_records_per_cycle.<表名> 单独配置"""
+        try:
+            return int(self.system_config.get(f'max_records_per_cycle.{table_name}', MAX_RECORDS_PER_CYCLE))
+        except ValueError:
+            return MAX_RECORDS_PER_CYCLE
+    
     def is_monitor_enabled(self):
         """检查监控是否启用"""
         return self.system_config.get('monitor_enabled', 'false').lower() == 'true'
@@ -59,105 +336,451 @@ class MonitorService:
         """检查邮件发送是否启用"""
         return self.system_config.get('email_enabled', 'false').lower() == 'true'
     
-    def check_audit_results(self):
-        """检查audit_results表"""
-        if not self.is_monitor_enabled():
-            return
+    def request_stop(self):
+        """请求停止：当前邮件发送并记录完成后，不再处理剩余记录"""
+        self._stop_event.set()
+    
+    def _should_stop(self, deadline):
+        """是否应停止处理剩余记录（收到停止请求或达到本轮时长上限）"""
+        return self._stop_event.is_set() or self._deadline_reached(deadline)
+    
+    def _deadline_reached(self, deadline):
+        """本轮检查是否已超过时长上限（deadline 为 time.monotonic() 时间）"""
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.warning("本轮检查已达到时长上限，剩余记录留待下一轮处理")
+            return True
+        return False
+    
+    def _memory_limit_reached(self):
+        """监控进程内存（RSS）是否超过上限"""
+        if not MONITOR_MEMORY_LIMIT_MB:
+            return False
+        import psutil
+        rss_mb = psutil.Process().memory_info().rss / 1024 / 1024
+        if rss_mb >= MONITOR_MEMORY_LIMIT_MB:
+            logger.warning(f"监控进程内存 {rss_mb:.0f}MB 已达到上限 {MONITOR_MEMORY_LIMIT_MB}MB，剩余记录留待下一轮处理")
+            return True
+        return False
+    
+    def _iter_pending_pages(self, query, alias, max_records, table_name, shard=None):
+        """按 (created_at, id) 键集分页流式读取待发送记录，每页取回后即可开始发送
+        
+        query 需包含 {shard}、{keyset} 占位符和 LIMIT %s（第一个参数为认领超时），alias 为被监控表的别名，
+        记录为该表流水线的行类型。
+        每轮最多读取 max_records 条（0 表示不限制），内存超过上限时提前结束。
+        shard 为分片号时只读取 id 落在该分片的记录，且每页读取前确认分片仍由本实例持有。
+        """
+        shard_sql, shard_params = self._shard_filter(alias, shard)
+        row_factory = typed_row(TABLE_PIPELINES[table_name]['row'])
+        fetched = 0
+        last_key = None
+        while not max_records or fetched < max_records:
+            if shard is not None and not self.coordinator.owns(table_name, shard):
+                logger.warning(f"{table_name} 分片 {shard} 已不再由本实例持有，停止扫描")
+                return
             
-        query = """
-        SELECT ar.id, ar.verdict, ar.created_at, ar.url, ar.reason
-        FROM audit_results ar
-        LEFT JOIN email_sent_log esl ON (
-            esl.table_name = 'audit_results' 
-            AND esl.record_id = ar.id 
-            AND esl.verdict = ar.verdict
-        )
-        WHERE ar.verdict IN ('不合规') 
-        AND esl.id IS NULL
-        ORDER BY ar.created_at DESC
+            limit = SCAN_PAGE_SIZE
+            if max_records:
+                limit = min(limit, max_records - fetched)
+            
+            if last_key is None:
+                page = self._fetch_page(query.format(shard=shard_sql, keyset=''), (*shard_params, limit),
+                                        row_factory)
+            else:
+                keyset = f"AND ({alias}.created_at, {alias}.id) < (%s, %s)"
+                page = self._fetch_page(query.format(shard=shard_sql, keyset=keyset),
+                                        (*shard_params, *last_key, limit), row_factory)
+            if not page:
+                return
+            
+            yield page
+            
+            fetched += len(page)
+            if len(page) < limit or self._memory_limit_reached():
+                return
+            last_key = (page[-1].created_at, page[-1].id)
+        
+        logger.info(f"本轮已读取 {fetched} 条记录，达到单轮上限，剩余记录留待下一轮处理")
+    
+    def _shard_filter(self, alias, shard):
+        """分片过滤条件及 {keyset} 之前的查询参数（认领超时、分片参数）"""
+        if shard is not None and self.coordinator.shard_count > 1:
+            return f"AND MOD({alias}.id, %s) = %s", (SEND_CLAIM_TIMEOUT, self.coordinator.shard_count, shard)
+        return '', (SEND_CLAIM_TIMEOUT,)
+    
+    def _backlog_reached(self, query, alias, shard=None):
+        """待发送记录（不受单轮上限限制）是否达到 SHED_BACKLOG_THRESHOLD，查询失败时返回 None
+        
+        复用扫描查询并以阈值为 LIMIT 计数，最多读取阈值条索引项，不必统计全部积压。
         """
+        shard_sql, shard_params = self._shard_filter(alias, shard)
+        rows = db.execute_prepared(
+            f"SELECT COUNT(*) AS count FROM ({query.format(shard=shard_sql, keyset='')}) AS backlog",
+            (*shard_params, SHED_BACKLOG_THRESHOLD)
+        )
+        if not rows:
+            return None
+        return rows[0]['count'] >= SHED_BACKLOG_THRESHOLD
+    
+    def _fetch_page(self, query, params, row_factory=None):
+        """读取一页待发送记录"""
+        return db.execute_prepared(query, params, row_factory)
+    
+    def _deliver_records(self, table_name, email_service, recipients, deadline, shard=None):
+        """按优先级投递待发送记录（shard 为分片号时只处理该分片）
         
-        records = db.execute_query(query)
-        if not records:
-            return
+        高优先级记录随页取回立即发送；其余记录在本轮扫描完成后（队列中已有本轮全部记录）按优先级发送，
+        后面页中的高优先级记录不会等待前面页的普通/低优先级记录。待发送积压（按查询计数，不受单轮上限限制）
+        达到 SHED_BACKLOG_THRESHOLD 时，低优先级记录改为汇总邮件（每封最多 SUMMARY_BATCH_SIZE 条），
+        高优先级记录仍逐条发送。
+        """
+        pipeline = TABLE_PIPELINES[table_name]
+        verdict_field = pipeline['verdict_field']
+        stats = self.table_stats[table_name]
+        queue = DeliveryQueue()
+        summary = []
+        seen = 0
+        overloaded = self._backlog_reached(pipeline['query'], pipeline['alias'], shard) \
+            if SHED_BACKLOG_THRESHOLD else False
         
-        recipients = self.recipients.get('audit_results', [])
-        if not recipients:
-            logger.warning("未配置audit_results表的收件人")
-            return
+        pages = self._iter_pending_pages(pipeline['query'], pipeline['alias'],
+                                         self.get_max_records_per_cycle(table_name), table_name, shard)
+        for page in pages:
+            seen += len(page)
+            stats['scanned'] += len(page)
+            for record in page:
+                # 已在本地暂存中等待补发/补写的记录不再重复发送
+                verdict = getattr(record, verdict_field)
+                if self.spool and self.spool.is_pending(table_name, record.id, verdict):
+                    continue
+                queue.push(self.priority_rules.classify(table_name, verdict, record), record)
+            
+            stop = self._should_stop(deadline)
+            while not stop and queue and queue.peek_priority() == PRIORITY_HIGH:
+                _, record = queue.pop()
+                self._send_record(table_name, email_service, record, recipients)
+                stop = self._should_stop(deadline)
+            
+            # 收到停止请求或达到时长上限，剩余记录留待下一轮
+            if stop:
+                return
         
-        if self.is_email_enabled() and self.smtp_config:
-            email_service = EmailService(self.smtp_config)
+        # 积压计数查询失败时按本轮读取的记录数判断
+        if overloaded is None:
+            overloaded = seen >= SHED_BACKLOG_THRESHOLD
+        while queue and not self._should_stop(deadline):
+            priority, record = queue.pop()
+            if overloaded and priority >= PRIORITY_LOW:
+                summary.append(record)
+                if len(summary) >= SUMMARY_BATCH_SIZE:
+                    self._send_summary(table_name, email_service, summary, recipients)
+                    summary = []
+                continue
             
-            for record in records:
-                # 确保传递正确的字段值
-                logger.info(f"the record format is {record}, type is {type(record)}")
-                record_data = (record['id'], record['verdict'], record['created_at'], 
-                            record['url'], record['reason'])
-                if email_service.send_audit_alert(record_data, recipients):
-                    self._log_sent_email('audit_results', record['id'], record['verdict'], recipients)
-    
-    def check_image_audit_results(self):
-        """检查image_audit_results表"""
-        if not self.is_monitor_enabled():
-            return
-        # or WHERE iar.audit_result IN ('不合规', '不确定')    
-        query = """
-        SELECT iar.id, iar.audit_result, iar.created_at, iar.ip_address, iar.mac_address, iar.reasons
-        FROM image_audit_results iar
-        LEFT JOIN email_sent_log esl ON (
-            esl.table_name = 'image_audit_results' 
-            AND esl.record_id = iar.id 
-            AND esl.verdict = iar.audit_result
-        )
-        WHERE iar.audit_result IN ('不合规') 
-        AND esl.id IS NULL
-        ORDER BY iar.created_at DESC
+            self._send_record(table_name, email_service, record, recipients)
+        
+        if summary:
+            self._send_summary(table_name, email_service, summary, recipients)
+    
+    def _send_record(self, table_name, email_service, record, recipients):
+        """逐条发送一条记录的告警，成功后写入 email_sent_log，返回是否发送成功
+        
+        发送前先认领记录，已被其他发送方（推送接入、其他实例）认领或已发送的记录直接跳过。
         """
+        pipeline = TABLE_PIPELINES[table_name]
+        verdict = getattr(record, pipeline['verdict_field'])
+        stats = self.table_stats[table_name]
+        if (record.id, verdict) not in self._claim_records(table_name, [(record.id, verdict)]):
+            logger.debug(f"{table_name} 记录 {record.id} 已由其他发送方处理，跳过")
+            return False
         
-        records = db.execute_query(query)
+        logger.debug("待发送记录: %s", record, extra={'sampled': True})
+        if getattr(email_service, pipeline['send'])(record, recipients):
+            stats['sent'] += 1
+            self._log_sent_email(table_name, record.id, verdict, email_service.delivered(recipients))
+            self.alert_stats.record(table_name, verdict, 'sent')
+            # 部分收件人被临时拒收且重试后仍未接受，只对这些地址暂存补发
+            self._spool_message(email_service, recipients, [(table_name, record.id, verdict)], partial=True)
+            return True
+        stats['failed'] += 1
+        self.alert_stats.record(table_name, verdict, 'failed')
+        self._spool_message(email_service, recipients, [(table_name, record.id, verdict)])
+        return False
+    
+    def deliver_ingested(self, table_name, records):
+        """投递推送接入的记录，与轮询扫描共用发送与 email_sent_log 记录逻辑，返回发送成功数
+        
+        只处理审计结果在 alert_verdicts 中且尚未发送过的记录；与轮询扫描通过发送认领互斥，同一条记录只发送一次。
+        发送失败的记录释放认领（或进入本地暂存），由轮询扫描或暂存补发。
+        """
+        if not self.refresh_config() or not self.is_monitor_enabled():
+            return 0
+        if not (self.is_email_enabled() and self.smtp_config):
+            return 0
+        recipients = self.recipients.get(table_name, [])
+        if not recipients:
+            logger.warning(f"未配置{table_name}表的收件人")
+            return 0
+        
+        pipeline = TABLE_PIPELINES[table_name]
+        verdict_field = pipeline['verdict_field']
+        records = [record for record in records if getattr(record, verdict_field) in pipeline['alert_verdicts']]
+        records = self._filter_unsent(table_name, records)
+        if not records:
+            return 0
+        
+        email_service = EmailService(self.smtp_config)
+        queue = DeliveryQueue()
+        for record in records:
+            queue.push(self.priority_rules.classify(table_name, getattr(record, verdict_field), record), record)
+        sent = 0
+        try:
+            while queue and not self._stop_event.is_set():
+                _, record = queue.pop()
+                if self._send_record(table_name, email_service, record, recipients):
+                    sent += 1
+        finally:
+            self.alert_stats.flush()
+        return sent
+    
+    def _filter_unsent(self, table_name, records):
+        """过滤掉 email_sent_log 中已有的 (record_id, verdict)，查询失败时不发送（留给轮询扫描）
+        
+        只是减少无效认领的预过滤，发送前仍以 _claim_records 的原子认领为准。
+        """
+        if not records:
+            return records
+        verdict_field = TABLE_PIPELINES[table_name]['verdict_field']
+        query = "SELECT record_id, verdict FROM email_sent_log WHERE table_name = %s AND record_id = ANY(%s)"
+        rows = db.execute_prepared(query, (table_name, [record.id for record in records]))
+        if rows is None:
+            return []
+        sent = {(row['record_id'], row['verdict']) for row in rows}
+        return [record for record in records if (record.id, getattr(record, verdict_field)) not in sent
+                and not (self.spool and self.spool.is_pending(table_name, record.id, getattr(record, verdict_field)))]
+    
+    def _send_summary(self, table_name, email_service, records, recipients):
+        """发送低优先级记录汇总邮件并批量记录（只包含本实例认领成功的记录）"""
+        verdict_field = TABLE_PIPELINES[table_name]['verdict_field']
+        stats = self.table_stats[table_name]
+        claimed = self._claim_records(table_name, [(record.id, getattr(record, verdict_field)) for record in records])
+        records = [record for record in records if (record.id, getattr(record, verdict_field)) in claimed]
         if not records:
             return
+        logger.info(f"积压超过阈值，{table_name} 的 {len(records)} 条低优先级记录以汇总邮件发送")
+        if email_service.send_summary_alert(table_name, records, recipients):
+            stats['summarized'] += len(records)
+            self._log_sent_emails(table_name, [(record.id, getattr(record, verdict_field)) for record in records],
+                                  email_service.delivered(recipients))
+            self._spool_message(email_service, recipients,
+                                [(table_name, record.id, getattr(record, verdict_field)) for record in records],
+                                partial=True)
+            outcome = 'summarized'
+        else:
+            stats['failed'] += len(records)
+            outcome = 'failed'
+            self._spool_message(email_service, recipients,
+                                [(table_name, record.id, getattr(record, verdict_field)) for record in records])
+        for record in records:
+            self.alert_stats.record(table_name, getattr(record, verdict_field), outcome)
+    
+    def check_table(self, table_name, deadline=None):
+        """执行单张表的检查流水线，deadline 为本轮时长上限（time.monotonic() 时间）"""
+        profiler = self.profiler
+        if profiler is None or profiler.done:
+            return self._check_table(table_name, deadline)
+        with profiler.cycle(table_name):
+            return self._check_table(table_name, deadline)
+    
+    def _check_table(self, table_name, deadline=None):
+        """单张表的检查流水线（check_table 按需在外层包裹性能分析）"""
+        if not self.refresh_config():
+            logger.error(f"配置加载失败，跳过 {table_name} 本次检查")
+            return
+        
+        if not self.is_monitor_enabled():
+            return
         
-        recipients = self.recipients.get('image_audit_results', [])
+        recipients = self.recipients.get(table_name, [])
         if not recipients:
-            logger.warning("未配置image_audit_results表的收件人")
+            logger.warning(f"未配置{table_name}表的收件人")
             return
         
         if self.is_email_enabled() and self.smtp_config:
-            email_service = EmailService(self.smtp_config)
-            
-            for record in records:
-                # 确保传递正确的字段值
-                logger.info(f"the record format is {record}, type is {type(record)}")
-                record_data = (record['id'], record['audit_result'], record['created_at'], 
-                            record['ip_address'], record['mac_address'], record['reasons'])
-                if email_service.send_image_alert(record_data, recipients):
-                    self._log_sent_email('image_audit_results', record['id'], record['audit_result'], recipients)
+            stats = self.table_stats[table_name]
+            start = time.monotonic()
+            try:
+                email_service = EmailService(self.smtp_config)
+                if self.profiler and not self.profiler.done:
+                    self.profiler.instrument(email_service)
+                # 多实例部署时只处理本实例持有的分片，扫描期间分片不会被再平衡释放
+                with self.coordinator.hold(table_name) if self.coordinator else nullcontext():
+                    shards = self.coordinator.owned_shards(table_name) if self.coordinator else [None]
+                    for shard in shards:
+                        if self._should_stop(deadline):
+                            break
+                        self._deliver_records(table_name, email_service, recipients, deadline, shard)
+                stats['last_error'] = None
+            except Exception as e:
+                stats['last_error'] = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                stats['cycles'] += 1
+                stats['last_cycle_at'] = datetime.now().isoformat()
+                stats['last_duration'] = time.monotonic() - start
+                # 本轮发送结果批量合并到统计汇总表，暂存内容刷盘
+                self.alert_stats.flush()
+                if self.spool:
+                    self.spool.sync()
+    
+    def check_audit_results(self, deadline=None):
+        """检查audit_results表"""
+        self.check_table('audit_results', deadline)
+    
+    def check_image_audit_results(self, deadline=None):
+        """检查image_audit_results表"""
+        self.check_table('image_audit_results', deadline)
+    
+    def get_table_stats(self):
+        """获取各表流水线的统计"""
+        return {table_name: dict(stats) for table_name, stats in self.table_stats.items()}
+    
+    def _new_table_stats(self):
+        return {
+            "cycles": 0,
+            "scanned": 0,
+            "sent": 0,
+            "summarized": 0,
+            "failed": 0,
+            "last_cycle_at": None,
+            "last_duration": None,
+            "last_error": None
+        }
+    
+    def _claim_records(self, table_name, keys):
+        """认领待发送记录，keys 为 (record_id, verdict) 列表，返回本实例认领成功的集合
+        
+        认领是 email_send_claims 上的单条 INSERT ... ON CONFLICT，并发的扫描、推送接入和其他实例中只有一方成功；
+        数据库不可用时不认领（不发送），留待下一轮。
+        """
+        if not keys:
+            return set()
+        rows = db.execute_prepared(SEND_CLAIM_INSERT, (
+            table_name, self.instance_id,
+            [record_id for record_id, _ in keys], [verdict for _, verdict in keys],
+            table_name, SEND_CLAIM_TIMEOUT
+        ))
+        if rows is None:
+            return set()
+        return {(row['record_id'], row['verdict']) for row in rows}
+    
+    def _update_claims(self, statement, records):
+        """释放认领或更新认领状态（statement 为 SEND_CLAIM_* 语句），records 为 (表名, 记录ID, 审计结果) 列表"""
+        by_table = {}
+        for table_name, record_id, verdict in records:
+            by_table.setdefault(table_name, []).append((record_id, verdict))
+        for table_name, keys in by_table.items():
+            db.execute_prepared(statement, (table_name, self.instance_id,
+                                            [record_id for record_id, _ in keys], [verdict for _, verdict in keys]))
     
     def _log_sent_email(self, table_name, record_id, verdict, recipients):
         """记录已发送的邮件"""
-        query = """
-        INSERT INTO email_sent_log (table_name, record_id, verdict, recipients)
-        VALUES (%s, %s, %s, %s)
+        self._log_sent_records([(table_name, record_id, verdict)], recipients)
+    
+    def _log_sent_emails(self, table_name, records, recipients):
+        """批量记录已发送的邮件（汇总邮件），records 为 (record_id, verdict) 列表"""
+        self._log_sent_records([(table_name, record_id, verdict) for record_id, verdict in records], recipients)
+    
+    def _log_sent_records(self, records, recipients):
+        """写入 email_sent_log，数据库不可用时写入本地暂存，恢复后补写（避免下一轮重复发送）"""
+        if self._write_sent_log(records, recipients):
+            return
+        if self.spool:
+            logger.warning(f"发送记录写入失败，{len(records)} 条已暂存到本地，数据库恢复后补写")
+            self.spool.add_sent_log(records, recipients)
+        else:
+            logger.error(f"发送记录写入失败，{len(records)} 条记录可能在下一轮重复发送")
+    
+    def _write_sent_log(self, records, recipients):
+        """写入 email_sent_log 并删除对应的发送认领，records 为 (表名, 记录ID, 审计结果) 列表，返回是否成功
+        
+        单条时直接执行预编译语句；多条时复用同一语句以管道模式一次往返发送并在同一事务内提交。
         """
         recipients_str = ', '.join(recipients)
-        db.execute_query(query, (table_name, record_id, verdict, recipients_str))
-    
-    def run_check(self):
-        """执行检查"""
-        # 重新加载配置（每5分钟）
-        if (not self.last_config_update or 
-            (datetime.now() - self.last_config_update).total_seconds() > 300):
-            if not self.load_config():
-                logger.error("配置加载失败，跳过本次检查")
-                return
+        if len(records) == 1:
+            return db.execute_prepared(SENT_LOG_INSERT, (*records[0], recipients_str)) is not None
+        return db.execute_pipeline([(SENT_LOG_INSERT, (*record, recipients_str)) for record in records]) is not None
+    
+    def _spool_message(self, email_service, recipients, records, partial=False):
+        """暂存发送失败的已渲染邮件，SMTP恢复后按顺序补发
+        
+        只补发给本次未被服务器接受、且未被永久拒收的收件人；partial 为 True 表示邮件已发给部分收件人，
+        没有需要补发的地址时不暂存。补发成功后为这些地址再写一条 email_sent_log。
+        
+        完全失败时同步更新发送认领：进入暂存的标记为已暂存（其他实例不再认领），未启用暂存的释放认领由下一轮扫描重试；
+        所有收件人被永久拒收时保留认领，超过 SEND_CLAIM_TIMEOUT 后才会被重新认领。
+        """
+        undelivered = email_service.undelivered(recipients)
+        if not undelivered:
+            if not partial:
+                logger.error(f"邮件发送失败且所有收件人均被永久拒收，不再补发: {email_service.last_refused}")
+            return
+        if self.spool and email_service.last_rendered:
+            subject, content = email_service.last_rendered
+            self.spool.add_message(subject, content, undelivered, records, partial)
+            if partial:
+                logger.warning(f"{len(undelivered)} 个收件人被临时拒收，已暂存到本地待补发: {subject}")
+            else:
+                logger.warning(f"邮件发送失败，已暂存到本地待补发: {subject}")
+                self._update_claims(SEND_CLAIM_SPOOLED, records)
+        elif partial:
+            logger.error(f"{len(undelivered)} 个收件人被临时拒收且未启用本地暂存，未能送达: {undelivered}")
+        else:
+            self._update_claims(SEND_CLAIM_RELEASE, records)
+    
+    def replay_spool(self):
+        """按顺序补发暂存的邮件、补写暂存的发送记录
+        
+        监控或邮件发送已关闭时不补发邮件（与轮询扫描一致），只补写发送记录；
+        补发被拒的邮件按退避重试，多次被拒后移入死信，不阻塞后面的邮件。
+        """
+        if not self.spool or not self.spool.size():
+            return
+        if not self.refresh_config():
+            return
+        deliver = self.is_monitor_enabled() and self.is_email_enabled() and bool(self.smtp_config)
+        email_service = EmailService(self.smtp_config) if deliver else None
+        result = self.spool.replay(
+            email_service.send_rendered if deliver else None, self._write_sent_log,
+            unavailable=lambda: email_service.last_failure == 'unavailable', deliver=deliver,
+            dead_letter=lambda records: self._update_claims(SEND_CLAIM_DEAD, records),
+            sent=self._record_replayed
+        )
+        self.alert_stats.flush()
+        if any(result.values()):
+            logger.info(f"本地暂存补发邮件 {result['messages']} 封，补写发送记录 {result['sent_logs']} 批，"
+                        f"延后重试 {result['deferred']} 封，移入死信 {result['dead_letters']} 封，"
+                        f"剩余 {self.spool.size()} 条")
+    
+    def _record_replayed(self, records):
+        """首次发送完全失败的邮件补发成功后计入发送统计（失败时已计入 failed），多条记录的汇总邮件计入 summarized"""
+        outcome = 'summarized' if len(records) > 1 else 'sent'
+        for table_name, _, verdict in records:
+            self.alert_stats.record(table_name, verdict, outcome)
+    
+    def run_check(self, deadline=None):
+        """依次执行所有表的检查（单次检查用），deadline 为本轮时长上限（time.monotonic() 时间）"""
+        if not self.refresh_config():
+            logger.error("配置加载失败，跳过本次检查")
+            return
         
         if not self.is_monitor_enabled():
             logger.info("监控功能已禁用")
             return
         
         logger.info("开始执行审计结果检查...")
-        self.check_audit_results()
-        self.check_image_audit_results()
-        logger.info("审计结果检查完成")
\ No newline at end of file
+        for table_name in TABLE_PIPELINES:
+            if self._stop_event.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                break
+            self.check_table(table_name, deadline)
+        logger.info("审计结果检查完成")
@@ -0,0 +1,276 @@
+"""
+按需性能分析 - 对接下来 N 轮表检查采集 cProfile（CPU）、tracemalloc（内存分配）和分阶段耗时，结果写入 PROFILE_DIR
+
+未开启分析时不安装任何计时钩子，检查流程只多一次属性判断；开启后钩子只对正在被分析的线程计时，
+其他线程直接透传。cProfile 同一时间只分析一轮检查（各表并发检查时其余轮次照常执行，顺延到下一轮）。
+"""
+
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config.settings import PROFILE_DIR, PROFILE_TOP_N
+
+logger = logging.getLogger(__name__)
+
+# 分阶段计时的方法：(阶段名, 方法名)；各阶段按独占时间统计，嵌套阶段的耗时不计入外层
+MONITOR_STAGES = [('scan', '_fetch_page'), ('log_write', '_write_sent_log')]
+EMAIL_STAGES = [
+    ('render', 'send_audit_alert'), ('render', 'send_image_alert'),
+    ('render', 'send_summary_alert'), ('render', 'send_rendered'),
+    ('smtp_connect', '_connect'), ('send', '_deliver')
+]
+
+class _CycleTimer:
+    """单轮检查的分阶段计时（只在执行该轮检查的线程中使用）"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.stages = {}
+        self._stack = []
+        self._mark = None
+
+    def _account(self, now):
+        if self._stack:
+            stage = self.stages.setdefault(self._stack[-1], {"calls": 0, "seconds": 0.0})
+            stage["seconds"] += now - self._mark
+        self._mark = now
+
+    def enter(self, stage):
+        self._account(time.perf_counter())
+        self._stack.append(stage)
+
+    def exit(self, stage):
+        self._account(time.perf_counter())
+        self._stack.pop()
+        self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0})["calls"] += 1
+
+class CycleProfiler:
+    """分析接下来 cycles 轮检查，完成后写入 <request_id>-<pid>.json（报告）和 .prof（合并的 cProfile 数据）"""
+
+    def __init__(self, request_id: str, cycles: int, monitor_service=None, directory: str = PROFILE_DIR):
+        self.request_id = request_id
+        self.cycles = cycles
+        self.directory = directory
+        self.monitor_service = monitor_service
+        self.results = []
+        self.started_at = datetime.now()
+        self.path = None
+        self._stats = None
+        self.error = None
+        self._claimed = 0
+        self._failures = 0
+        self._active = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if monitor_service is not None:
+            self._install(monitor_service, MONITOR_STAGES)
+
+    @property
+    def done(self) -> bool:
+        return self.path is not None or self._closed
+
+    def close(self, error: Optional[str] = None):
+        """结束分析并卸载计时钩子（写入结果、被新的请求替换或处理失败时调用），之后的检查不再分析"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if error:
+                self.error = error
+        if self.monitor_service is not None:
+            self._uninstall(self.monitor_service, MONITOR_STAGES)
+
+    def _timed(self, stage, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = getattr(self._local, 'timer', None)
+            if timer is None:
+                return func(*args, **kwargs)
+            timer.enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.exit(stage)
+        return wrapper
+
+    def _install(self, obj, stages):
+        """在实例上覆盖对应方法（不修改类），分析结束后删除即恢复原方法"""
+        for stage, name in stages:
+            setattr(obj, name, self._timed(stage, getattr(obj, name)))
+
+    def _uninstall(self, obj, stages):
+        for _, name in stages:
+            obj.__dict__.pop(name, None)
+
+    def instrument(self, email_service):
+        """为本轮检查使用的 EmailService 安装计时钩子（仅当前线程正在被分析时）"""
+        if getattr(self._local, 'timer', None) is not None:
+            self._install(email_service, EMAIL_STAGES)
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self._closed or self._active or self._claimed >= self.cycles:
+                return False
+            self._active = True
+            self._claimed += 1
+            return True
+
+    @contextmanager
+    def cycle(self, table_name):
+        """分析一轮检查；已有其他轮次在分析或已达到轮数时直接执行"""
+        if not self._claim():
+            yield
+            return
+
+        timer = _CycleTimer(table_name)
+        self._local.timer = timer
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+            self._local.timer = None
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                self._finish_cycle(timer, profile, duration, snapshot,
+                                   traced_current - traced_before, traced_peak)
+            except Exception as e:
+                logger.error(f"性能分析结果处理失败: {e}")
+                # 未记录结果的轮次不计入（下一轮重新分析）；结果已齐但写入失败或连续失败时结束分析
+                with self._lock:
+                    self._active = False
+                    self._claimed = len(self.results)
+                    self._failures += 1
+                    failed = self._claimed >= self.cycles or self._failures >= self.cycles
+                if failed:
+                    self.close(f"{type(e).__name__}: {e}")
+
+    def _finish_cycle(self, timer, profile, duration, snapshot, traced_delta, traced_peak):
+        stages = {name: {"calls": stage["calls"], "seconds": round(stage["seconds"], 6)}
+                  for name, stage in timer.stages.items()}
+        stages["other"] = {"calls": 1, "seconds": round(max(0.0, duration - sum(
+            stage["seconds"] for stage in timer.stages.values())), 6)}
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        self.results.append({
+            "table_name": timer.table_name,
+            "finished_at": datetime.now().isoformat(),
+            "duration_seconds": round(duration, 6),
+            "stages": stages,
+            "memory": {
+                "traced_delta_kb": round(traced_delta / 1024, 1),
+                "traced_peak_kb": round(traced_peak / 1024, 1),
+                "top_allocations": [
+                    {"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                    for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]
+                ]
+            },
+            "cpu": self._format_stats(pstats.Stats(profile))
+        })
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+
+        with self._lock:
+            self._active = False
+            finished = len(self.results) >= self.cycles
+        if finished:
+            self._write()
+
+    def _format_stats(self, stats) -> List[str]:
+        """按累计耗时排序的前 PROFILE_TOP_N 个函数（pstats 文本格式）"""
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+        return [line for line in stream.getvalue().splitlines() if line.strip()]
+
+    def _write(self):
+        """卸载计时钩子并写入结果文件"""
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{self.request_id}-{os.getpid()}")
+        self._stats.dump_stats(base + '.prof')
+        report = {
+            "request_id": self.request_id,
+            "pid": os.getpid(),
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "cycles": self.results,
+            "stage_totals": self._stage_totals(),
+            "cpu_total": self._format_stats(self._stats),
+            "prof_file": os.path.basename(base + '.prof')
+        }
+        with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(base + '.json.tmp', base + '.json')
+        self.path = base + '.json'
+        logger.info(f"性能分析完成（{len(self.results)} 轮），结果已写入 {self.path}")
+
+    def _stage_totals(self) -> Dict[str, Dict[str, Any]]:
+        totals = {}
+        for result in self.results:
+            for name, stage in result["stages"].items():
+                total = totals.setdefault(name, {"calls": 0, "seconds": 0.0})
+                total["calls"] += stage["calls"]
+                total["seconds"] = round(total["seconds"] + stage["seconds"], 6)
+        return totals
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "cycles": self.cycles,
+            "completed": len(self.results),
+            "result_file": os.path.basename(self.path) if self.path else None,
+            "error": self.error
+        }
+
+def is_request_done(request_id: str, directory: str = PROFILE_DIR) -> bool:
+    """该分析请求是否已有结果文件（进程重启后不重复执行已完成的请求）"""
+    prefix = f"{request_id}-"
+    try:
+        return any(name.startswith(prefix) and name.endswith('.json') for name in os.listdir(directory))
+    except OSError:
+        return False
+
+def list_results(directory: str = PROFILE_DIR) -> List[Dict[str, Any]]:
+    """列出分析结果文件（按修改时间倒序）"""
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(('.json', '.prof'))]
+    except OSError:
+        return []
+    files = []
+    for name in names:
+        stat = os.stat(os.path.join(directory, name))
+        files.append({"name": name, "size": stat.st_size,
+                      "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat()})
+    return sorted(files, key=lambda item: item["modified_at"], reverse=True)
+
+def result_path(name: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """分析结果文件的路径，文件名不合法或不存在时返回 None"""
+    if os.path.basename(name) != name or not name.endswith(('.json', '.prof')):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
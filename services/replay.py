@@ -0,0 +1,175 @@
+"""
+历史回放 - 把一段时间内的历史审计记录（或录制文件）按原始时间间隔（可加速）送入渲染与发送流程，
+发往本地SMTP接收端，不读写 email_sent_log，输出吞吐、延迟分位数和内存占用，用于容量评估
+"""
+
+import heapq
+import json
+import time
+import threading
+import logging
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from database.connection import db
+from services.email_service import EmailService
+from services.monitor_service import TABLE_PIPELINES
+from config.settings import SCAN_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 报告中保留的发送异常条数
+ERROR_SAMPLES = 5
+
+def iter_table_records(table_name, start: datetime, end: datetime) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """按 (created_at, id) 升序键集分页读取单张表在时间范围内需要告警的记录"""
+    pipeline = TABLE_PIPELINES[table_name]
+    base_query = f"""
+    SELECT {', '.join(pipeline['fields'])} FROM {table_name}
+    WHERE {pipeline['verdict_field']} = ANY(%s) AND created_at >= %s AND created_at < %s
+    {{keyset}}
+    ORDER BY created_at, id
+    LIMIT %s
+    """
+    params = [list(pipeline['alert_verdicts']), start, end]
+    last_key = None
+    while True:
+        if last_key is None:
+            page = db.execute_query(base_query.format(keyset=''), (*params, SCAN_PAGE_SIZE))
+        else:
+            page = db.execute_query(base_query.format(keyset="AND (created_at, id) > (%s, %s)"),
+                                    (*params, *last_key, SCAN_PAGE_SIZE))
+        if not page:
+            return
+        for record in page:
+            yield table_name, record
+        if len(page) < SCAN_PAGE_SIZE:
+            return
+        last_key = (page[-1]['created_at'], page[-1]['id'])
+
+def iter_db_records(tables: List[str], start: datetime, end: datetime) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """多张表的记录按 created_at 归并为一条时间线"""
+    return heapq.merge(*(iter_table_records(table_name, start, end) for table_name in tables),
+                       key=lambda item: item[1]['created_at'])
+
+def iter_file_records(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """读取录制文件（NDJSON，每行为一条记录并带 table_name 字段），需按 created_at 排序"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            table_name = record.pop('table_name')
+            if isinstance(record.get('created_at'), str):
+                record['created_at'] = datetime.fromisoformat(record['created_at'])
+            yield table_name, record
+
+def iter_with_recording(records, path: str):
+    """透传记录的同时写入录制文件，供之后离线回放"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for table_name, record in records:
+            f.write(json.dumps({'table_name': table_name, **record}, ensure_ascii=False, default=str) + '\n')
+            yield table_name, record
+
+def load_recipients(tables: List[str]) -> Dict[str, List[str]]:
+    """读取各表当前启用的收件人，回放时使用与线上相同的收件人数量"""
+    rows = db.execute_query("SELECT table_name, email FROM recipients_config WHERE is_active = true") or []
+    recipients = {table_name: [] for table_name in tables}
+    for row in rows:
+        if row['table_name'] in recipients:
+            recipients[row['table_name']].append(row['email'])
+    return recipients
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """最近秩法分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize_latencies(values: List[float]) -> Dict[str, Optional[float]]:
+    """延迟分布（毫秒）"""
+    values = sorted(values)
+    result = {f"p{p}": percentile(values, p) for p in (50, 90, 99)}
+    result["max"] = values[-1] if values else None
+    return {key: round(value * 1000, 2) if value is not None else None for key, value in result.items()}
+
+def run_replay(records, smtp_config: Dict[str, Any], recipients: Dict[str, List[str]],
+               speed: float = 0, workers: int = 1, limit: int = 0) -> Dict[str, Any]:
+    """回放记录并返回报告
+
+    speed 为回放倍速（按记录 created_at 的间隔等比缩短，0 表示不等待、尽快发送），
+    workers 为并发发送线程数，limit 为最多回放的记录数（0 表示不限制）。
+    已提交未完成的发送最多 workers * 2 个（speed=0 时读取记录的速度受发送速度限制，不会无限堆积），
+    发送线程中的异常计入 errors，并在报告中保留前几条。
+    """
+    process = psutil.Process()
+    rss_start = process.memory_info().rss
+    rss_peak = rss_start
+    send_latencies = []
+    lags = []
+    counts = {"records": 0, "sent": 0, "failed": 0, "skipped": 0, "errors": 0}
+    error_samples = []
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(max(1, workers) * 2)
+
+    def send(table_name, record, due):
+        pipeline = TABLE_PIPELINES[table_name]
+        email_service = EmailService(smtp_config)
+        started = time.monotonic()
+        ok = getattr(email_service, pipeline['send'])(tuple(record.get(field) for field in pipeline['fields']),
+                                                      recipients.get(table_name) or [])
+        finished = time.monotonic()
+        with lock:
+            send_latencies.append(finished - started)
+            lags.append(finished - due)
+            counts["sent" if ok else "failed"] += 1
+
+    def done(future):
+        in_flight.release()
+        error = future.exception()
+        if error is not None:
+            with lock:
+                counts["errors"] += 1
+                if len(error_samples) < ERROR_SAMPLES:
+                    error_samples.append(f"{type(error).__name__}: {error}")
+
+    wall_start = time.monotonic()
+    first_ts = None
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="replay") as executor:
+        for table_name, record in records:
+            if limit and counts["records"] >= limit:
+                break
+            if table_name not in TABLE_PIPELINES:
+                counts["skipped"] += 1
+                continue
+            counts["records"] += 1
+
+            # 按原始时间间隔（除以倍速）安排发送时间
+            due = time.monotonic()
+            if speed > 0 and record.get('created_at'):
+                first_ts = first_ts or record['created_at']
+                due = wall_start + (record['created_at'] - first_ts).total_seconds() / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            in_flight.acquire()
+            executor.submit(send, table_name, record, due).add_done_callback(done)
+            if counts["records"] % 100 == 0:
+                rss_peak = max(rss_peak, process.memory_info().rss)
+
+    duration = time.monotonic() - wall_start
+    rss_peak = max(rss_peak, process.memory_info().rss)
+    return {
+        **counts,
+        "duration_seconds": round(duration, 3),
+        "throughput_per_second": round(counts["sent"] / duration, 2) if duration > 0 else None,
+        "speed": speed,
+        "workers": workers,
+        "error_samples": error_samples,
+        "send_latency_ms": summarize_latencies(send_latencies),
+        "end_to_end_lag_ms": summarize_latencies(lags),
+        "rss_start_mb": round(rss_start / 1024 / 1024, 1),
+        "rss_peak_mb": round(rss_peak / 1024 / 1024, 1)
+    }
@@ -0,0 +1,127 @@
+"""
+资源使用历史 - 监控进程定期采样 CPU、内存（RSS）、线程数、打开的文件描述符和各表检查轮次，保存在固定大小的环形缓冲区中
+
+独立进程模式下每次采样后向 RESOURCE_HISTORY_FILE 追加一行JSON（NDJSON），文件行数超过缓冲区大小的两倍时
+重写为缓冲区内容，API进程读取该文件的最后 RESOURCE_HISTORY_SIZE 行；内嵌模式直接读取内存。
+每个采样点带有各表已完成的检查轮数与最近一轮耗时，内存增长和CPU峰值可以对应到具体的检查轮次。
+"""
+
+import json
+import os
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config.settings import RESOURCE_HISTORY_SIZE
+
+logger = logging.getLogger(__name__)
+
+class ResourceHistory:
+    def __init__(self, size: int = RESOURCE_HISTORY_SIZE, path: Optional[str] = None):
+        self.samples = deque(maxlen=size)
+        self.path = path
+        # 自上次重写以来文件中的行数，为 None 时下次写入先重写（丢弃上一个进程留下的历史）
+        self._file_lines = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    def sample(self, cycles: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """采样一次，cycles 为各表的 {cycles, last_duration}
+
+        cpu_percent 为距上次采样的平均CPU占用：首次调用只建立基准（psutil 首次调用恒为0），不记录采样点。
+        """
+        import psutil
+        if self._process is None:
+            self._process = psutil.Process()
+            self._process.cpu_percent(None)
+            return None
+
+        process = self._process
+        with process.oneshot():
+            sample = {
+                "ts": datetime.now().isoformat(timespec='seconds'),
+                "cpu_percent": process.cpu_percent(None),
+                "rss": process.memory_info().rss,
+                "threads": process.num_threads(),
+                "fds": process.num_fds() if hasattr(process, 'num_fds') else None,
+                "cycles": cycles or {}
+            }
+        with self._lock:
+            self.samples.append(sample)
+            if self.path:
+                self._write()
+        return sample
+
+    def _write(self):
+        """追加最新采样点；文件行数超过缓冲区大小的两倍时重写为缓冲区内容"""
+        try:
+            if self._file_lines is None or self._file_lines >= 2 * self.samples.maxlen:
+                self._compact()
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.samples[-1], separators=(',', ':')) + '\n')
+            self._file_lines += 1
+        except OSError as e:
+            logger.warning(f"资源使用历史写入失败: {e}")
+
+    def _compact(self):
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            for sample in self.samples:
+                f.write(json.dumps(sample, separators=(',', ':')) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+        self._file_lines = len(self.samples)
+
+    def get_samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.samples)
+
+def load_history(path: str, size: int = RESOURCE_HISTORY_SIZE) -> List[Dict[str, Any]]:
+    """读取监控进程写入的资源使用历史（最后 size 个采样点），文件不存在时返回空列表，跳过损坏的行"""
+    samples = deque(maxlen=size)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    # 写入中途的最后一行
+                    continue
+                if isinstance(sample, dict):
+                    samples.append(sample)
+    except OSError:
+        return []
+    return list(samples)
+
+def downsample(samples: List[Dict[str, Any]], points: int, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """按时间顺序把采样点均分为最多 points 个区间
+
+    每个区间：ts 为区间第一个采样点时间，cpu_percent 为平均值、cpu_percent_max 为最大值，
+    rss/threads/fds 为最大值，cycles 为区间最后一个采样点的值（轮数单调递增），samples 为区间内的采样点数。
+    采样时间为本地时间（不带时区），带时区的 since（如 2024-01-01T02:00:00Z）先换算为本地时间再比较。
+    """
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone().replace(tzinfo=None)
+    if since is not None:
+        samples = [sample for sample in samples if datetime.fromisoformat(sample["ts"]) >= since]
+    if not samples:
+        return []
+    points = max(1, points)
+    size = -(-len(samples) // points)
+
+    result = []
+    for start in range(0, len(samples), size):
+        bucket = samples[start:start + size]
+        cpu = [sample["cpu_percent"] for sample in bucket]
+        fds = [sample["fds"] for sample in bucket if sample.get("fds") is not None]
+        result.append({
+            "ts": bucket[0]["ts"],
+            "cpu_percent": round(sum(cpu) / len(cpu), 1),
+            "cpu_percent_max": max(cpu),
+            "rss": max(sample["rss"] for sample in bucket),
+            "threads": max(sample["threads"] for sample in bucket),
+            "fds": max(fds) if fds else None,
+            "cycles": bucket[-1].get("cycles", {}),
+            "samples": len(bucket)
+        })
+    return result
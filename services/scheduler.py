@@ -0,0 +1,186 @@
+"""
+监控调度器 - 按精确截止时间调度任务，支持防重叠、单轮时长上限和随机抖动
+"""
+
+import random
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Number = Union[int, float]
+
+class ScheduledJob:
+    def __init__(self, name: str, func: Callable, interval_getter: Callable[[], Number],
+                 jitter: Number = 0, max_duration: Optional[Union[Number, Callable[[], Number]]] = None):
+        self.name = name
+        self.func = func
+        self.interval_getter = interval_getter
+        self.jitter = jitter
+        self.max_duration = max_duration
+
+        # 调度状态（均为 time.monotonic() 时间）
+        self.slot = None          # 本次理论执行时间（不含抖动），用于避免累计漂移
+        self.next_run = None      # 实际执行时间（含抖动）
+        self.last_start = None
+        self.last_duration = None
+        self.thread = None
+
+        # 统计
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.failures = 0
+        self.last_started_at = None
+
+    def get_max_duration(self) -> Optional[float]:
+        """获取单轮执行时长上限（秒），为空表示不限制"""
+        value = self.max_duration() if callable(self.max_duration) else self.max_duration
+        return value or None
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+class MonitorScheduler:
+    def __init__(self):
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def add_job(self, name: str, func: Callable, interval_getter: Callable[[], Number],
+                jitter: Number = 0, max_duration=None, run_immediately: bool = False) -> ScheduledJob:
+        """注册任务，interval_getter 每次计算下一次执行时间时调用，支持热更新间隔"""
+        job = ScheduledJob(name, func, interval_getter, jitter, max_duration)
+        now = time.monotonic()
+        with self._lock:
+            job.slot = now if run_immediately else now + self._get_interval(job)
+            job.next_run = job.slot if run_immediately else job.slot + self._get_jitter(job)
+            self.jobs[name] = job
+        self._wakeup.set()
+        return job
+
+    def reschedule(self, name: str):
+        """间隔变更后按新间隔重新计算下一次执行时间"""
+        with self._lock:
+            job = self.jobs.get(name)
+            if not job:
+                return
+            base = job.last_start if job.last_start is not None else time.monotonic()
+            job.slot = max(base + self._get_interval(job), time.monotonic())
+            job.next_run = job.slot + self._get_jitter(job)
+        self._wakeup.set()
+
+    def run(self):
+        """调度主循环，休眠到最近的截止时间，直到 stop() 被调用"""
+        logger.info(f"调度器启动，任务: {list(self.jobs.keys())}")
+        while not self._stopped.is_set():
+            with self._lock:
+                now = time.monotonic()
+                for job in self.jobs.values():
+                    if job.next_run <= now:
+                        self._dispatch(job, now)
+                next_deadline = min((job.next_run for job in self.jobs.values()), default=None)
+
+            timeout = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+        logger.info("调度器已停止")
+
+    def request_stop(self):
+        """请求停止调度（只设置标志，可在信号处理函数中调用）"""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """停止调度并等待正在执行的任务结束，返回是否全部结束"""
+        self.request_stop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in list(self.jobs.values()):
+            if job.is_running():
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                job.thread.join(remaining)
+        return not self.has_running_jobs()
+
+    def is_stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    def has_running_jobs(self) -> bool:
+        """是否仍有任务在执行（停止后用于判断是否已排空）"""
+        return any(job.is_running() for job in list(self.jobs.values()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各任务的调度统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "interval_seconds": self._get_interval(job),
+                    "running": job.is_running(),
+                    "runs": job.runs,
+                    "skipped": job.skipped,
+                    "overruns": job.overruns,
+                    "failures": job.failures,
+                    "last_started_at": job.last_started_at,
+                    "last_duration": job.last_duration,
+                    "next_run_in": max(0.0, job.next_run - now) if job.next_run is not None else None
+                }
+                for name, job in self.jobs.items()
+            }
+
+    # ===================================
+    # 内部方法
+    # ===================================
+
+    def _dispatch(self, job: ScheduledJob, now: float):
+        """到期任务派发：上一次仍在执行时跳过（合并）本次，否则在新线程中执行"""
+        if job.is_running():
+            job.skipped += 1
+            max_duration = job.get_max_duration()
+            if max_duration and now - job.last_start > max_duration:
+                job.overruns += 1
+                logger.warning(f"任务 {job.name} 已执行 {now - job.last_start:.1f}秒，超过上限 {max_duration}秒")
+            logger.warning(f"任务 {job.name} 上一次执行尚未完成，跳过本次调度")
+        else:
+            job.last_start = now
+            job.last_started_at = datetime.now().isoformat()
+            job.thread = threading.Thread(target=self._execute, args=(job,),
+                                          name=f"scheduler-{job.name}", daemon=True)
+            job.thread.start()
+
+        # 按固定节拍计算下一个时间点，错过的节拍直接合并
+        interval = self._get_interval(job)
+        job.slot += interval
+        if job.slot <= now:
+            missed = int((now - job.slot) // interval) + 1
+            job.slot += missed * interval
+        job.next_run = job.slot + self._get_jitter(job)
+
+    def _execute(self, job: ScheduledJob):
+        start = time.monotonic()
+        try:
+            max_duration = job.get_max_duration()
+            if max_duration:
+                job.func(deadline=start + max_duration)
+            else:
+                job.func()
+        except Exception as e:
+            job.failures += 1
+            logger.error(f"任务 {job.name} 执行失败: {type(e).__name__}: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - start
+            self._wakeup.set()
+
+    def _get_interval(self, job: ScheduledJob) -> float:
+        try:
+            return max(float(job.interval_getter()), 0.1)
+        except Exception as e:
+            logger.error(f"获取任务 {job.name} 的执行间隔失败: {e}")
+            return 60.0
+
+    def _get_jitter(self, job: ScheduledJob) -> float:
+        return random.uniform(0, job.jitter) if job.jitter else 0.0
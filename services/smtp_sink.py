@@ -0,0 +1,106 @@
+"""
+本地SMTP接收端 - 回放/压测时接收邮件并直接丢弃，只统计封数与大小，可模拟服务商的处理延迟和单封收件人数限制
+"""
+
+import socketserver
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """实现回放所需的最小SMTP子集（EHLO/HELO、MAIL、RCPT、DATA、RSET、NOOP、QUIT）"""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        rcpt_count = 0
+        self._reply("220 smtp-sink ready")
+        for raw in self.rfile:
+            command = raw.strip().upper()
+            if command.startswith(b'EHLO'):
+                self._reply("250-smtp-sink")
+                self._reply("250 8BITMIME")
+            elif command.startswith((b'MAIL', b'RSET')):
+                rcpt_count = 0
+                self._reply("250 OK")
+            elif command.startswith((b'HELO', b'NOOP')):
+                self._reply("250 OK")
+            elif command.startswith(b'RCPT'):
+                if sink.max_recipients and rcpt_count >= sink.max_recipients:
+                    sink.add_rejected()
+                    self._reply("452 Too many recipients")
+                    continue
+                rcpt_count += 1
+                sink.add_recipient()
+                self._reply("250 OK")
+            elif command == b'DATA':
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(line)
+                if sink.delay:
+                    time.sleep(sink.delay)
+                sink.add_message(size)
+                rcpt_count = 0
+                self._reply("250 OK")
+            elif command == b'QUIT':
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SMTPSink:
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, max_recipients=0):
+        self.delay = delay
+        # 单封邮件最多接受的收件人数（0表示不限制），超出的 RCPT 以 452 临时拒收
+        self.max_recipients = max_recipients
+        self.messages = 0
+        self.recipients = 0
+        self.rejected = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def add_recipient(self):
+        with self._lock:
+            self.recipients += 1
+
+    def add_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def add_message(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        logger.info(f"本地SMTP接收端已启动: {self.address[0]}:{self.address[1]}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_stats(self):
+        with self._lock:
+            return {"messages": self.messages, "recipients": self.recipients, "rejected": self.rejected,
+                    "bytes": self.bytes}
@@ -0,0 +1,333 @@
+"""
+本地暂存 - 数据库或SMTP不可用时把已渲染的邮件和待写入的发送记录追加到本地分段日志，依赖恢复后按顺序补发/补写
+
+每个暂存目录由若干分段文件（<首条序号>.seg，每行一条JSON）和回放进度文件 cursor 组成：
+追加时按 SPOOL_FSYNC_INTERVAL 批量 fsync，回放成功后推进 cursor，已全部回放的分段文件被删除。
+补发时被拒的邮件移入 retry 按退避重试，超过 SPOOL_MAX_ATTEMPTS 次移入 dead_letter，不阻塞后续邮件；
+死信可按序号查看、重新入队补发或丢弃。
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from config.settings import (
+    SPOOL_SEGMENT_BYTES, SPOOL_FSYNC_INTERVAL, SPOOL_MAX_ATTEMPTS, SPOOL_RETRY_BACKOFF, SPOOL_RETRY_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+
+class Spool:
+    """分段追加日志，条目按序号顺序回放"""
+
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES, fsync_interval=SPOOL_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._last_fsync = 0
+        self.cursor = self._read_cursor()
+        self.next_seq = self._recover()
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """按首条序号排序的分段文件 [(首条序号, 路径), ...]"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name)))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _read_segment(self, path) -> Iterator[Dict[str, Any]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 崩溃时未写完的最后一行
+                    continue
+
+    def _recover(self):
+        """根据最后一个分段文件恢复下一条序号"""
+        segments = self._segments()
+        last_seq = self.cursor
+        if segments:
+            last_seq = max(last_seq, segments[-1][0] - 1)
+            for entry in self._read_segment(segments[-1][1]):
+                last_seq = max(last_seq, entry.get('seq', 0))
+        return last_seq + 1
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """追加一条记录，返回序号；距上次 fsync 超过 fsync_interval 时刷盘"""
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._roll()
+            seq = self.next_seq
+            self.next_seq += 1
+            self._file.write(json.dumps({**entry, 'seq': seq}, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+            self._dirty = True
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            return seq
+
+    def _roll(self):
+        if self._file is not None:
+            self._fsync()
+            self._file.close()
+        segments = self._segments()
+        # 重启后继续写入未写满的最后一个分段
+        if segments and os.path.getsize(segments[-1][1]) < self.segment_bytes and self._file is None:
+            path = segments[-1][1]
+        else:
+            path = os.path.join(self.directory, f"{self.next_seq:012d}{SEGMENT_SUFFIX}")
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _fsync(self):
+        if self._file is not None and self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def sync(self):
+        """立即刷盘"""
+        with self._lock:
+            self._fsync()
+
+    def pending(self) -> Iterator[Dict[str, Any]]:
+        """按顺序返回尚未回放的记录"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            segments = self._segments()
+        for first_seq, path in segments:
+            for entry in self._read_segment(path):
+                if entry.get('seq', 0) > self.cursor:
+                    yield entry
+
+    def commit(self, seq):
+        """标记 seq 及之前的记录已回放，删除已全部回放的分段文件"""
+        with self._lock:
+            self.cursor = seq
+            path = os.path.join(self.directory, CURSOR_FILE)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(str(seq))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+
+            segments = self._segments()
+            active = self._file.name if self._file is not None else None
+            for (first_seq, path), (next_first, _) in zip(segments, segments[1:]):
+                if next_first - 1 <= seq and path != active:
+                    os.remove(path)
+
+    def __len__(self):
+        return self.next_seq - 1 - self.cursor
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+
+class AlertSpool:
+    """告警暂存：messages 保存发送失败的已渲染邮件，sent_logs 保存写入失败的发送记录
+
+    records 为 (表名, 记录ID, 审计结果) 列表。暂存中的记录视为待处理，轮询扫描和推送接入都会跳过，避免重复发送。
+    补发被拒的邮件进入 retry（记录尝试次数和下次重试时间），多次被拒后进入 dead_letter，
+    死信中的记录不再视为待处理（认领标记为死信，不会被重新认领），需人工检查后重新入队或丢弃。
+    """
+
+    def __init__(self, directory):
+        self.messages = Spool(os.path.join(directory, 'messages'))
+        self.sent_logs = Spool(os.path.join(directory, 'sent_log'))
+        self.retry = Spool(os.path.join(directory, 'retry'))
+        self.dead_letter = Spool(os.path.join(directory, 'dead_letter'))
+        self._keys_lock = threading.Lock()
+        self._pending_keys = {}
+        for spool in (self.messages, self.sent_logs, self.retry):
+            for entry in spool.pending():
+                self._add_keys(entry['records'])
+        if self.size():
+            logger.warning(f"本地暂存中有 {len(self.messages) + len(self.retry)} 封待补发邮件、"
+                           f"{len(self.sent_logs)} 批待补写发送记录")
+        if len(self.dead_letter):
+            logger.error(f"本地暂存死信目录中有 {len(self.dead_letter)} 封多次补发被拒的邮件，需人工处理")
+
+    def _add_keys(self, records):
+        with self._keys_lock:
+            for record in records:
+                key = tuple(record)
+                self._pending_keys[key] = self._pending_keys.get(key, 0) + 1
+
+    def _remove_keys(self, records):
+        with self._keys_lock:
+            for record in records:
+                key = tuple(record)
+                if self._pending_keys.get(key, 0) <= 1:
+                    self._pending_keys.pop(key, None)
+                else:
+                    self._pending_keys[key] -= 1
+
+    def is_pending(self, table_name, record_id, verdict) -> bool:
+        return (table_name, record_id, verdict) in self._pending_keys
+
+    def add_message(self, subject, content, recipients, records, partial=False):
+        """暂存发送失败的已渲染邮件，partial 表示邮件已发给部分收件人（补发成功时不再计入发送统计）"""
+        self._add_keys(records)
+        entry = {'subject': subject, 'content': content,
+                 'recipients': list(recipients), 'records': [list(r) for r in records]}
+        if partial:
+            entry['partial'] = True
+        self.messages.append(entry)
+
+    def add_sent_log(self, records, recipients):
+        """暂存写入失败的发送记录（邮件已发出），立即刷盘"""
+        self._add_keys(records)
+        self.sent_logs.append({'recipients': list(recipients), 'records': [list(r) for r in records]})
+        self.sent_logs.sync()
+
+    def replay(self, send: Callable[[str, str, List[str]], bool],
+               write_sent_log: Callable[[List[Tuple], List[str]], bool],
+               unavailable: Callable[[], bool] = lambda: True,
+               deliver: bool = True,
+               dead_letter: Callable[[List[Tuple]], Any] = lambda records: None,
+               sent: Callable[[List[Tuple]], Any] = lambda records: None) -> Dict[str, int]:
+        """按顺序补发邮件、补写发送记录，返回本次处理数
+
+        send 失败时由 unavailable() 判断原因：SMTP不可用时停止补发（不计尝试次数），否则这封邮件被拒，
+        移入 retry 退避重试后继续补发后面的邮件。deliver 为 False 时（邮件发送或监控已关闭）只补写发送记录。
+        补写发送记录失败说明数据库未恢复，停止补写。邮件移入死信时以其记录调用 dead_letter（用于更新发送认领），
+        首次发送完全失败的邮件补发成功时以其记录调用 sent（用于发送统计）。
+        """
+        result = {"messages": 0, "sent_logs": 0, "deferred": 0, "dead_letters": 0}
+        if deliver:
+            self._replay_messages(send, write_sent_log, unavailable, dead_letter, sent, result)
+
+        for entry in self.sent_logs.pending():
+            records = [tuple(r) for r in entry['records']]
+            if not write_sent_log(records, entry['recipients']):
+                break
+            self.sent_logs.commit(entry['seq'])
+            self._remove_keys(records)
+            result["sent_logs"] += 1
+        return result
+
+    def _replay_messages(self, send, write_sent_log, unavailable, dead_letter, sent, result):
+        """先补发 retry 中已到重试时间的邮件，再按顺序补发 messages
+
+        retry 按移入顺序处理，遇到未到重试时间的邮件即停止（最长等待 SPOOL_RETRY_BACKOFF_MAX）。
+        """
+        now = time.time()
+        for spool in (self.retry, self.messages):
+            for entry in spool.pending():
+                if entry.get('retry_at', 0) > now:
+                    break
+                records = [tuple(r) for r in entry['records']]
+                if send(entry['subject'], entry['content'], entry['recipients']):
+                    if not write_sent_log(records, entry['recipients']):
+                        self.add_sent_log(records, entry['recipients'])
+                    spool.commit(entry['seq'])
+                    self._remove_keys(records)
+                    if not entry.get('partial'):
+                        sent(records)
+                    result["messages"] += 1
+                    continue
+                if unavailable():
+                    return
+                # 这封邮件本身被拒：移出当前队列，不阻塞后面的邮件；移入死信的记录不再视为待处理
+                if self._defer(entry):
+                    self._remove_keys(records)
+                    dead_letter(records)
+                    result["dead_letters"] += 1
+                else:
+                    result["deferred"] += 1
+                spool.commit(entry['seq'])
+
+    def _defer(self, entry) -> bool:
+        """记录一次补发被拒：未超过 SPOOL_MAX_ATTEMPTS 时按指数退避移入 retry，否则移入 dead_letter，返回是否进入死信"""
+        attempts = entry.get('attempts', 0) + 1
+        item = {'subject': entry['subject'], 'content': entry['content'], 'recipients': entry['recipients'],
+                'records': entry['records'], 'attempts': attempts, 'partial': entry.get('partial', False)}
+        if attempts >= SPOOL_MAX_ATTEMPTS:
+            self.dead_letter.append(item)
+            self.dead_letter.sync()
+            logger.error(f"暂存邮件补发 {attempts} 次均被拒，已移入死信目录: {entry['subject']}")
+            return True
+        delay = min(SPOOL_RETRY_BACKOFF * 2 ** (attempts - 1), SPOOL_RETRY_BACKOFF_MAX)
+        self.retry.append({**item, 'retry_at': time.time() + delay})
+        self.retry.sync()
+        logger.warning(f"暂存邮件补发被拒（第 {attempts} 次），{delay:.0f} 秒后重试: {entry['subject']}")
+        return False
+
+    def list_dead_letters(self, limit: int = 100) -> Dict[str, Any]:
+        """按序号列出死信（不含邮件正文）"""
+        return read_dead_letters(self.dead_letter, limit)
+
+    def requeue_dead_letters(self, up_to: Optional[int] = None) -> List[Tuple]:
+        """把序号不大于 up_to 的死信重新放入 messages（尝试次数清零），返回涉及的记录"""
+        records = []
+        entries = [entry for entry in self.dead_letter.pending() if up_to is None or entry['seq'] <= up_to]
+        for entry in entries:
+            entry_records = [tuple(r) for r in entry['records']]
+            self.add_message(entry['subject'], entry['content'], entry['recipients'], entry_records,
+                             entry.get('partial', False))
+            records.extend(entry_records)
+        if entries:
+            self.messages.sync()
+            self.dead_letter.commit(entries[-1]['seq'])
+            logger.info(f"{len(entries)} 封死信已重新入队补发")
+        return records
+
+    def drop_dead_letters(self, up_to: Optional[int] = None) -> List[Tuple]:
+        """丢弃序号不大于 up_to 的死信（这些记录不再告警），返回涉及的记录"""
+        entries = [entry for entry in self.dead_letter.pending() if up_to is None or entry['seq'] <= up_to]
+        if entries:
+            self.dead_letter.commit(entries[-1]['seq'])
+            logger.warning(f"已丢弃 {len(entries)} 封死信")
+        return [tuple(r) for entry in entries for r in entry['records']]
+
+    def sync(self):
+        self.messages.sync()
+        self.sent_logs.sync()
+
+    def close(self):
+        for spool in (self.messages, self.sent_logs, self.retry, self.dead_letter):
+            spool.close()
+
+    def size(self) -> int:
+        """待补发邮件数（含退避重试中的邮件）与待补写发送记录批数之和，不含死信"""
+        return len(self.messages) + len(self.retry) + len(self.sent_logs)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"messages": len(self.messages), "retry": len(self.retry), "dead_letter": len(self.dead_letter),
+                "sent_logs": len(self.sent_logs), "pending_records": len(self._pending_keys)}
+
+def read_dead_letters(dead_letter: Spool, limit: int = 100) -> Dict[str, Any]:
+    """按序号读取死信摘要（不含邮件正文），只读，可在监控进程之外调用"""
+    entries = []
+    for entry in dead_letter.pending():
+        if len(entries) >= limit:
+            break
+        entries.append({"seq": entry['seq'], "subject": entry['subject'], "recipients": entry['recipients'],
+                        "records": entry['records'], "attempts": entry.get('attempts', 0)})
+    return {"total": len(dead_letter), "entries": entries}
@@ -4,15 +4,21 @@
 """
 
 import os
-import time
-import signal
-import psutil
+import json
 import subprocess
+import threading
 import logging
 from datetime import datetime
 from typing import Optional, Dict, Any
 from database.connection import db
 from services.email_service import EmailService
+from services.delivery_queue import PriorityRules
+from services.log_index import search_logs
+from services.resource_history import load_history, downsample
+from config.settings import (
+    MIN_CHECK_INTERVAL_SECONDS, MAX_CHECK_INTERVAL_SECONDS, MONITOR_STOP_TIMEOUT,
+    MONITOR_DRAIN_TIMEOUT, MONITOR_MODE, LOG_FILE, RESOURCE_HISTORY_FILE, RESOURCE_SAMPLE_INTERVAL, SPOOL_DIR
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +26,21 @@ class UnifiedMonitorService:
     def __init__(self):
         self.pid_file = "monitor.pid"
         self.log_file = "monitor.log"
+        self.console_file = "monitor.out"
+        self.history_file = RESOURCE_HISTORY_FILE
+        # 监控进程的 psutil.Process 缓存（cpu_percent 按两次调用之间的间隔计算，需复用同一对象）
+        self._processes = {}
         self.monitor_script = "monitor.py"
+        # 进程模式下正在等待监控进程退出（最长 MONITOR_STOP_TIMEOUT 秒），期间拒绝启动和重复停止
+        self._stopping = False
+        self._lifecycle_lock = threading.Lock()
+        
+        # 内嵌模式下监控在API进程内运行，直接在内存中控制
+        self.mode = MONITOR_MODE
+        self.runner = None
+        if self.mode == 'embedded':
+            from services.monitor_runner import MonitorRunner
+            self.runner = MonitorRunner()
         
         # 配置缓存
         self.smtp_config = None
@@ -79,11 +99,16 @@ class UnifiedMonitorService:
         return self.system_config.get('email_enabled', 'false').lower() == 'true'
     
     def get_check_interval(self):
-        """获取检查间隔"""
+        """获取检查间隔（分钟），支持小数"""
         try:
-            return int(self.system_config.get('check_interval', '5'))
+            minutes = float(self.system_config.get('check_interval', '5'))
         except ValueError:
             return 5
+        return int(minutes) if minutes.is_integer() else minutes
+    
+    def is_valid_check_interval(self, minutes: float) -> bool:
+        """检查间隔是否在允许范围内（按秒校验，支持1分钟以下的间隔）"""
+        return MIN_CHECK_INTERVAL_SECONDS <= minutes * 60 <= MAX_CHECK_INTERVAL_SECONDS
     
     def set_monitor_enabled(self, enabled: bool):
         """设置监控启用状态"""
@@ -91,21 +116,105 @@ class UnifiedMonitorService:
         result = db.execute_query(query, (str(enabled).lower(), datetime.now()))
         return result is not None
     
-    def set_check_interval(self, minutes: int):
-        """设置检查间隔"""
-        if minutes < 1 or minutes > 60:
+    def set_check_interval(self, minutes: float):
+        """设置检查间隔，监控进程会在下一次配置热加载时自动重新调度，无需重启"""
+        if not self.is_valid_check_interval(minutes):
             return False
         
         query = "UPDATE system_config SET config_value = %s, updated_at = %s WHERE config_key = 'check_interval'"
-        result = db.execute_query(query, (str(minutes), datetime.now()))
+        result = db.execute_query(query, (f"{minutes:g}", datetime.now()))
+        if result is not None and self.runner and self.runner.is_running():
+            # 内嵌模式立即生效，无需等待配置热加载
+            self.runner.reload_interval()
         return result is not None
     
+    def get_priority_rules(self) -> list:
+        """获取告警优先级规则"""
+        try:
+            return json.loads(self.system_config.get('alert_priority_rules') or '[]')
+        except ValueError:
+            return []
+    
+    def set_priority_rules(self, rules: list):
+        """设置告警优先级规则，监控进程在下一次配置热加载时生效"""
+        PriorityRules.validate(rules)
+        query = """
+        INSERT INTO system_config (config_key, config_value, description)
+        VALUES ('alert_priority_rules', %s, '告警优先级规则（JSON数组），积压时低优先级记录改为汇总发送')
+        ON CONFLICT (config_key) DO UPDATE SET config_value = EXCLUDED.config_value, updated_at = %s
+        """
+        result = db.execute_query(query, (json.dumps(rules, ensure_ascii=False), datetime.now()))
+        if result is not None and self.runner and self.runner.is_running():
+            self.runner.reload_interval()
+        return result is not None
+    
+    def request_profile(self, cycles: int) -> Optional[str]:
+        """请求监控对接下来 cycles 轮检查做性能分析，返回请求ID（失败时为 None）
+        
+        请求写入 system_config 的 profile_request，监控进程在下一次配置热加载时开始分析，
+        结果文件写入 PROFILE_DIR，可通过 list_profiles/get_profile_path 下载。
+        """
+        request_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        query = """
+        INSERT INTO system_config (config_key, config_value, description)
+        VALUES ('profile_request', %s, '性能分析请求（JSON），监控对接下来N轮检查做性能分析')
+        ON CONFLICT (config_key) DO UPDATE SET config_value = EXCLUDED.config_value, updated_at = %s
+        """
+        value = json.dumps({"id": request_id, "cycles": cycles})
+        result = db.execute_query(query, (value, datetime.now()))
+        if result is None:
+            return None
+        if self.runner and self.runner.is_running():
+            self.runner.reload_interval()
+        return request_id
+    
+    def list_profiles(self) -> list:
+        """列出性能分析结果文件"""
+        from services.profiler import list_results
+        return list_results()
+    
+    def get_profile_path(self, name: str) -> Optional[str]:
+        """性能分析结果文件路径，不存在时为 None"""
+        from services.profiler import result_path
+        return result_path(name)
+    
+    def list_dead_letters(self, limit: int) -> Optional[Dict[str, Any]]:
+        """按序号列出本地暂存中的死信（只读，不含邮件正文），未启用本地暂存时为 None"""
+        if not SPOOL_DIR:
+            return None
+        from services.spool import Spool, read_dead_letters
+        return read_dead_letters(Spool(os.path.join(SPOOL_DIR, 'dead_letter')), limit)
+    
+    def request_spool_action(self, action: str, up_to: Optional[int]) -> Optional[str]:
+        """请求监控重新入队（requeue）或丢弃（drop）序号不大于 up_to 的死信，返回请求ID（失败时为 None）
+        
+        死信由监控进程独占写入，请求写入 system_config 的 spool_request，监控进程在下一次配置热加载时处理。
+        """
+        request_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        query = """
+        INSERT INTO system_config (config_key, config_value, description)
+        VALUES ('spool_request', %s, '死信处理请求（JSON），监控重新入队或丢弃本地暂存中的死信')
+        ON CONFLICT (config_key) DO UPDATE SET config_value = EXCLUDED.config_value, updated_at = %s
+        """
+        value = json.dumps({"id": request_id, "action": action, "up_to": up_to})
+        result = db.execute_query(query, (value, datetime.now()))
+        if result is None:
+            return None
+        if self.runner and self.runner.is_running():
+            self.runner.reload_interval()
+        return request_id
+    
     # ===================================
     # 进程管理部分
     # ===================================
     
     def start_process(self) -> Dict[str, Any]:
         """启动监控进程"""
+        if self.runner:
+            return self._start_embedded()
+        if self.is_stopping():
+            return self._stopping_result()
+        
         # 先检查是否已有monitor.py在运行
         existing_pids = self._get_all_monitor_pids()
         if existing_pids:
@@ -117,11 +226,14 @@ class UnifiedMonitorService:
             }
         
         try:
-            # 启动新的监控进程
+            # 启动新的监控进程，日志由监控进程写入 monitor.log（自动轮转），
+            # 标准输出仅保留异常崩溃等控制台输出
+            env = dict(os.environ, LOG_FILE=self.log_file, LOG_CONSOLE='false')
             process = subprocess.Popen(
                 ["python", self.monitor_script],
-                stdout=open(self.log_file, 'a'),
+                stdout=open(self.console_file, 'a'),
                 stderr=subprocess.STDOUT,
+                env=env,
                 preexec_fn=os.setsid if os.name != 'nt' else None
             )
             
@@ -147,8 +259,35 @@ class UnifiedMonitorService:
                 "status": "start_failed"
             }
 
+    def is_stopping(self) -> bool:
+        """是否正在等待监控停止（当前检查完成后退出）"""
+        if self.runner:
+            return self.runner.is_stopping()
+        return self._stopping
+
+    def _stopping_result(self) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "message": "监控正在停止，等待当前检查完成后才能再次启动或停止",
+            "status": "stopping"
+        }
+
     def stop_process(self) -> Dict[str, Any]:
-        """停止监控进程"""
+        """停止监控进程（进程模式下最长等待 MONITOR_STOP_TIMEOUT 秒，期间状态为 stopping）"""
+        if self.runner:
+            return self._stop_embedded()
+        with self._lifecycle_lock:
+            if self._stopping:
+                return self._stopping_result()
+            self._stopping = True
+        try:
+            return self._stop_processes()
+        finally:
+            self._stopping = False
+
+    def _stop_processes(self) -> Dict[str, Any]:
+        import psutil
+        
         # 获取所有monitor.py进程
         all_pids = self._get_all_monitor_pids()
         
@@ -163,42 +302,34 @@ class UnifiedMonitorService:
         failed_pids = []
         
         try:
-            # 方法1: 使用pkill命令（最直接）
-            try:
-                result = subprocess.run(['pkill', '-f', 'monitor.py'], 
-                                    capture_output=True, timeout=5)
-                if result.returncode == 0:
-                    logger.info("使用 pkill 成功停止 monitor.py 进程")
-                time.sleep(2)  # 等待进程完全停止
-            except Exception as e:
-                logger.warning(f"pkill 执行失败: {e}")
-            
-            # 方法2: 逐个停止剩余进程
-            remaining_pids = self._get_all_monitor_pids()
-            for pid in remaining_pids:
+            # 发送SIGTERM，监控进程收到后完成当前邮件发送与记录写入再退出
+            processes = []
+            for pid in all_pids:
                 try:
-                    # 优雅停止
-                    os.kill(pid, signal.SIGTERM)
-                    
-                    # 等待进程结束
-                    for _ in range(5):
-                        if not psutil.pid_exists(pid):
-                            stopped_pids.append(pid)
-                            break
-                        time.sleep(1)
-                    else:
-                        # 强制停止
-                        if psutil.pid_exists(pid):
-                            os.kill(pid, signal.SIGKILL)
-                            stopped_pids.append(pid)
-                            logger.warning(f"强制终止进程 PID: {pid}")
-                    
-                except ProcessLookupError:
+                    process = psutil.Process(pid)
+                    process.terminate()
+                    processes.append(process)
+                except psutil.NoSuchProcess:
                     stopped_pids.append(pid)  # 进程已不存在
                 except Exception as e:
                     logger.error(f"停止进程 {pid} 失败: {e}")
                     failed_pids.append(pid)
             
+            # 等待进程退出（进程退出即返回，而不是固定休眠）
+            gone, alive = psutil.wait_procs(processes, timeout=MONITOR_STOP_TIMEOUT)
+            stopped_pids.extend(process.pid for process in gone)
+            
+            # 超时仍未退出的进程强制停止
+            for process in alive:
+                try:
+                    process.kill()
+                    logger.warning(f"进程 {process.pid} 在{MONITOR_STOP_TIMEOUT}秒内未退出，强制终止")
+                except psutil.NoSuchProcess:
+                    pass
+            gone, alive = psutil.wait_procs(alive, timeout=1)
+            stopped_pids.extend(process.pid for process in gone)
+            failed_pids.extend(process.pid for process in alive)
+            
             # 清理PID文件
             if os.path.exists(self.pid_file):
                 os.remove(self.pid_file)
@@ -238,23 +369,9 @@ class UnifiedMonitorService:
         """重启监控进程"""
         logger.info("开始重启监控进程...")
         
-        # 先停止所有进程
+        # 先停止所有进程（等待进程实际退出后返回）
         stop_result = self.stop_process()
         
-        # 等待确保进程完全停止
-        time.sleep(3)
-        
-        # 再次检查是否还有残留进程
-        remaining_pids = self._get_all_monitor_pids()
-        if remaining_pids:
-            logger.warning(f"发现残留进程: {remaining_pids}，尝试强制清理")
-            for pid in remaining_pids:
-                try:
-                    os.kill(pid, signal.SIGKILL)
-                except:
-                    pass
-            time.sleep(2)
-        
         # 启动新进程
         start_result = self.start_process()
         
@@ -269,13 +386,16 @@ class UnifiedMonitorService:
         }
 
     def _get_all_monitor_pids(self) -> list:
-        """获取所有monitor.py进程的PID"""
+        """获取所有monitor.py监控进程的PID（不含 monitor.py replay 历史回放进程）"""
+        # psutil 只在进程模式下管理监控进程时使用，首次使用时才导入
+        import psutil
         pids = []
         try:
             for proc in psutil.process_iter(['pid', 'cmdline']):
                 try:
-                    cmdline = proc.info['cmdline']
-                    if cmdline and any('monitor.py' in cmd for cmd in cmdline):
+                    cmdline = proc.info['cmdline'] or []
+                    script = next((i for i, cmd in enumerate(cmdline) if cmd.endswith('monitor.py')), None)
+                    if script is not None and 'replay' not in cmdline[script + 1:]:
                         pids.append(proc.info['pid'])
                 except (psutil.NoSuchProcess, psutil.AccessDenied):
                     continue
@@ -286,16 +406,28 @@ class UnifiedMonitorService:
 
     def is_process_running(self) -> bool:
         """检查监控进程是否正在运行"""
+        if self.runner:
+            return self.runner.is_running()
         return len(self._get_all_monitor_pids()) > 0
 
     def get_process_status(self) -> Dict[str, Any]:
         """获取监控进程状态"""
+        if self.runner:
+            status_info = self.runner.get_status()
+            status_info.update({
+                "mode": self.mode,
+                "pids": [os.getpid()] if status_info["is_running"] else [],
+                "check_time": datetime.now().isoformat()
+            })
+            return status_info
+        
+        import psutil
         all_pids = self._get_all_monitor_pids()
         
         status_info = {
             "is_running": len(all_pids) > 0,
             "pids": all_pids,
-            "status": "running" if all_pids else "stopped",
+            "status": ("stopping" if self._stopping else "running") if all_pids else "stopped",
             "check_time": datetime.now().isoformat()
         }
         
@@ -303,16 +435,23 @@ class UnifiedMonitorService:
             try:
                 # 获取第一个进程的详细信息
                 main_pid = all_pids[0]
-                process = psutil.Process(main_pid)
+                process, cpu_percent = self._sample_cpu(main_pid)
+                start_time = datetime.fromtimestamp(process.create_time())
+                # 优先使用监控进程自身按采样间隔统计的CPU占用
+                history = [sample for sample in load_history(self.history_file)
+                           if datetime.fromisoformat(sample["ts"]) >= start_time]
+                if history:
+                    cpu_percent = history[-1]["cpu_percent"]
                 status_info.update({
                     "main_pid": main_pid,
-                    "start_time": datetime.fromtimestamp(process.create_time()).isoformat(),
-                    "cpu_percent": process.cpu_percent(),
+                    "start_time": start_time.isoformat(),
+                    "cpu_percent": cpu_percent,
                     "memory_info": {
                         "rss": process.memory_info().rss,
                         "vms": process.memory_info().vms
                     },
-                    "num_threads": process.num_threads()
+                    "num_threads": process.num_threads(),
+                    "resources": history[-1] if history else None
                 })
             except psutil.NoSuchProcess:
                 status_info.update({
@@ -323,6 +462,81 @@ class UnifiedMonitorService:
         
         return status_info
     
+    def _sample_cpu(self, pid):
+        """返回 (psutil.Process, 距上次查询的CPU占用)；首次查询该进程时只建立基准，CPU占用为 None"""
+        import psutil
+        process = self._processes.get(pid)
+        if process is not None and process.is_running():
+            return process, process.cpu_percent(None)
+        process = psutil.Process(pid)
+        process.cpu_percent(None)
+        self._processes = {pid: process}
+        return process, None
+    
+    def get_status_history(self, points: int, since: Optional[datetime] = None) -> Dict[str, Any]:
+        """获取监控进程的资源使用历史，按时间均分降采样为最多 points 个点"""
+        samples = self.runner.history.get_samples() if self.runner else load_history(self.history_file)
+        return {
+            "sample_interval_seconds": RESOURCE_SAMPLE_INTERVAL,
+            "total_samples": len(samples),
+            "samples": downsample(samples, points, since)
+        }
+    
+    def _start_embedded(self) -> Dict[str, Any]:
+        """内嵌模式：在API进程内启动监控后台任务"""
+        if self.runner.is_stopping():
+            return {
+                "success": False,
+                "message": "上一次停止的检查仍在执行，完成后才能启动",
+                "status": "stopping"
+            }
+        if self.runner.is_running():
+            return {
+                "success": False,
+                "message": "内嵌监控已在运行中",
+                "status": "already_running"
+            }
+        
+        if not self.runner.start():
+            return {
+                "success": False,
+                "message": "启动失败: 配置加载失败",
+                "status": "start_failed"
+            }
+        
+        logger.info("内嵌监控启动成功")
+        return {
+            "success": True,
+            "message": "内嵌监控启动成功",
+            "pid": os.getpid(),
+            "status": "started",
+            "start_time": datetime.now().isoformat()
+        }
+
+    def _stop_embedded(self) -> Dict[str, Any]:
+        """内嵌模式：停止监控后台任务并等待当前检查完成"""
+        if not self.runner.is_running():
+            return {
+                "success": False,
+                "message": "内嵌监控未运行",
+                "status": "not_running"
+            }
+        
+        if not self.runner.stop(MONITOR_DRAIN_TIMEOUT):
+            return {
+                "success": False,
+                "message": f"当前检查在{MONITOR_DRAIN_TIMEOUT}秒内未完成",
+                "status": "partial_stopped"
+            }
+        
+        logger.info("内嵌监控停止成功")
+        return {
+            "success": True,
+            "message": "内嵌监控停止成功",
+            "status": "stopped",
+            "stop_time": datetime.now().isoformat()
+        }
+    
     def get_logs(self, lines: int = 50) -> Dict[str, Any]:
         """获取监控日志"""
         if not os.path.exists(self.log_file):
@@ -352,12 +566,36 @@ class UnifiedMonitorService:
                 "logs": []
             }
     
+    def search_logs(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    level: Optional[str] = None, keyword: Optional[str] = None,
+                    limit: int = 500) -> Dict[str, Any]:
+        """按时间范围、级别、关键字检索监控日志及其归档，通过时间索引直接定位"""
+        base_paths = list(dict.fromkeys([self.log_file, LOG_FILE]))
+        try:
+            results = search_logs(base_paths, start, end, level, keyword, limit)
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"检索日志失败: {str(e)}",
+                "logs": []
+            }
+        return {
+            "success": True,
+            "message": f"检索到{len(results)}条日志",
+            "returned_lines": len(results),
+            "logs": results
+        }
+    
     # ===================================
     # 统一控制接口
     # ===================================
     
     def start_monitor(self) -> Dict[str, Any]:
         """启动监控（配置+进程）"""
+        # 正在停止的监控进程即将退出，不能当作已在运行
+        if self.is_stopping():
+            return self._stopping_result()
+        
         # 1. 启用监控配置
         if not self.set_monitor_enabled(True):
             return {
@@ -428,6 +666,7 @@ class UnifiedMonitorService:
                 "email_enabled": email_enabled,
                 "check_interval": check_interval
             },
+            "mode": self.mode,
             "process": process_status,
             "overall_status": "running" if config_enabled and process_status["is_running"] else "stopped",
             "smtp_configured": self.smtp_config is not None,